@@ -0,0 +1,1553 @@
+"""Offline benchmarks for Alpha Voice Bot
+
+Runs against a local stub OpenRouter server, so no API key or network is needed.
+
+Usage:
+    python benchmark.py ttft [--runs N] [--tokens N] [--token-delay S]
+    python benchmark.py tts [--runs N] [--real]
+    python benchmark.py speech [--runs N] [--codecs wav,opus,mp3] [--chunk-ms 250,500,1000]
+    python benchmark.py client [--runs N]
+    python benchmark.py cache [--runs N]
+    python benchmark.py context [--sizes 10,100,1000]
+    python benchmark.py sessions [--sizes 1000,5000,20000] [--runs N]
+    python benchmark.py audio [--runs N] [--padding S] [--rtf R] [--bandwidth B]
+    python benchmark.py stt [--fixtures DIR] [--backends fake,sphinx,vosk,whisper]
+    python benchmark.py batch [--files N] [--workers N] [--llm-concurrency N]
+    python benchmark.py intents [--utterances N] [--sizes 21,200,2000]
+    python benchmark.py router [--turns N]
+    python benchmark.py load [--sessions N] [--turns N] [--threads N]
+    python benchmark.py speculation [--runs N] [--stable-ms MS]
+    python benchmark.py models [--runs N] [--slow-rate P] [--slow-delay S]
+    python benchmark.py api [--url URL] [--clients N] [--turns N] [--modes text,audio,stream]
+    python benchmark.py workers [--workers 1,2,4] [--clients N] [--turns N] [--rtf R]
+    python benchmark.py suite [--runs N] [--sizes 10,100,1000] [--fixtures DIR]
+
+Add --json PATH before the subcommand to also save the results (with the git commit) as JSON.
+"""
+import argparse
+import array
+import contextlib
+import asyncio
+import functools
+import gc
+import io
+import math
+import os
+import platform
+import random
+import tempfile
+import json
+import shutil
+import statistics
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+import voice_bot
+
+
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    """Serve chat completions like OpenRouter, streamed as SSE or in one JSON body"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests += 1
+        self.server.connections.add(self.client_address)
+
+        # Per-model behaviour: a fixed error status, or a first-token delay that is sometimes much longer
+        profile = self.server.models.get(body.get("model"), {})
+        self.server.model_requests[body.get("model")] = self.server.model_requests.get(body.get("model"), 0) + 1
+
+        # Injected upstream failures, e.g. 503 with Retry-After
+        if self.server.failures > 0 or profile.get("status"):
+            if not profile.get("status"):
+                self.server.failures -= 1
+            self.send_response(profile.get("status") or self.server.failure_status)
+            if self.server.retry_after is not None:
+                self.send_header("Retry-After", str(self.server.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        tokens = [f"{profile.get('prefix', 'word')}{i} " for i in range(self.server.tokens)]
+
+        # Time before the first token, like upstream queueing and prompt processing
+        first_token_delay = profile.get("first_token_delay", self.server.first_token_delay)
+        if random.random() < profile.get("slow_rate", 0):
+            first_token_delay = profile["slow_delay"]
+        time.sleep(first_token_delay)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.write_chunk(": OPENROUTER PROCESSING\n\n")
+            for token in tokens:
+                chunk = {"choices": [{"delta": {"content": token}}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(self.server.token_delay)
+            self.write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(self.server.token_delay * len(tokens))
+            payload = json.dumps({"choices": [{"message": {"content": "".join(tokens)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server that ignores clients dropping keep-alive connections"""
+    daemon_threads = True
+    request_queue_size = 1024  # Load runs open hundreds of connections at once
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class FakeOpenRouter:
+    """Run FakeOpenRouterHandler on a free local port in a background thread"""
+
+    def __init__(self, tokens=50, token_delay=0.02, first_token_delay=0.2):
+        self.server = QuietHTTPServer(("127.0.0.1", 0), FakeOpenRouterHandler)
+        self.server.tokens = tokens
+        self.server.token_delay = token_delay
+        self.server.first_token_delay = first_token_delay
+        self.server.requests = 0
+        self.server.connections = set()
+        self.server.models = {}
+        self.server.model_requests = {}
+        self.fail_next(0)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/v1/chat/completions"
+
+    def fail_next(self, count, status=503, retry_after=None):
+        """Answer the next `count` requests with an error status"""
+        self.server.failures = count
+        self.server.failure_status = status
+        self.server.retry_after = retry_after
+
+    def model(self, name, **profile):
+        """Make one model slow or failing: status=503, first_token_delay=S, slow_rate=P with slow_delay=S"""
+        self.server.models[name] = dict(profile, prefix=name.split("/")[-1].split(":")[0] + "-")
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        voice_bot.API_URL = self.url
+        # Measure the upstream path, not the reply cache
+        voice_bot.RESPONSE_CACHE_ENABLED = False
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Every summarize() call lands here, keyed by subcommand, for --json output
+results = {}
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, math.ceil(q * len(sorted_samples)) - 1))]
+
+
+def summarize(name, samples, elapsed=None, key=None):
+    """Print and record mean/p50/p95/p99/max of timings in milliseconds (plus throughput if elapsed is given)"""
+    ms = sorted(s * 1000 for s in samples)
+    stats = {"count": len(ms), "mean_ms": statistics.mean(ms), "p50_ms": percentile(ms, 0.50),
+             "p95_ms": percentile(ms, 0.95), "p99_ms": percentile(ms, 0.99), "max_ms": ms[-1]}
+    line = (f"   {name:<28} mean {stats['mean_ms']:9.3f}  p50 {stats['p50_ms']:9.3f}  "
+            f"p95 {stats['p95_ms']:9.3f}  p99 {stats['p99_ms']:9.3f}  max {stats['max_ms']:9.3f} ms")
+    if elapsed:
+        stats["throughput_per_s"] = len(ms) / elapsed
+        line += f"  {stats['throughput_per_s']:8.1f}/s"
+    print(line)
+    results.setdefault(summarize.section, {})[key or name.strip()] = stats
+
+
+summarize.section = "default"
+
+
+def record(name, **values):
+    """Record figures that are not latency samples (sizes, rates) for --json output"""
+    results.setdefault(summarize.section, {})[name] = values
+
+
+def bench_ttft(args):
+    """Compare time to first visible text: blocking query vs streamed reply"""
+    messages = [{"role": "user", "content": "Hello there"}]
+    blocking, first_token, streamed_total = [], [], []
+
+    with FakeOpenRouter(args.tokens, args.token_delay, args.first_token_delay):
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            voice_bot.query_openrouter(messages)
+            blocking.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for i, _delta in enumerate(voice_bot.stream_openrouter(messages)):
+                if i == 0:
+                    first_token.append(time.perf_counter() - started)
+            streamed_total.append(time.perf_counter() - started)
+
+    print(f"📊 Time to first text ({args.runs} runs, {args.tokens} tokens)")
+    summarize("blocking query_openrouter", blocking)
+    summarize("stream_openrouter TTFT", first_token)
+    summarize("stream_openrouter total", streamed_total)
+    print(f"   reported avg TTFT           {voice_bot.get_stream_metrics()['avg_ttft'] * 1000:8.1f} ms")
+
+
+def bench_client(args):
+    """Exercise the pooled OpenRouter client: keep-alive reuse, retries and the circuit breaker"""
+    messages = [{"role": "user", "content": "Hello there"}]
+    headers, data = voice_bot.build_payload(messages)
+
+    with FakeOpenRouter(tokens=5, token_delay=0, first_token_delay=0) as fake:
+        fresh, pooled = [], []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            voice_bot.requests.post(fake.url, headers=headers, data=json.dumps(data)).json()
+            fresh.append(time.perf_counter() - started)
+        fake.server.connections.clear()
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            voice_bot.query_openrouter(messages)
+            pooled.append(time.perf_counter() - started)
+        print(f"📊 OpenRouter client ({args.runs} requests each)")
+        summarize("new connection per request", fresh)
+        summarize("pooled session", pooled)
+        print(f"   pooled session used {len(fake.server.connections)} connection(s)")
+
+        fake.fail_next(2, status=503, retry_after=0.1)
+        served = fake.server.requests
+        started = time.perf_counter()
+        reply = voice_bot.query_openrouter(messages)
+        print(f"   503 x2 with Retry-After 0.1s: {fake.server.requests - served} attempts, "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms, recovered={reply.startswith('word')}")
+
+    # Upstream gone: the breaker opens and later turns skip the network entirely
+    voice_bot.openrouter_client = voice_bot.OpenRouterClient(max_retries=1)
+    down = []
+    for _ in range(voice_bot.BREAKER_THRESHOLD + 3):
+        started = time.perf_counter()
+        voice_bot.query_openrouter(messages)
+        down.append(time.perf_counter() - started)
+    print(f"   upstream down: breaker {voice_bot.model_pool.breakers[voice_bot.model_pool.models[0]].state}, "
+          f"first turn {down[0] * 1000:.0f} ms, turns after opening {max(down[-3:]) * 1000:.2f} ms max")
+
+
+SAMPLE_REPLY = (
+    "Sure, here is a quick overview. Voice assistants turn speech into text, "
+    "send it to a language model, and read the answer back to you. "
+    "The slowest part is usually waiting for the full reply! "
+    "Speaking each sentence as soon as it is ready hides most of that wait. "
+    "Longer answers benefit the most, because playback of one sentence overlaps "
+    "synthesis of the next. Let me know if you want more detail."
+)
+
+
+class FakeTTSEngine:
+    """pyttsx3 stand-in whose synthesis time and audio length grow with the text"""
+
+    def __init__(self, synth_per_char=0.002, speech_per_char=0.01, rate=8000):
+        self.synth_per_char = synth_per_char
+        self.speech_per_char = speech_per_char
+        self.rate = rate
+        self.pending = []
+
+    def setProperty(self, name, value):
+        pass
+
+    def save_to_file(self, text, path):
+        self.pending.append((text, path))
+
+    def runAndWait(self):
+        for text, path in self.pending:
+            time.sleep(len(text) * self.synth_per_char)
+            with wave.open(path, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.rate)
+                # A quiet tone rather than digital silence, so compressed codecs have something to encode
+                samples = int(self.rate * len(text) * self.speech_per_char)
+                tone = [int(3000 * math.sin(2 * math.pi * 220 * i / self.rate)) for i in range(self.rate // 220 * 10)]
+                pcm = array.array("h", (tone * (samples // len(tone) + 1))[:samples])
+                wav.writeframes(pcm.tobytes())
+        self.pending = []
+
+
+def fake_player(data, stop=None):
+    """Sleep for as long as the WAV clip would play, or until stopped"""
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        duration = wav.getnframes() / wav.getframerate()
+    if stop is not None:
+        stop.wait(duration)
+    else:
+        time.sleep(duration)
+
+
+def null_player(data, stop=None):
+    pass
+
+
+def stream_text(text, token_delay):
+    """Yield text word by word like a streamed LLM reply"""
+    for word in text.split(" "):
+        time.sleep(token_delay)
+        yield word + " "
+
+
+def bench_tts(args):
+    """Compare time-to-first-audio: whole-reply speak_text path vs sentence pipeline"""
+    if args.real:
+        engine_factory, player = voice_bot.pyttsx3.init, null_player
+    else:
+        engine_factory, player = FakeTTSEngine, fake_player
+
+    # Zero-sized audio cache so every run really synthesizes
+    worker = voice_bot.SpeechWorker(engine_factory=engine_factory, player=player,
+                                    cache=voice_bot.LRUCache(0))
+    whole_reply, pipelined = [], []
+    for _ in range(args.runs):
+        # Previous path: wait for the whole reply, synthesize it all, then play
+        started = time.perf_counter()
+        text = "".join(stream_text(SAMPLE_REPLY, args.token_delay))
+        clip = voice_bot.synthesize_wav(engine_factory(), text)
+        whole_reply.append(time.perf_counter() - started)
+        player(clip)
+
+        # Sentence pipeline fed straight from the token stream
+        pipeline = voice_bot.SpeechPipeline(worker=worker)
+        for delta in stream_text(SAMPLE_REPLY, args.token_delay):
+            pipeline.feed(delta)
+        pipeline.close()
+        pipeline.wait()
+        pipelined.append(pipeline.time_to_first_audio)
+
+    engine = "pyttsx3 save_to_file" if args.real else "fake engine"
+    print(f"📊 Time to first audio ({args.runs} runs, {engine}, "
+          f"{len(voice_bot.split_sentences(SAMPLE_REPLY))} sentences)")
+    summarize("whole-reply speak_text", whole_reply)
+    summarize("sentence pipeline", pipelined)
+    stats = worker.get_stats()
+    print(f"   speech worker: {stats['synthesized']} sentences, "
+          f"avg synthesis {stats['avg_synthesis_time'] * 1000:.1f} ms, queue depth {stats['queue_depth']}")
+
+
+def bench_speech(args):
+    """Browser speech streaming: time to first audio chunk and bytes per second of speech by codec and chunk size"""
+    voice_bot.speech_worker = voice_bot.SpeechWorker(engine_factory=lambda: FakeTTSEngine(rate=args.rate),
+                                                     player=null_player, cache=voice_bot.LRUCache(0))
+    # Stream-speech engines run in their own processes, so their factory has to pickle
+    engine_factory = functools.partial(FakeTTSEngine, rate=args.rate)
+    voice_bot.stream_speech_pool = voice_bot.StreamSpeechPool(engine_factory=engine_factory, cache=voice_bot.LRUCache(0))
+    voice_bot.stream_openrouter = lambda messages, *rest, **options: stream_text(SAMPLE_REPLY, args.token_delay)
+    handler = voice_bot.stream_speech(voice_bot.handle_input_stream)
+    print(f"📊 Browser speech stream ({args.runs} replies per row, {args.rate} Hz mono, "
+          f"{len(voice_bot.split_sentences(SAMPLE_REPLY))} sentences, token every {args.token_delay * 1000:.0f} ms, "
+          f"{args.bandwidth // 1000} KB/s link)")
+    for codec in args.codecs.split(","):
+        if codec != "wav" and not shutil.which("ffmpeg"):
+            print(f"   {codec:<28} skipped (needs ffmpeg)")
+            continue
+        for chunk_ms in (int(size) for size in args.chunk_ms.split(",")):
+            voice_bot.speech_encoder = voice_bot.SpeechEncoder(codec, chunk_ms)
+            before = voice_bot.get_speech_stream_metrics()
+            first_chunk, last_chunk = [], []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                first = None
+                for update in handler("Explain how voice assistants work", voice_bot.ChatHistory(), 0.7, 1.0, 150):
+                    if update[-1] is not None and first is None:
+                        # Plus the time the first chunk takes to reach the browser
+                        first = time.perf_counter() - started + len(update[-1]) / args.bandwidth
+                first_chunk.append(first)
+                last_chunk.append(time.perf_counter() - started)
+            after = voice_bot.get_speech_stream_metrics()
+            name = f"{codec} {chunk_ms} ms"
+            summarize(f"{name} first chunk in", first_chunk)
+            summarize(f"{name} last chunk", last_chunk)
+            sent = after["bytes"] - before["bytes"]
+            seconds = after["audio_seconds"] - before["audio_seconds"]
+            chunks = (after["chunks"] - before["chunks"]) / args.runs
+            encode_ms = (after["encode_time"] - before["encode_time"]) / args.runs * 1000
+            print(f"      {sent / seconds / 1024:.1f} KB per second of speech, {chunks:.0f} chunks per reply, "
+                  f"{encode_ms:.1f} ms encoding per reply")
+            record(f"{name} stream", bytes_per_second=sent / seconds, chunks_per_reply=chunks,
+                   encode_ms_per_reply=encode_ms)
+
+
+QUICK_ACTIONS = [
+    "Hello! How are you today?",
+    "Tell me a funny joke please!",
+    "What can you help me with? Show me your capabilities.",
+    "Tell me about yourself and your features.",
+]
+
+
+def bench_cache(args):
+    """Quick-action clicks with and without the reply and speech caches"""
+    worker = voice_bot.SpeechWorker(engine_factory=FakeTTSEngine, player=null_player)
+    with FakeOpenRouter(tokens=30, token_delay=0.005, first_token_delay=0.1):
+        results = {}
+        for enabled in (False, True):
+            voice_bot.RESPONSE_CACHE_ENABLED = enabled
+            voice_bot.response_cache.clear()
+            worker.cache = voice_bot.audio_cache if enabled else voice_bot.LRUCache(0)
+            voice_bot.audio_cache.clear()
+            turns = []
+            for i in range(args.runs):
+                prompt = QUICK_ACTIONS[i % len(QUICK_ACTIONS)]
+                started = time.perf_counter()
+                reply = voice_bot.query_openrouter([{"role": "user", "content": prompt}])
+                speech = voice_bot.SpeechPipeline(worker=worker, preempt=False)
+                speech.feed(reply)
+                speech.close()
+                speech.wait()
+                turns.append(time.perf_counter() - started)
+            results[enabled] = turns
+
+    print(f"📊 Quick-action turns ({args.runs} clicks over {len(QUICK_ACTIONS)} buttons, reply + speech)")
+    summarize("no cache", results[False])
+    summarize("reply + audio cache", results[True])
+    for name, stats in voice_bot.get_cache_stats().items():
+        print(f"   {name:<6} cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evictions, {stats['bytes']} bytes")
+
+
+def full_history_messages(user_input, chat_history):
+    """Previous message builder: the entire history on every turn"""
+    messages = [{"role": "system", "content": voice_bot.SYSTEM_PROMPT}]
+    for user_msg, assistant_msg in chat_history:
+        messages.append({"role": "user", "content": user_msg})
+        messages.append({"role": "assistant", "content": assistant_msg})
+    messages.append({"role": "user", "content": user_input})
+    return messages
+
+
+def synthetic_turn(i):
+    return (f"Question number {i}: could you explain topic {i} in a few words?",
+            f"Sure. Topic {i} is about something interesting. " * 4)
+
+
+def bench_context(args):
+    """Payload size and per-turn build time at growing history sizes"""
+    print("📊 Prompt build per turn (payload bytes / build time)")
+    print(f"   {'turns':>6}  {'full history':>22}  {'budgeted context':>22}")
+    for size in [int(n) for n in args.sizes.split(",")]:
+        plain = [synthetic_turn(i) for i in range(size)]
+        started = time.perf_counter()
+        full = full_history_messages("And next?", plain)
+        full_time = time.perf_counter() - started
+
+        # Replay the session turn by turn so the context counts incrementally
+        history = voice_bot.ChatHistory()
+        for i in range(size):
+            voice_bot.build_messages(synthetic_turn(i)[0], history)
+            history.append(synthetic_turn(i))
+        started = time.perf_counter()
+        budgeted = voice_bot.build_messages("And next?", history)
+        budgeted_time = time.perf_counter() - started
+
+        print(f"   {size:>6}  {len(json.dumps(full)):>9} B {full_time * 1e6:>8.0f} µs  "
+              f"{len(json.dumps(budgeted)):>9} B {budgeted_time * 1e6:>8.0f} µs")
+        record(f"{size} turns", full_bytes=len(json.dumps(full)), full_build_us=full_time * 1e6,
+               budgeted_bytes=len(json.dumps(budgeted)), budgeted_build_us=budgeted_time * 1e6)
+
+
+class FakeRecognizerBackend(voice_bot.RecognizerBackend):
+    """Deterministic backend that takes a fixed fraction of the audio duration"""
+    name = "fake"
+    offline = True
+
+    def __init__(self, real_time_factor=0.05):
+        self.real_time_factor = real_time_factor
+
+    def transcribe(self, audio):
+        duration = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        time.sleep(duration * self.real_time_factor)
+        return f"fake transcript of {duration:.1f} seconds"
+
+
+voice_bot.STT_BACKENDS.setdefault("fake", FakeRecognizerBackend)
+
+
+def write_tone_wav(path, seconds, rate=44100, channels=2, padding=0.0, noise=0):
+    """Write a speech-band tone with pauses, like a browser upload (44.1 kHz stereo)
+
+    `padding` seconds of room noise (peak amplitude `noise`) go before and after the tone.
+    """
+    rng = random.Random(3)
+    frames = bytearray()
+    total = int((seconds + 2 * padding) * rate)
+    for i in range(total):
+        t = i / rate - padding
+        level = 8000 if 0 <= t < seconds and int(t * 2) % 3 else 0  # Pauses between "words"
+        value = int(level * math.sin(2 * math.pi * 220 * t)) + (rng.randint(-noise, noise) if noise else 0)
+        frames += value.to_bytes(2, "little", signed=True) * channels
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+
+
+def wav_fixtures(directory):
+    """WAV fixtures from a directory, or a generated set of 1/3/6 second clips"""
+    if directory:
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.lower().endswith(".wav"))
+    generated = os.path.join(tempfile.gettempdir(), "alpha_voice_bot_fixtures")
+    os.makedirs(generated, exist_ok=True)
+    paths = []
+    for seconds in (1, 3, 6):
+        path = os.path.join(generated, f"tone_{seconds}s.wav")
+        if not os.path.exists(path):
+            write_tone_wav(path, seconds)
+        paths.append(path)
+    return paths
+
+
+class BusyRecognizerBackend(FakeRecognizerBackend):
+    """Fake backend that burns CPU instead of sleeping, like an offline model holding the GIL"""
+    name = "busy"
+
+    def transcribe(self, audio):
+        duration = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        # Per-thread CPU time, so transcriptions running side by side each burn their full share
+        deadline = time.thread_time() + duration * self.real_time_factor
+        while time.thread_time() < deadline:
+            pass
+        return f"fake transcript of {duration:.1f} seconds"
+
+
+def bench_batch(args):
+    """Batch transcription: one file at a time vs the process pool, and AI answers at growing concurrency"""
+    directory = tempfile.mkdtemp(prefix="alpha_voice_bot_batch_")
+    for i in range(args.files):
+        write_tone_wav(os.path.join(directory, f"note_{i:03d}.wav"), 1 + i % 3, padding=0.5, noise=100)
+    output = os.path.join(directory, "results.jsonl")
+    voice_bot.stt_backend = BusyRecognizerBackend(args.rtf)  # Inherited by forked workers
+    print(f"📊 Batch transcription ({args.files} files of 1-3 s, CPU-bound fake STT at {args.rtf} x real time, "
+          f"{os.cpu_count()} CPUs)")
+
+    started = time.perf_counter()
+    pipeline = voice_bot.AudioPipeline(verbose=False)
+    for path in voice_bot.batch_files(directory):
+        pipeline.process(path)
+    elapsed = time.perf_counter() - started
+    print(f"   {'one file at a time':<28} {args.files / elapsed:8.2f} files/s")
+    record("one file at a time", files_per_second=args.files / elapsed)
+
+    def batch(name, **options):
+        if os.path.exists(output):
+            os.remove(output)
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = voice_bot.run_batch(directory, output, **options)
+        stages = ", ".join(f"{stage} {stats['avg'] * 1000:.0f}" for stage, stats in report["stages"].items())
+        print(f"   {name:<28} {report['files_per_second']:8.2f} files/s   avg ms: {stages}")
+        record(name, files_per_second=report["files_per_second"], ok=report["ok"],
+               stages={stage: stats["avg"] for stage, stats in report["stages"].items()})
+
+    for workers in sorted({1, args.workers}):
+        batch(f"process pool, {workers} worker(s)", workers=workers)
+    with FakeOpenRouter(tokens=10, token_delay=0.005, first_token_delay=args.first_token_delay):
+        for concurrency in sorted({1, args.llm_concurrency}):
+            batch(f"+ AI answers, {concurrency} at once", llm=True, workers=args.workers, llm_concurrency=concurrency)
+
+    # Resume: a run cut short leaves a partial file; the next run only does the rest
+    with open(output, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(output, "w", encoding="utf-8") as f:
+        f.writelines(lines[:len(lines) // 2])
+        f.write(lines[len(lines) // 2][:20])  # Torn last line
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = voice_bot.run_batch(directory, output, workers=args.workers)
+    print(f"   resume after a crash: {report['skipped']} skipped, {report['files']} processed")
+    shutil.rmtree(directory)
+
+
+def replay_session(size, history, save_times=None):
+    """Replay `size` synthetic turns the way a handler does: build the prompt, append the turn, save"""
+    for i in range(size):
+        voice_bot.build_messages(synthetic_turn(i)[0], history)
+        history.append(synthetic_turn(i))
+        if save_times is not None:
+            started = time.perf_counter()
+            history.save()
+            save_times[i] = time.perf_counter() - started
+
+
+def bench_sessions(args):
+    """Session store: memory held per conversation, save cost per turn and resume time by session length"""
+    directory = tempfile.mkdtemp(prefix="alpha_voice_bot_sessions_")
+    print(f"📊 Sessions (window {voice_bot.SESSION_WINDOW} turns, {args.runs} resumes per row)")
+    print(f"   {'turns':>6}  {'in-memory list':>26}  {'store + window':>26}  {'db size':>10}")
+    for size in [int(n) for n in args.sizes.split(",")]:
+        # Memory held by the conversation and the chat update Gradio sends to the browser each time
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        plain = voice_bot.ChatHistory()
+        replay_session(size, plain)
+        plain_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        plain_update = len(json.dumps(plain))
+        del plain
+        gc.collect()
+
+        path = os.path.join(directory, f"sessions_{size}.db")
+        store = voice_bot.session_store = voice_bot.SessionStore(path)
+        session_id = voice_bot.new_session_id()
+        save_times = array.array("d", bytes(8 * size))  # Allocated up front so it is not counted below
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        windowed = voice_bot.ChatHistory(session_id=session_id)
+        replay_session(size, windowed, save_times)
+        windowed_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        windowed_update = len(json.dumps(windowed))
+        store.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db_bytes = os.path.getsize(path)
+
+        print(f"   {size:>6}  {plain_bytes / 1024:>9.0f} KB {plain_update / 1024:>6.0f} KB/update  "
+              f"{windowed_bytes / 1024:>9.0f} KB {windowed_update / 1024:>6.0f} KB/update  {db_bytes / 1024:>7.0f} KB")
+        record(f"{size} turns memory", list_bytes=plain_bytes, list_update_bytes=plain_update,
+               windowed_bytes=windowed_bytes, windowed_update_bytes=windowed_update, db_bytes=db_bytes)
+        summarize(f"{size} turns save per turn", save_times)
+
+        # Resume: the tail the window needs vs every turn of the session, each followed by the first prompt
+        for name, count in (("resume tail", voice_bot.SESSION_WINDOW), ("load everything", size)):
+            samples = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                history = voice_bot.ChatHistory.resume(session_id, window=count)
+                voice_bot.build_messages("And next?", history)
+                samples.append(time.perf_counter() - started)
+            summarize(f"{size} turns {name}", samples)
+        store.close()
+    voice_bot.session_store = None
+    shutil.rmtree(directory)
+
+
+def bench_stt(args):
+    """Latency and real-time factor of each speech-to-text backend over WAV fixtures"""
+    fixtures = wav_fixtures(args.fixtures)
+    clips = []
+    for path in fixtures:
+        with voice_bot.sr.AudioFile(path) as source:
+            clips.append((os.path.basename(path), voice_bot.sr.Recognizer().record(source)))
+
+    print(f"📊 Speech-to-text backends ({len(clips)} fixtures, {args.runs} runs each)")
+    for name in args.backends.split(","):
+        started = time.perf_counter()
+        try:
+            backend = voice_bot.load_stt_backend(name)
+        except (voice_bot.sr.RequestError, ValueError) as e:
+            print(f"   {name:<8} skipped: {e}")
+            continue
+        load_time = time.perf_counter() - started
+
+        latencies, factors = [], []
+        for _clip_name, audio in clips:
+            duration = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                try:
+                    backend.transcribe(audio)
+                except voice_bot.sr.UnknownValueError:
+                    pass  # Tones are not words; the timing still counts
+                except voice_bot.sr.RequestError as e:
+                    print(f"   {name:<8} request error: {e}")
+                    break
+                latencies.append(time.perf_counter() - started)
+                factors.append(latencies[-1] / duration)
+        if latencies:
+            print(f"   {name:<8} load {load_time * 1000:7.0f} ms   latency mean "
+                  f"{statistics.mean(latencies) * 1000:7.1f} ms   RTF mean {statistics.mean(factors):.3f}")
+            record(name, load_ms=load_time * 1000, mean_ms=statistics.mean(latencies) * 1000,
+                   rtf=statistics.mean(factors))
+
+
+def upload_bytes(audio):
+    """Bytes a network STT request carries for this audio (FLAC, like recognize_google)"""
+    try:
+        return len(audio.get_flac_data())
+    except OSError:
+        return len(audio.get_raw_data())  # No FLAC encoder available
+
+
+class FakeUploadBackend(FakeRecognizerBackend):
+    """Network STT stand-in: encodes FLAC, uploads it at a fixed bandwidth, then decodes"""
+
+    def __init__(self, real_time_factor=0.05, bandwidth=250_000):
+        super().__init__(real_time_factor)
+        self.bandwidth = bandwidth
+        self.sent = []
+
+    def transcribe(self, audio):
+        self.sent.append(upload_bytes(audio))
+        time.sleep(self.sent[-1] / self.bandwidth)
+        return super().transcribe(audio)
+
+
+def bench_audio(args):
+    """Bytes sent and STT latency for uploads: raw sr.AudioFile vs the preprocessing pipeline"""
+    generated = os.path.join(tempfile.gettempdir(), "alpha_voice_bot_fixtures")
+    os.makedirs(generated, exist_ok=True)
+    fixtures = []
+    for seconds in (1, 3, 6):
+        path = os.path.join(generated, f"padded_{seconds}s_{args.padding:g}_noise.wav")
+        if not os.path.exists(path):
+            write_tone_wav(path, seconds, padding=args.padding, noise=100)
+        fixtures.append(path)
+
+    def before(backend, path):
+        """Previous path: the browser's 44.1 kHz upload straight into sr.AudioFile"""
+        timings = {}
+        started = time.perf_counter()
+        with voice_bot.sr.AudioFile(path) as source:
+            audio = voice_bot.sr.Recognizer().record(source)
+        timings["decode"] = time.perf_counter() - started
+        started = time.perf_counter()
+        backend.transcribe(audio)
+        timings["stt"] = time.perf_counter() - started
+        return timings
+
+    variants = [
+        ("before (sr.AudioFile)", None),
+        ("16 kHz mono, no trim", dict(trim=False, normalize=False)),
+        ("full preprocessing", {}),
+    ]
+    print(f"📊 Audio preprocessing ({len(fixtures)} uploads, {args.padding:g}s room noise each side, {args.runs} runs, "
+          f"{args.bandwidth / 1000:g} kB/s upload, STT RTF {args.rtf:g})")
+    for label, options in variants:
+        backend = FakeUploadBackend(args.rtf, args.bandwidth)
+        if options is None:
+            run = before
+        else:
+            pipeline = voice_bot.AudioPipeline(backend=backend, **options)
+            run = lambda backend, path: pipeline.process(path).timings
+        stages, totals = {}, []
+        for path in fixtures:
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                timings = run(backend, path)
+                totals.append(time.perf_counter() - started)
+                for stage, elapsed in timings.items():
+                    stages.setdefault(stage, []).append(elapsed)
+        summarize(f"{label}", totals)
+        for stage, samples in stages.items():
+            summarize(f"  {stage}", samples, key=f"{label} {stage}")
+        print(f"     bytes sent per turn        {statistics.mean(backend.sent) / 1024:8.1f} KiB")
+
+
+def legacy_intent(user_input):
+    """Previous demo_response matching: dict rebuilt per call, substring scan in insertion order"""
+    user_lower = user_input.lower().strip()
+    if "2+2" in user_lower or "2 + 2" in user_lower:
+        return "2+2"
+    responses = dict(voice_bot.DEFAULT_INTENTS)
+    for key in responses:
+        if key in user_lower:
+            return key
+    return None
+
+
+def synthetic_utterances(count, seed=7):
+    """Mix of intent phrases embedded in filler and utterances with no intent at all"""
+    rng = random.Random(seed)
+    phrases = list(voice_bot.DEFAULT_INTENTS)
+    filler = ("so", "this", "is", "something", "about", "the", "whether", "machine", "anything",
+              "ship", "thistle", "please", "could", "you", "maybe", "timeline", "tested")
+    utterances = []
+    for i in range(count):
+        words = [rng.choice(filler) for _ in range(rng.randint(3, 15))]
+        if i % 2:
+            words.insert(rng.randint(0, len(words)), rng.choice(phrases))
+        utterances.append(" ".join(words))
+    return utterances
+
+
+def synthetic_intents(count, seed=11):
+    """Extra two-word intent phrases on top of the built-in ones"""
+    rng = random.Random(seed)
+    words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india",
+             "juliet", "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo"]
+    intents = dict(voice_bot.DEFAULT_INTENTS)
+    while len(intents) < count:
+        intents[f"{rng.choice(words)} {rng.choice(words)}{len(intents)}"] = "synthetic reply"
+    return intents
+
+
+def best_time(run, repeats=5):
+    """Fastest of several passes, so other load on the machine doesn't skew a microbenchmark (as timeit)"""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def bench_intents(args):
+    """Word-lookup intent matcher vs the previous per-call substring scan"""
+    utterances = synthetic_utterances(args.utterances)
+    gc.disable()  # Keep collector pauses out of microsecond timings, like timeit
+    print(f"📊 Intent matching ({len(utterances)} synthetic utterances, µs per utterance)")
+    print(f"   {'intents':>8}  {'substring scan':>15}  {'word lookup':>15}")
+    for size in [int(n) for n in args.sizes.split(",")]:
+        intents = synthetic_intents(size)
+        matcher = voice_bot.IntentMatcher(intents)
+
+        # Previous approach: scan every key with a substring check, in insertion order
+        legacy_time = best_time(lambda: [next((key for key in intents if key in u.lower()), None) for u in utterances])
+        lookup_time = best_time(lambda: [matcher.match(u) for u in utterances])
+
+        print(f"   {len(intents):>8}  {legacy_time / len(utterances) * 1e6:>15.2f}  "
+              f"{lookup_time / len(utterances) * 1e6:>15.2f}")
+        record(f"{len(intents)} intents", substring_us=legacy_time / len(utterances) * 1e6,
+               lookup_us=lookup_time / len(utterances) * 1e6)
+
+    legacy = [legacy_intent(u) for u in utterances]
+    found = [voice_bot.intent_matcher.match(u) for u in utterances]
+    false_hits = sum(1 for old, new in zip(legacy, found) if old is not None and new is None)
+    print(f"   substring hits inside other words (e.g. 'hi' in 'this'): {false_hits} of {len(utterances)}")
+    gc.enable()
+
+
+ROUTER_TURNS = [
+    "hi", "Hello!", "thanks", "thank you so much", "bye", "goodbye", "ok thanks",
+    "What is the capital of France?", "Can you explain how vaccines work?",
+    "hello, can you help me plan a trip to Japan next spring?", "tell me a joke please",
+    "Write a short poem about the sea", "who are you", "how does a voice assistant hear me?",
+]
+
+
+def bench_router(args):
+    """Local-first routing over a mix of trivial and real turns"""
+    with FakeOpenRouter(tokens=20, token_delay=0.005, first_token_delay=0.2):
+        history = voice_bot.ChatHistory()
+        for i in range(args.turns):
+            reply = voice_bot.route_turn(ROUTER_TURNS[i % len(ROUTER_TURNS)], history)
+            if reply is None:
+                started = time.perf_counter()
+                voice_bot.query_openrouter([{"role": "user", "content": ROUTER_TURNS[i % len(ROUTER_TURNS)]}])
+                voice_bot.record_route("llm", time.perf_counter() - started)
+
+    metrics = voice_bot.get_router_metrics()
+    print(f"📊 Local-first routing ({args.turns} turns)")
+    for route in ("local", "llm"):
+        avg = metrics[route]["avg_time"]
+        print(f"   {route:<6} {metrics[route]['turns']:>5} turns   avg "
+              f"{avg * 1000 if avg is not None else 0:10.3f} ms")
+    print(f"   local hit rate {metrics['local_hit_rate']:.0%}")
+    record("routing", local_turns=metrics["local"]["turns"], llm_turns=metrics["llm"]["turns"],
+           local_hit_rate=metrics["local_hit_rate"])
+
+
+def load_turn_text(session, turn):
+    """A turn long enough that the router always sends it to the LLM"""
+    return f"Session {session} turn {turn}: please explain something interesting about the ocean"
+
+
+def bench_load(args):
+    """Concurrent sessions: async handlers on one event loop vs sync handlers on a thread pool"""
+    voice_bot.speech_worker = voice_bot.SpeechWorker(engine_factory=FakeTTSEngine, player=null_player,
+                                                     cache=voice_bot.LRUCache(0))
+
+    def sync_session(session, queued):
+        history, latencies = voice_bot.ChatHistory(), []
+        for turn in range(args.turns):
+            # The first turn also pays for waiting on a free worker thread
+            started = queued if turn == 0 else time.perf_counter()
+            for _update in voice_bot.handle_input_stream(load_turn_text(session, turn), history, 0.7, 150, 150):
+                pass
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def async_session(session):
+        history, latencies = voice_bot.ChatHistory(), []
+        for turn in range(args.turns):
+            started = time.perf_counter()
+            async for _update in voice_bot.handle_input_async(load_turn_text(session, turn), history, 0.7, 150, 150):
+                pass
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def run_async():
+        results = await asyncio.gather(*(async_session(s) for s in range(args.sessions)))
+        return [latency for session in results for latency in session]
+
+    print(f"📊 Load ({args.sessions} sessions x {args.turns} turns, "
+          f"{args.threads} worker threads for the sync path)")
+    with FakeOpenRouter(tokens=args.tokens, token_delay=args.token_delay, first_token_delay=args.first_token_delay):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            sessions = pool.map(sync_session, range(args.sessions), [started] * args.sessions)
+            sync_latencies = [l for session in sessions for l in session]
+        summarize("sync handle_input_stream", sync_latencies, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        async_latencies = asyncio.run(run_async())
+        summarize("async handle_input_async", async_latencies, time.perf_counter() - started)
+
+
+class FakeMicrophoneStream:
+    """Audio stream that 'hears' a tone phrase, then silence, as fast as it is read"""
+
+    def __init__(self, speech_seconds, sample_rate):
+        self.speech_samples = int(speech_seconds * sample_rate)
+        self.sample_rate = sample_rate
+        self.position = 0
+
+    def read(self, samples):
+        frames = bytearray()
+        for i in range(self.position, self.position + samples):
+            level = 8000 if i < self.speech_samples else 0
+            frames += int(level * math.sin(2 * math.pi * 220 * i / self.sample_rate)).to_bytes(2, "little", signed=True)
+        self.position += samples
+        return bytes(frames)
+
+
+class FakeMicrophone(voice_bot.sr.AudioSource):
+    """sr.Microphone stand-in for the recording flow: one phrase of `speech_seconds`"""
+
+    def __init__(self, speech_seconds=1.0):
+        self.SAMPLE_RATE = voice_bot.STT_SAMPLE_RATE
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = voice_bot.MIC_FRAME_SAMPLES
+        self.stream = FakeMicrophoneStream(speech_seconds, self.SAMPLE_RATE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def use_fakes(speech_seconds=1.0):
+    """Swap the speech worker and pool, STT backend and microphone for deterministic fakes"""
+    voice_bot.speech_worker = voice_bot.SpeechWorker(engine_factory=FakeTTSEngine, player=null_player,
+                                                     cache=voice_bot.LRUCache(0))
+    voice_bot.stream_speech_pool = voice_bot.StreamSpeechPool(engine_factory=FakeTTSEngine, cache=voice_bot.LRUCache(0))
+    voice_bot.stt_backend = FakeRecognizerBackend()
+    voice_bot.noise_calibrator.thresholds[voice_bot.MICROPHONE_INDEX] = 300  # Skip calibration
+
+    @voice_bot.contextmanager
+    def fake_microphone_source(device_index=None):
+        yield FakeMicrophone(speech_seconds)
+
+    voice_bot.microphone_source = fake_microphone_source
+
+
+def timed_runs(runs, turn):
+    """Call turn(i) `runs` times; return per-call latencies and the wall time of the loop"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(runs):
+        turn_started = time.perf_counter()
+        turn(i)
+        latencies.append(time.perf_counter() - turn_started)
+    return latencies, time.perf_counter() - started
+
+
+def bench_suite(args):
+    """The voice turn pipeline end to end on fakes: text turns, audio uploads, intents, Start/Stop recording"""
+    use_fakes()
+    print(f"📊 Voice turn suite ({args.runs} runs each, stub OpenRouter, fake STT/TTS/microphone)")
+    with FakeOpenRouter(tokens=args.tokens, token_delay=args.token_delay, first_token_delay=args.first_token_delay):
+        # handle_input at growing history sizes; each run starts from the same history
+        for size in [int(n) for n in args.sizes.split(",")]:
+            history = voice_bot.ChatHistory()
+            for i in range(size):
+                voice_bot.build_messages(synthetic_turn(i)[0], history)
+                history.append(synthetic_turn(i))
+
+            def text_turn(i):
+                voice_bot.handle_input(load_turn_text(size, i), history, 0.7, 1.0, 150)
+                history.pop()
+
+            def streamed_turn(i):
+                for _update in voice_bot.handle_input_stream(load_turn_text(size, i), history, 0.7, 1.0, 150):
+                    pass
+                history.pop()
+
+            summarize(f"handle_input {size} turns", *timed_runs(args.runs, text_turn))
+            summarize(f"handle_input_stream {size} turns", *timed_runs(args.runs, streamed_turn))
+
+        # handle_audio over the WAV fixtures
+        fixtures = wav_fixtures(args.fixtures)
+        for path in fixtures:
+            history = voice_bot.ChatHistory()
+            summarize(f"handle_audio {os.path.basename(path)}",
+                      *timed_runs(args.runs, lambda i: voice_bot.handle_audio(path, history, 0.7, 1.0, 150)))
+
+        # Start/Stop recording: stop is pressed once the phrase has been captured
+        start_latencies, stop_latencies = [], []
+        history = voice_bot.ChatHistory()
+        for _ in range(args.runs):
+            # The recognizer adapts the cached threshold to the fake's constant tone; start each run level
+            voice_bot.noise_calibrator.thresholds[voice_bot.MICROPHONE_INDEX] = 300
+            started = time.perf_counter()
+            voice_bot.start_recording()
+            start_latencies.append(time.perf_counter() - started)
+            voice_bot.recording_sessions[None].audio_ready.wait(voice_bot.STOP_WAIT_TIMEOUT)
+            started = time.perf_counter()
+            voice_bot.stop_recording_and_process(history, 0.7, 1.0, 150)
+            stop_latencies.append(time.perf_counter() - started)
+        summarize("start_recording", start_latencies)
+        summarize("stop_recording_and_process", stop_latencies)
+
+    # demo_response matching, per call
+    utterances = synthetic_utterances(args.utterances)
+    summarize("demo_response", *timed_runs(len(utterances), lambda i: voice_bot.demo_response(utterances[i])))
+
+
+SPECULATION_UTTERANCES = [
+    # (what the user says, words added after a mid-sentence pause, if any)
+    ("what is the tallest mountain in the world", None),
+    ("can you explain how photosynthesis works", None),
+    ("tell me something interesting about octopuses", None),
+    ("how far away is the moon from the earth", None),
+    ("what should I cook for dinner tonight", "with only rice and eggs"),
+    ("recommend a good science fiction book", None),
+    ("why is the sky blue during the day", None),
+    ("how do I say good morning", "in japanese and in korean"),
+    ("give me three tips for better sleep", None),
+    ("what causes the northern lights to appear", None),
+]
+
+
+def spoken_partials(utterance, continuation, word_gap, pause, silence):
+    """Partial transcripts as a streaming recognizer reports them: (text, seconds until the next one)
+
+    The last partial is followed by `silence`, the trailing silence the end-pointer waits for.
+    """
+    words = utterance.split()
+    partials = [(" ".join(words[:i]), word_gap) for i in range(1, len(words) + 1)]
+    if continuation:
+        partials[-1] = (partials[-1][0], pause)  # The user pauses, then keeps talking
+        extra = continuation.split()
+        partials += [(" ".join(words + extra[:i]), word_gap) for i in range(1, len(extra) + 1)]
+    partials[-1] = (partials[-1][0], silence)
+    return partials
+
+
+def bench_speculation(args):
+    """End-point to first reply text, with and without speculative prefetch from partial transcripts"""
+    use_fakes()
+    voice_bot.SPECULATION_STABLE_MS = args.stable_ms
+    print(f"📊 Speculative prefetch ({args.runs} live turns, LLM first token {args.first_token_delay * 1000:.0f} ms, "
+          f"partials every {args.word_gap * 1000:.0f} ms, stable after {args.stable_ms} ms)")
+    with FakeOpenRouter(tokens=20, token_delay=0.005, first_token_delay=args.first_token_delay):
+        for speculative in (False, True):
+            history = voice_bot.ChatHistory()
+            before = dict(voice_bot.speculation_metrics)
+            first_text = []
+            for i in range(args.runs):
+                utterance, continuation = SPECULATION_UTTERANCES[i % len(SPECULATION_UTTERANCES)]
+                partials = spoken_partials(f"{utterance} {i}", continuation, args.word_gap, args.pause,
+                                           voice_bot.VAD_SILENCE_MS / 1000)
+                speculator = voice_bot.Speculator(history, 0.7, 150, args.stable_ms) if speculative else None
+                for partial, gap in partials:
+                    if speculator is not None:
+                        speculator.update(partial)
+                    time.sleep(gap)
+                final = partials[-1][0]
+
+                # End-pointed: the final transcript is in
+                endpoint = time.perf_counter()
+                prefetched = speculator.finish(final) if speculator is not None else None
+                for update in voice_bot.handle_input_stream(final, history, 0.7, 1.0, 150, prefetched=prefetched):
+                    if update[0][-1][1]:
+                        first_text.append(time.perf_counter() - endpoint)
+                        break
+                history.clear()
+            summarize("speculative" if speculative else "wait for final", first_text)
+        after = voice_bot.get_speculation_metrics()
+
+    requests_started = after["started"] - before["started"]
+    hits, wasted = after["hits"] - before["hits"], after["wasted"] - before["wasted"]
+    print(f"   speculation: {requests_started} prefetches, {hits} hits, {wasted} wasted requests, "
+          f"hit rate {hits / args.runs:.0%}")
+    record("speculation", prefetches=requests_started, hits=hits, wasted=wasted, hit_rate=hits / args.runs)
+
+
+PRIMARY_MODEL = "fake/primary:free"
+BACKUP_MODEL = "fake/backup:free"
+
+
+def race_turns(runs, async_client=False):
+    """Stream `runs` replies; return time to first token and which model answered each"""
+    messages = [{"role": "user", "content": "Hello there"}]
+    ttft, answered = [], []
+
+    def answered_by(delta):
+        return delta.split("-")[0] if delta.startswith(("primary-", "backup-")) else "offline"
+
+    async def turns_async():
+        for _ in range(runs):
+            started = time.perf_counter()
+            stream = voice_bot.stream_openrouter_async(messages)
+            delta = await stream.__anext__()
+            ttft.append(time.perf_counter() - started)
+            await stream.aclose()
+            answered.append(answered_by(delta))
+
+    if async_client:
+        asyncio.run(turns_async())
+        return ttft, answered
+    for _ in range(runs):
+        started = time.perf_counter()
+        stream = voice_bot.stream_openrouter(messages)
+        delta = next(stream)
+        ttft.append(time.perf_counter() - started)
+        stream.close()
+        answered.append(answered_by(delta))
+    return ttft, answered
+
+
+def bench_models(args):
+    """Model pool: fallbacks past a failing model, and hedged requests against a slow tail"""
+    print(f"📊 Model pool ({args.runs} streamed turns per row)")
+    with FakeOpenRouter(tokens=5, token_delay=0.001) as fake:
+        # Failing primary: a single model exhausts its retries then goes offline, the pool falls back
+        fake.model(PRIMARY_MODEL, status=503)
+        fake.model(BACKUP_MODEL, first_token_delay=args.backup_delay)
+        for name, models in (("failing primary alone", [PRIMARY_MODEL]),
+                             ("failing primary + backup", [PRIMARY_MODEL, BACKUP_MODEL])):
+            voice_bot.model_pool = voice_bot.ModelPool(models, hedge=False)
+            fake.server.model_requests.clear()
+            ttft, answered = race_turns(args.runs)
+            summarize(name, ttft)
+            print(f"      answered by the AI {args.runs - answered.count('offline')}/{args.runs}, "
+                  f"requests to the failing model {fake.server.model_requests.get(PRIMARY_MODEL, 0)}")
+            record(f"{name} answers", ai=args.runs - answered.count("offline"),
+                   failing_requests=fake.server.model_requests.get(PRIMARY_MODEL, 0))
+
+        # Slow tail: the primary is usually fast but sometimes stalls; a hedge races the backup
+        random.seed(3)
+        fake.model(PRIMARY_MODEL, first_token_delay=args.primary_delay, slow_rate=args.slow_rate,
+                   slow_delay=args.slow_delay)
+        for name, hedge, async_client in (("slow tail, no hedge", False, False),
+                                          ("slow tail, hedged", True, False),
+                                          ("slow tail, hedged (async)", True, True)):
+            voice_bot.model_pool = voice_bot.ModelPool([PRIMARY_MODEL, BACKUP_MODEL], hedge=hedge)
+            voice_bot.model_pool.observe(PRIMARY_MODEL, args.primary_delay)  # Warm average, as after a few turns
+            fake.server.model_requests.clear()
+            ttft, answered = race_turns(args.runs, async_client)
+            summarize(name, ttft)
+            stats = voice_bot.model_pool.get_stats()
+            print(f"      wins primary {answered.count('primary')} / backup {answered.count('backup')}, "
+                  f"hedges {stats[BACKUP_MODEL]['hedges']}, hedge delay now "
+                  f"{stats[PRIMARY_MODEL]['hedge_delay'] * 1000:.0f} ms, "
+                  f"primary TTFT EWMA {stats[PRIMARY_MODEL]['ttft_ewma'] * 1000:.0f} ms")
+            record(f"{name} races", primary_wins=answered.count("primary"), backup_wins=answered.count("backup"),
+                   hedges=stats[BACKUP_MODEL]["hedges"], extra_requests=sum(fake.server.model_requests.values()) - args.runs)
+
+
+class ApiServer:
+    """Serve voice_bot.create_api() with uvicorn on a free local port in a background thread"""
+
+    def __init__(self):
+        import uvicorn
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(voice_bot.create_api(), host="127.0.0.1", port=port,
+                                                    log_level="warning", backlog=1024))
+        self.url = f"http://127.0.0.1:{port}"
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def api_recording(seconds):
+    """A 16 kHz mono WAV recording as bytes, as a client would upload it"""
+    with tempfile.NamedTemporaryFile(suffix=".wav") as f:
+        write_tone_wav(f.name, seconds, rate=16000, channels=1)
+        return f.read()
+
+
+async def api_text_client(http, url, client, turns, samples):
+    """POST text turns, keeping the conversation on the client like a stateless integration would"""
+    history = []
+    for turn in range(turns):
+        text = load_turn_text(client, turn)
+        started = time.perf_counter()
+        response = await http.post(f"{url}/v1/turn", json={"text": text, "history": history, "max_tokens": 150})
+        response.raise_for_status()
+        samples["turn"].append(time.perf_counter() - started)
+        history = response.json()["history"]
+
+
+async def api_audio_client(http, url, client, turns, samples, recording):
+    """POST recordings and wait for transcript and reply"""
+    for _ in range(turns):
+        started = time.perf_counter()
+        response = await http.post(f"{url}/v1/audio?max_tokens=150", content=recording,
+                                   headers={"Content-Type": "audio/wav"})
+        response.raise_for_status()
+        samples["turn"].append(time.perf_counter() - started)
+
+
+async def api_stream_client(url, client, turns, samples, recording, speech):
+    """One WebSocket conversation: alternate text and recorded turns, timing first text, first speech and done"""
+    import websockets
+    async with websockets.connect(url.replace("http", "ws", 1) + "/v1/stream", max_size=None) as ws:
+        json.loads(await ws.recv())  # ready
+        await ws.send(json.dumps({"type": "config", "speech": speech, "max_tokens": 150}))
+        for turn in range(turns):
+            started = time.perf_counter()
+            if turn % 2:
+                for i in range(0, len(recording), 32 * 1024):
+                    await ws.send(recording[i:i + 32 * 1024])
+                await ws.send(json.dumps({"type": "audio_end"}))
+            else:
+                await ws.send(json.dumps({"type": "text", "text": load_turn_text(client, turn)}))
+            first_text = first_speech = None
+            while True:
+                message = await ws.recv()
+                if isinstance(message, bytes):
+                    first_speech = first_speech or time.perf_counter() - started
+                    samples["speech_bytes"] += len(message)
+                    continue
+                message = json.loads(message)
+                if message["type"] == "delta":
+                    first_text = first_text or time.perf_counter() - started
+                elif message["type"] == "error":
+                    raise RuntimeError(message["error"])
+                elif message["type"] == "done":
+                    break
+            samples["turn"].append(time.perf_counter() - started)
+            samples["first_text"].append(first_text)
+            if first_speech is not None:
+                samples["first_speech"].append(first_speech)
+
+
+def bench_api(args):
+    """Load generator for the API: concurrent simulated clients on text, audio and WebSocket stream turns"""
+    recording = api_recording(args.audio_seconds)
+    local = contextlib.ExitStack()
+    url = args.url
+    if url is None:
+        # No target given: serve the API here on the stub OpenRouter and fake STT/TTS
+        use_fakes()
+        local.enter_context(FakeOpenRouter(tokens=args.tokens, token_delay=args.token_delay,
+                                           first_token_delay=args.first_token_delay))
+        local.enter_context(contextlib.redirect_stdout(io.StringIO()))  # Per-turn log lines
+        url = local.enter_context(ApiServer()).url
+
+    async def run(mode):
+        samples = {"turn": [], "first_text": [], "first_speech": [], "speech_bytes": 0}
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+            if mode == "text":
+                clients = [api_text_client(http, url, c, args.turns, samples) for c in range(args.clients)]
+            elif mode == "audio":
+                clients = [api_audio_client(http, url, c, args.turns, samples, recording) for c in range(args.clients)]
+            else:
+                clients = [api_stream_client(url, c, args.turns, samples, recording, not args.no_speech)
+                           for c in range(args.clients)]
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(*clients, return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        return samples, time.perf_counter() - started, errors
+
+    rows = []
+    with local:
+        for mode in args.modes.split(","):
+            samples, elapsed, errors = asyncio.run(run(mode))
+            rows.append((mode, samples, elapsed, errors))
+    print(f"📊 API load ({args.clients} clients x {args.turns} turns against {args.url or 'a local server on stubs'}, "
+          f"{args.audio_seconds:.0f} s recordings)")
+    for mode, samples, elapsed, errors in rows:
+        if samples["turn"]:
+            summarize(f"{mode} turn", samples["turn"], elapsed)
+        if samples["first_text"]:
+            summarize(f"{mode} first text", samples["first_text"])
+        if samples["first_speech"]:
+            summarize(f"{mode} first speech chunk", samples["first_speech"])
+            print(f"      {samples['speech_bytes'] / len(samples['turn']) / 1024:.1f} KB of speech per turn")
+        if errors:
+            print(f"   {mode}: {len(errors)} of {args.clients} clients failed, e.g. {errors[0]!r}")
+        record(f"{mode} clients", failed=len(errors), turns=len(samples["turn"]))
+
+
+def fake_api():
+    """uvicorn factory run in each `benchmark.py workers` process: the API on CPU-bound fake STT and fake TTS"""
+    voice_bot.stt_backend = BusyRecognizerBackend(float(os.environ["BENCH_STT_RTF"]))
+    voice_bot.speech_worker = voice_bot.SpeechWorker(engine_factory=FakeTTSEngine, player=null_player)
+    voice_bot.stream_speech_pool = voice_bot.StreamSpeechPool(engine_factory=FakeTTSEngine)
+    return voice_bot.create_api()
+
+
+def start_workers(workers, port, env):
+    """Launch `workers` uvicorn processes serving fake_api and wait until they answer"""
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "benchmark:fake_api", "--factory",
+                               "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+                               "--log-level", "warning"],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1).raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{workers} workers did not start")
+
+
+async def worker_client(http, url, client, turns, samples, recording):
+    """Transcribe a recording, then answer it in a stored session; every request on a new connection"""
+    session_id = f"bench-{client}-{voice_bot.new_session_id()}"
+    saved = 0
+    for _ in range(turns):
+        started = time.perf_counter()
+        response = await http.post(f"{url}/v1/audio?reply=0", content=recording,
+                                   headers={"Content-Type": "audio/wav"})
+        response.raise_for_status()
+        response = await http.post(f"{url}/v1/turn", json={"text": response.json()["transcript"],
+                                                           "session": session_id, "max_tokens": 150})
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        saved = response.json()["turns"]
+    return saved == turns
+
+
+def bench_workers(args):
+    """Multi-worker API: throughput by worker count with sessions and caches shared through SESSION_DB"""
+    recording = api_recording(args.audio_seconds)
+    directory = tempfile.mkdtemp(prefix="alpha_voice_bot_workers_")
+    print(f"📊 API workers ({args.clients} clients x {args.turns} turns of transcribe + answer, "
+          f"{args.audio_seconds:.0f} s recordings at {args.rtf} CPU s per audio s, {os.cpu_count()} CPUs)")
+    baseline = None
+    with FakeOpenRouter(tokens=args.tokens, token_delay=args.token_delay,
+                        first_token_delay=args.first_token_delay) as fake:
+        for workers in (int(n) for n in args.workers.split(",")):
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+            env = dict(os.environ, OPENROUTER_API_URL=fake.url, SESSION_DB=os.path.join(directory, f"{workers}.db"),
+                       SHARED_CACHE="1", BENCH_STT_RTF=str(args.rtf), AUDIO_CONCURRENCY="64")
+            server = start_workers(workers, port, env)
+            url = f"http://127.0.0.1:{port}"
+
+            async def run():
+                samples = []
+                # No keep-alive, so consecutive requests of one client land on any worker
+                limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=0)
+                async with httpx.AsyncClient(limits=limits, timeout=300) as http:
+                    started = time.perf_counter()
+                    intact = await asyncio.gather(*(worker_client(http, url, c, args.turns, samples, recording)
+                                                    for c in range(args.clients)))
+                    elapsed = time.perf_counter() - started
+                    seen = {(await http.get(f"{url}/healthz")).json()["worker"] for _ in range(8 * workers)}
+                return samples, elapsed, sum(intact), len(seen)
+
+            try:
+                samples, elapsed, intact, seen = asyncio.run(run())
+            finally:
+                server.terminate()
+                server.wait()
+            throughput = len(samples) / elapsed
+            baseline = baseline or throughput
+            summarize(f"{workers} worker(s)", samples, elapsed)
+            print(f"      {throughput / baseline:.2f}x the first row, requests answered by {seen} process(es), "
+                  f"{intact}/{args.clients} sessions complete")
+            record(f"{workers} workers scaling", speedup=throughput / baseline, processes_seen=seen,
+                   sessions_complete=intact)
+    shutil.rmtree(directory)
+
+
+def git_commit():
+    """Commit the benchmark ran against, so JSON results can be compared across commits"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, args):
+    """Write every recorded result as JSON"""
+    report = {"command": args.command, "commit": git_commit(), "timestamp": time.time(),
+              "python": platform.python_version(), "results": results}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alpha Voice Bot benchmarks")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON to PATH")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ttft = sub.add_parser("ttft", help="time-to-first-token, streaming vs blocking")
+    ttft.add_argument("--runs", type=int, default=10)
+    ttft.add_argument("--tokens", type=int, default=50)
+    ttft.add_argument("--token-delay", type=float, default=0.02)
+    ttft.add_argument("--first-token-delay", type=float, default=0.2)
+    ttft.set_defaults(func=bench_ttft)
+
+    tts = sub.add_parser("tts", help="time-to-first-audio, whole reply vs sentence pipeline")
+    tts.add_argument("--runs", type=int, default=5)
+    tts.add_argument("--token-delay", type=float, default=0.02)
+    tts.add_argument("--real", action="store_true", help="use pyttsx3 instead of the fake engine")
+    tts.set_defaults(func=bench_tts)
+
+    speech = sub.add_parser("speech", help="browser speech streaming by codec and chunk size")
+    speech.add_argument("--runs", type=int, default=5)
+    speech.add_argument("--codecs", default="wav,opus,mp3")
+    speech.add_argument("--chunk-ms", default="250,500,1000")
+    speech.add_argument("--rate", type=int, default=22050, help="synthesized sample rate (pyttsx3/espeak default)")
+    speech.add_argument("--token-delay", type=float, default=0.02)
+    speech.add_argument("--bandwidth", type=int, default=250_000, help="simulated download bytes per second")
+    speech.set_defaults(func=bench_speech)
+
+    client = sub.add_parser("client", help="keep-alive reuse, retries and circuit breaker")
+    client.add_argument("--runs", type=int, default=20)
+    client.set_defaults(func=bench_client)
+
+    cache = sub.add_parser("cache", help="quick-action turns with and without caches")
+    cache.add_argument("--runs", type=int, default=20)
+    cache.set_defaults(func=bench_cache)
+
+    context = sub.add_parser("context", help="payload size and build time vs history length")
+    context.add_argument("--sizes", default="10,100,1000")
+    context.set_defaults(func=bench_context)
+
+    sessions = sub.add_parser("sessions", help="session store memory, save cost and resume time by session length")
+    sessions.add_argument("--sizes", default="1000,5000,20000")
+    sessions.add_argument("--runs", type=int, default=20)
+    sessions.set_defaults(func=bench_sessions)
+
+    stt = sub.add_parser("stt", help="latency and real-time factor per STT backend")
+    stt.add_argument("--fixtures", help="directory of WAV files (default: generated tones)")
+    stt.add_argument("--backends", default="fake,sphinx,vosk,whisper")
+    stt.add_argument("--runs", type=int, default=3)
+    stt.set_defaults(func=bench_stt)
+
+    audio = sub.add_parser("audio", help="bytes sent and STT latency, raw uploads vs preprocessing pipeline")
+    audio.add_argument("--runs", type=int, default=3)
+    audio.add_argument("--padding", type=float, default=1.5, help="seconds of silence before and after speech")
+    audio.add_argument("--rtf", type=float, default=0.1, help="fake STT real-time factor")
+    audio.add_argument("--bandwidth", type=int, default=250_000, help="simulated upload bytes per second")
+    audio.set_defaults(func=bench_audio)
+
+    batch = sub.add_parser("batch", help="batch transcription throughput, sequential vs process pool")
+    batch.add_argument("--files", type=int, default=24)
+    batch.add_argument("--rtf", type=float, default=0.2, help="fake STT CPU time per second of audio")
+    batch.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    batch.add_argument("--llm-concurrency", type=int, default=4)
+    batch.add_argument("--first-token-delay", type=float, default=0.3)
+    batch.set_defaults(func=bench_batch)
+
+    intents = sub.add_parser("intents", help="intent matching micro-benchmark")
+    intents.add_argument("--utterances", type=int, default=5000)
+    intents.add_argument("--sizes", default="21,200,2000")
+    intents.set_defaults(func=bench_intents)
+
+    router = sub.add_parser("router", help="local vs LLM routing hit rate and latency")
+    router.add_argument("--turns", type=int, default=56)
+    router.set_defaults(func=bench_router)
+
+    load = sub.add_parser("load", help="concurrent sessions, async vs thread-pool handlers")
+    load.add_argument("--sessions", type=int, default=100)
+    load.add_argument("--turns", type=int, default=3)
+    load.add_argument("--threads", type=int, default=40, help="sync worker threads (Gradio's default is 40)")
+    load.add_argument("--tokens", type=int, default=20)
+    load.add_argument("--token-delay", type=float, default=0.01)
+    load.add_argument("--first-token-delay", type=float, default=0.3)
+    load.set_defaults(func=bench_load)
+
+    speculation = sub.add_parser("speculation", help="live turns with and without speculative LLM prefetch")
+    speculation.add_argument("--runs", type=int, default=20)
+    speculation.add_argument("--word-gap", type=float, default=0.15, help="seconds between partial transcripts")
+    speculation.add_argument("--pause", type=float, default=0.6, help="mid-sentence pause before a continuation")
+    speculation.add_argument("--stable-ms", type=int, default=400)
+    speculation.add_argument("--first-token-delay", type=float, default=0.6)
+    speculation.set_defaults(func=bench_speculation)
+
+    models = sub.add_parser("models", help="model pool fallbacks and hedged requests against a stub")
+    models.add_argument("--runs", type=int, default=40)
+    models.add_argument("--primary-delay", type=float, default=0.15, help="primary first-token delay")
+    models.add_argument("--slow-rate", type=float, default=0.2, help="share of primary requests that stall")
+    models.add_argument("--slow-delay", type=float, default=2.0, help="first-token delay of a stalled request")
+    models.add_argument("--backup-delay", type=float, default=0.3, help="backup first-token delay")
+    models.set_defaults(func=bench_models)
+
+    api = sub.add_parser("api", help="load generator: concurrent clients on the HTTP/WebSocket API")
+    api.add_argument("--url", help="API to load, e.g. one instance or a load balancer (default: a local server "
+                                   "on the stub OpenRouter and fake STT/TTS)")
+    api.add_argument("--clients", type=int, default=50)
+    api.add_argument("--turns", type=int, default=4)
+    api.add_argument("--modes", default="text,audio,stream")
+    api.add_argument("--audio-seconds", type=float, default=2.0)
+    api.add_argument("--no-speech", action="store_true", help="stream turns without speech")
+    api.add_argument("--tokens", type=int, default=20)
+    api.add_argument("--token-delay", type=float, default=0.01)
+    api.add_argument("--first-token-delay", type=float, default=0.3)
+    api.set_defaults(func=bench_api)
+
+    workers = sub.add_parser("workers", help="multi-worker API throughput by worker count, shared SESSION_DB")
+    workers.add_argument("--workers", default="1,2,4")
+    workers.add_argument("--clients", type=int, default=16)
+    workers.add_argument("--turns", type=int, default=4)
+    workers.add_argument("--audio-seconds", type=float, default=1.0)
+    workers.add_argument("--rtf", type=float, default=0.3, help="fake STT CPU time per second of audio")
+    workers.add_argument("--tokens", type=int, default=20)
+    workers.add_argument("--token-delay", type=float, default=0.005)
+    workers.add_argument("--first-token-delay", type=float, default=0.2)
+    workers.set_defaults(func=bench_workers)
+
+    suite = sub.add_parser("suite", help="voice turn pipeline end to end on deterministic fakes")
+    suite.add_argument("--runs", type=int, default=20)
+    suite.add_argument("--sizes", default="10,100,1000", help="chat history sizes for handle_input")
+    suite.add_argument("--fixtures", help="directory of WAV files (default: generated tones)")
+    suite.add_argument("--utterances", type=int, default=5000, help="demo_response calls")
+    suite.add_argument("--tokens", type=int, default=20)
+    suite.add_argument("--token-delay", type=float, default=0.001)
+    suite.add_argument("--first-token-delay", type=float, default=0.02)
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    summarize.section = args.command
+    args.func(args)
+    if args.json:
+        write_results(args.json, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Shared fixtures: the stub OpenRouter server and fakes from benchmark.py, with module state restored"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import benchmark
+import voice_bot
+
+
+@pytest.fixture
+def fake_openrouter(monkeypatch):
+    """benchmark.FakeOpenRouter answering at once, with API_URL and the reply cache put back afterwards"""
+    monkeypatch.setattr(voice_bot, "API_URL", voice_bot.API_URL)
+    monkeypatch.setattr(voice_bot, "RESPONSE_CACHE_ENABLED", voice_bot.RESPONSE_CACHE_ENABLED)
+    with benchmark.FakeOpenRouter(tokens=5, token_delay=0, first_token_delay=0) as fake:
+        yield fake
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """A fresh two-model pool in place of the global one, so breaker state never leaks between tests"""
+    pool = voice_bot.ModelPool(["test/primary", "test/backup"], hedge=False)
+    monkeypatch.setattr(voice_bot, "model_pool", pool)
+    monkeypatch.setattr(voice_bot, "openrouter_client", voice_bot.OpenRouterClient(max_retries=0))
+    return pool
+
+
+def half_open(breaker):
+    """Trip a breaker and let its cool-down run out"""
+    breaker.cooldown = 0.05
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
@@ -0,0 +1,57 @@
+"""HTTP and WebSocket API: request validation and session handling, on the stub OpenRouter server"""
+import pytest
+from fastapi.testclient import TestClient
+
+import benchmark
+import voice_bot
+
+
+@pytest.fixture
+def client(fake_openrouter, pool, monkeypatch):
+    """The API without a session store"""
+    monkeypatch.setattr(voice_bot, "SESSION_DB", "")
+    monkeypatch.setattr(voice_bot, "session_store", None)
+    monkeypatch.setattr(voice_bot, "stt_backend", benchmark.FakeRecognizerBackend(real_time_factor=0))
+    with TestClient(voice_bot.create_api()) as client:
+        yield client
+
+
+def test_text_turn(client):
+    response = client.post("/v1/turn", json={"text": "Explain tides to me", "history": [["Hi", "Hello!"]]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["reply"].startswith("word0")
+    assert body["history"][-1] == ["Explain tides to me", body["reply"]]
+
+
+def test_audio_turn_reply_flag(client):
+    recording = benchmark.api_recording(1.0)
+    assert "reply" in client.post("/v1/audio", content=recording).json()
+    response = client.post("/v1/audio?reply=false", content=recording)
+    assert response.status_code == 200
+    assert response.json()["transcript"].startswith("fake transcript")
+    assert "reply" not in response.json()
+    assert client.post("/v1/audio?reply=maybe", content=recording).status_code == 400
+
+
+def test_session_turn_without_a_store_is_refused(client):
+    response = client.post("/v1/turn", json={"text": "Hello there", "session": "abc"})
+    assert response.status_code == 409
+    assert "SESSION_DB" in response.json()["error"]
+
+
+def test_stream_resume_without_a_store_is_refused(client):
+    with client.websocket_connect("/v1/stream") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        websocket.send_json({"type": "resume", "session": "abc"})
+        message = websocket.receive_json()
+        assert message["type"] == "error" and "SESSION_DB" in message["error"]
+
+
+def test_session_turns_are_saved(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(voice_bot, "session_store", voice_bot.SessionStore(str(tmp_path / "sessions.db")))
+    for turns in (1, 2):
+        response = client.post("/v1/turn", json={"text": "Explain tides to me", "session": "abc"})
+        assert response.status_code == 200
+        assert response.json()["turns"] == turns
+    assert voice_bot.ChatHistory.resume("abc").total_turns == 2
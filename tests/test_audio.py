@@ -0,0 +1,25 @@
+"""Audio pipeline: decode, resample, normalize and trim a browser-style upload before STT"""
+import benchmark
+import voice_bot
+
+
+def test_upload_is_resampled_trimmed_and_transcribed(tmp_path):
+    path = tmp_path / "upload.wav"
+    benchmark.write_tone_wav(str(path), 2.0, padding=1.0, noise=100)
+    pipeline = voice_bot.AudioPipeline(backend=benchmark.FakeRecognizerBackend(real_time_factor=0), verbose=False)
+    result = pipeline.process(str(path))
+    assert result.ok, result.error
+    assert round(result.duration, 1) == 4.0
+    # The room noise either side is cut, so STT hears less than the two-second tone
+    assert result.trimmed > 2.0
+    assert result.text == f"fake transcript of {result.duration - result.trimmed:.1f} seconds"
+    assert {"decode", "resample", "normalize", "trim", "stt"} <= set(result.timings)
+
+
+def test_undecodable_upload_comes_back_as_an_error(tmp_path):
+    path = tmp_path / "upload.wav"
+    path.write_bytes(b"not audio at all")
+    pipeline = voice_bot.AudioPipeline(backend=benchmark.FakeRecognizerBackend(real_time_factor=0), verbose=False)
+    result = pipeline.process(str(path))
+    assert not result.ok
+    assert result.error.startswith("Audio processing error")
@@ -0,0 +1,33 @@
+"""Model pool: fallbacks and hedged requests against the stub OpenRouter server"""
+import asyncio
+
+import voice_bot
+from conftest import half_open
+
+MESSAGES = [{"role": "user", "content": "Hello there"}]
+
+
+def stream_async(pool):
+    headers, data = voice_bot.build_payload(MESSAGES, stream=True)
+
+    async def reply():
+        return [delta async for delta in voice_bot.stream_models_async(headers, data, pool=pool)]
+    return asyncio.run(reply())
+
+
+def test_hedge_loser_releases_its_half_open_trial(fake_openrouter):
+    pool = voice_bot.ModelPool(["test/slow", "test/fast"], hedge=True)
+    pool.ttft["test/slow"].update(0.05)  # Hedge after HEDGE_MIN_DELAY
+    fake_openrouter.model("test/slow", first_token_delay=2.0)
+    fake_openrouter.model("test/fast")
+    breaker = pool.breakers["test/slow"]
+    half_open(breaker)
+
+    assert stream_async(pool)[0].startswith("fast-")
+    # Cancelled while waiting for its first token: the trial is given back, not held forever
+    assert breaker.state == "half-open"
+    assert not breaker.trial_running
+
+    fake_openrouter.model("test/slow", first_token_delay=0)
+    assert stream_async(pool)[0].startswith("slow-")
+    assert breaker.state == "closed"
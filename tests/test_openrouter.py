@@ -0,0 +1,233 @@
+"""OpenRouter client: retries, Retry-After, the circuit breaker, fallback order, SSE parsing and the reply cache"""
+import asyncio
+import time
+
+import pytest
+
+import voice_bot
+from conftest import half_open
+
+MESSAGES = [{"role": "user", "content": "Hello there"}]
+
+
+class StubResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+@pytest.fixture
+def single_pool(monkeypatch):
+    """One model, so its requests get the client's full retries"""
+    pool = voice_bot.ModelPool(["test/only"], hedge=False)
+    monkeypatch.setattr(voice_bot, "model_pool", pool)
+    monkeypatch.setattr(voice_bot, "openrouter_client", voice_bot.OpenRouterClient(max_retries=3))
+    return pool
+
+
+def test_retries_5xx_then_succeeds(fake_openrouter, single_pool):
+    fake_openrouter.fail_next(2, status=503, retry_after=0)
+    assert voice_bot.query_openrouter(MESSAGES).startswith("word0")
+    assert fake_openrouter.server.requests == 3
+    assert single_pool.breakers["test/only"].state == "closed"
+
+
+def test_honors_retry_after(fake_openrouter, single_pool):
+    fake_openrouter.fail_next(1, status=429, retry_after=0.3)
+    started = time.perf_counter()
+    assert voice_bot.query_openrouter(MESSAGES).startswith("word0")
+    assert time.perf_counter() - started >= 0.3
+    assert fake_openrouter.server.requests == 2
+
+
+def test_gives_up_on_a_retry_after_too_long_to_wait(fake_openrouter, single_pool):
+    fake_openrouter.fail_next(1, status=503, retry_after=voice_bot.RETRY_AFTER_MAX + 1)
+    headers, data = voice_bot.build_payload(MESSAGES)
+    with pytest.raises(voice_bot.requests.exceptions.HTTPError):
+        voice_bot.query_models(headers, data)
+    assert fake_openrouter.server.requests == 1
+
+
+def test_client_errors_are_not_retried(fake_openrouter, single_pool):
+    fake_openrouter.fail_next(1, status=401)
+    assert "API temporarily unavailable" in voice_bot.query_openrouter(MESSAGES)
+    assert fake_openrouter.server.requests == 1
+    # The upstream answered, so a bad key is not an outage
+    assert single_pool.breakers["test/only"].failures == 0
+
+
+def test_retry_delay():
+    assert voice_bot.retry_delay(0, StubResponse({"Retry-After": "2"})) == 2.0
+    assert voice_bot.retry_delay(0, StubResponse({"Retry-After": "Thu, 01 Jan 1970 00:00:00 GMT"})) == 0.0
+    for attempt in range(10):
+        delay = voice_bot.retry_delay(attempt)
+        assert 0 < delay <= voice_bot.BACKOFF_MAX
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = voice_bot.CircuitBreaker(threshold=2, cooldown=0.05, name="test")
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()        # The one trial request
+    assert not breaker.allow()    # Everyone else waits for its verdict
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_open_breaker_skips_the_network(fake_openrouter, single_pool):
+    breaker = single_pool.breakers["test/only"]
+    breaker.cooldown = 60
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+    assert "API temporarily unavailable" in voice_bot.query_openrouter(MESSAGES)
+    assert fake_openrouter.server.requests == 0
+
+
+def test_half_open_trial_success_closes_the_breaker(fake_openrouter, single_pool):
+    breaker = single_pool.breakers["test/only"]
+    half_open(breaker)
+    assert voice_bot.query_openrouter(MESSAGES).startswith("word0")
+    assert breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_is_released(fake_openrouter):
+    fake_openrouter.server.first_token_delay = 2.0
+    breaker = voice_bot.CircuitBreaker(threshold=1, name="test")
+    half_open(breaker)
+    headers, data = voice_bot.build_payload(MESSAGES, stream=True)
+
+    async def cancel_trial():
+        request = asyncio.ensure_future(voice_bot.AsyncOpenRouterClient(breaker).stream(headers, data))
+        await asyncio.sleep(0.2)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+    asyncio.run(cancel_trial())
+
+    assert breaker.state == "half-open"
+    assert not breaker.trial_running
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_falls_back_in_order(fake_openrouter, pool):
+    fake_openrouter.model("test/primary", status=503)
+    fake_openrouter.model("test/backup")
+    headers, data = voice_bot.build_payload(MESSAGES)
+    answered = {}
+    assert voice_bot.query_models(headers, data, answered=answered).startswith("backup-")
+    assert answered["model"] == "test/backup"
+    assert fake_openrouter.server.model_requests == {"test/primary": 1, "test/backup": 1}
+    assert pool.counts["test/primary"]["failures"] == 1
+    assert pool.counts["test/backup"]["wins"] == 1
+
+
+def test_streamed_reply_falls_back_in_order(fake_openrouter, pool):
+    fake_openrouter.model("test/primary", status=503)
+    fake_openrouter.model("test/backup")
+    reply = "".join(voice_bot.stream_openrouter(MESSAGES))
+    assert reply == "backup-0 backup-1 backup-2 backup-3 backup-4 "
+
+
+def test_open_model_is_skipped(fake_openrouter, pool):
+    fake_openrouter.model("test/primary")
+    fake_openrouter.model("test/backup")
+    breaker = pool.breakers["test/primary"]
+    breaker.cooldown = 60
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+    assert voice_bot.query_openrouter(MESSAGES).startswith("backup-")
+    assert "test/primary" not in fake_openrouter.server.model_requests
+
+
+def test_parse_sse_line():
+    assert voice_bot.parse_sse_line("") == (False, None)
+    assert voice_bot.parse_sse_line(": OPENROUTER PROCESSING") == (False, None)
+    assert voice_bot.parse_sse_line('data: {"choices": [{"delta": {"content": "Hi"}}]}') == (False, "Hi")
+    assert voice_bot.parse_sse_line('data: {"choices": [{"delta": {}}]}') == (False, None)
+    assert voice_bot.parse_sse_line('data: {"choices": []}') == (False, None)
+    assert voice_bot.parse_sse_line("data: not json") == (False, None)
+    assert voice_bot.parse_sse_line("data: [DONE]") == (True, None)
+    with pytest.raises(RuntimeError, match="overloaded"):
+        voice_bot.parse_sse_line('data: {"error": {"message": "overloaded"}}')
+
+
+def test_stream_matches_blocking_reply(fake_openrouter, single_pool):
+    assert "".join(voice_bot.stream_openrouter(MESSAGES)) == voice_bot.query_openrouter(MESSAGES)
+
+
+def test_async_stream(fake_openrouter, single_pool):
+    async def reply():
+        return [delta async for delta in voice_bot.stream_openrouter_async(MESSAGES)]
+    assert asyncio.run(reply()) == [f"word{i} " for i in range(5)]
+
+
+def test_cache_key_depends_on_the_whole_conversation():
+    key = voice_bot.response_cache_key
+    why = {"role": "user", "content": "Why is that?"}
+    first = [{"role": "user", "content": "The sky is blue"}, {"role": "assistant", "content": "Yes"}, why]
+    second = [{"role": "user", "content": "Grass is green"}, {"role": "assistant", "content": "Yes"}, why]
+    assert key(first, 0.7, 100) != key(second, 0.7, 100)
+    # Case and spacing don't matter, sampling settings and the model do
+    assert key([why], 0.7, 100) == key([{"role": "user", "content": "  why IS   that? "}], 0.7, 100)
+    assert key([why], 0.7, 100) != key([why], 0.2, 100)
+    assert key([why], 0.7, 100) != key([why], 0.7, 200)
+    assert key([why], 0.7, 100, "a/model") != key([why], 0.7, 100, "b/model")
+
+
+def test_repeated_prompt_is_served_from_the_cache(fake_openrouter, single_pool, monkeypatch):
+    monkeypatch.setattr(voice_bot, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(voice_bot, "response_cache", voice_bot.SharedCache(voice_bot.LRUCache(1 << 20), "test"))
+    first = voice_bot.query_openrouter(MESSAGES)
+    assert voice_bot.query_openrouter(MESSAGES) == first
+    assert "".join(voice_bot.stream_openrouter(MESSAGES)) == first
+    assert fake_openrouter.server.requests == 1
+    other = MESSAGES + [{"role": "assistant", "content": first}, {"role": "user", "content": "Hello there"}]
+    voice_bot.query_openrouter(other)
+    assert fake_openrouter.server.requests == 2
+
+
+def test_connection_refused_falls_back_to_offline(monkeypatch, single_pool):
+    monkeypatch.setattr(voice_bot, "API_URL", "http://127.0.0.1:9/api/v1/chat/completions")
+    monkeypatch.setattr(voice_bot, "openrouter_client", voice_bot.OpenRouterClient(max_retries=0))
+    assert "Switching to offline mode" in voice_bot.query_openrouter(MESSAGES)
+
+
+def test_async_reply_reads_the_shared_cache(fake_openrouter, single_pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(voice_bot, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(voice_bot, "SHARED_CACHE", True)
+    monkeypatch.setattr(voice_bot, "session_store", voice_bot.SessionStore(str(tmp_path / "sessions.db")))
+    cache = voice_bot.SharedCache(voice_bot.LRUCache(1 << 20), "test")
+    monkeypatch.setattr(voice_bot, "response_cache", cache)
+
+    async def reply():
+        return "".join([delta async for delta in voice_bot.stream_openrouter_async(MESSAGES)])
+    first = asyncio.run(reply())
+    cache.local.clear()  # As if another worker had answered it
+    assert asyncio.run(reply()) == first
+    assert fake_openrouter.server.requests == 1
+    assert cache.stats["shared_hits"] == 1
+
+
+def test_fallback_replies_are_not_cached(fake_openrouter, pool, monkeypatch):
+    monkeypatch.setattr(voice_bot, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(voice_bot, "response_cache", voice_bot.SharedCache(voice_bot.LRUCache(1 << 20), "test"))
+    fake_openrouter.model("test/primary", status=503)
+    fake_openrouter.model("test/backup")
+    assert voice_bot.query_openrouter(MESSAGES).startswith("backup-")
+
+    fake_openrouter.model("test/primary")
+    assert voice_bot.query_openrouter(MESSAGES).startswith("primary-")
+    # The preferred model's reply is kept
+    assert voice_bot.query_openrouter(MESSAGES).startswith("primary-")
+    assert fake_openrouter.server.model_requests == {"test/primary": 2, "test/backup": 1}
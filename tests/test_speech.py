@@ -0,0 +1,23 @@
+"""Streamed speech: each engine of the pool synthesizes in a process of its own"""
+import multiprocessing
+
+import benchmark
+import voice_bot
+
+
+def test_stream_engines_run_in_their_own_processes():
+    before = set(multiprocessing.active_children())
+    pool = voice_bot.StreamSpeechPool(engines=2, engine_factory=benchmark.FakeTTSEngine, cache=voice_bot.LRUCache(0))
+    stream = voice_bot.SpeechStream()
+    replies = [voice_bot.SpeechPipeline(worker=pool, stream=stream) for _ in range(2)]
+    for reply in replies:
+        reply.feed("One sentence here. Another one there.")
+        reply.close()
+    for reply in replies:
+        assert reply.wait(10)
+
+    clips = [stream.clips.get_nowait() for _ in range(4)]
+    assert all(clip[:4] == b"RIFF" for clip in clips)
+    assert pool.get_stats()["synthesized"] == 4
+    # One process per engine, none of them this one
+    assert len(set(multiprocessing.active_children()) - before) == 2
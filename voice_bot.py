@@ -1,388 +1,3849 @@
 # Import required libraries
-import gradio as gr
-import requests
+import time
+PROCESS_STARTED = time.perf_counter()
+import importlib
+import asyncio
+import weakref
 import json
-import pyttsx3
 import threading
 import warnings
 import os
-import time
-import speech_recognition as sr
-import pyaudio
+import re
+import io
+import wave
+import queue
+import tempfile
+import itertools
+import string
+import array
+import math
+import sys
+import random
+import bisect
+import difflib
+import inspect
+import functools
+import contextvars
+import argparse
+import hashlib
+import sqlite3
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ⏱️ Import time per module, for the startup report
+import_times = {}
+import_lock = threading.RLock()
+
+def timed_import(name):
+    """Import a module, recording how long the first import took"""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times.setdefault(name, time.perf_counter() - started)
+    return module
+
+class LazyModule:
+    """Stand-in for a heavy module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with import_lock:
+                if self._module is None:
+                    self._module = timed_import(self._name)
+        return self._module
+
+    @property
+    def available(self):
+        """Whether the module can be imported (imports it if so)"""
+        try:
+            self._load()
+            return True
+        except ImportError:
+            return False
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+# Gradio and the HTTP clients are needed to serve the page; audio and TTS modules wait for first use
+gr = timed_import("gradio")
+requests = timed_import("requests")
+httpx = timed_import("httpx")
+from requests.adapters import HTTPAdapter
+sr = LazyModule("speech_recognition")
+pyttsx3 = LazyModule("pyttsx3")
+pyaudio = LazyModule("pyaudio")
+pydub = LazyModule("pydub")
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
 os.environ['GRADIO_ANALYTICS_ENABLED'] = 'False'
 
-# 🔐 OpenRouter API Key and model  
-API_KEY = "API_KEY"
-MODEL = "deepseek/deepseek-chat-v3-0324:free"
+# 🔐 OpenRouter API Key and model  
+API_KEY = "API_KEY"
+MODEL = "deepseek/deepseek-chat-v3-0324:free"
+API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+SYSTEM_PROMPT = "You are Alpha Voice Assistant, a helpful and intelligent AI assistant."
+
+# 🌐 OpenRouter connection settings (timeouts in seconds)
+CONNECT_TIMEOUT = float(os.environ.get("OPENROUTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("OPENROUTER_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.environ.get("OPENROUTER_MAX_RETRIES", "3"))
+BACKOFF_BASE = 0.5         # First retry waits up to this long, doubling each attempt
+BACKOFF_MAX = 8.0          # Never wait longer than this between attempts
+RETRY_AFTER_MAX = 30.0     # Give up instead of honoring a longer Retry-After
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POOL_SIZE = 10             # Keep-alive connections kept per host
+BREAKER_THRESHOLD = 3      # Failed requests in a row before going offline
+BREAKER_COOLDOWN = 30.0    # Seconds to stay offline before trying upstream again
+
+# 🔀 Model pool: the first model is preferred, the rest are fallbacks in order (comma-separated OPENROUTER_MODELS)
+MODELS = [model.strip() for model in os.environ.get("OPENROUTER_MODELS", MODEL).split(",") if model.strip()]
+HEDGE_REQUESTS = os.environ.get("OPENROUTER_HEDGE", "0") == "1"   # Race the next model when the first is slow
+HEDGE_FACTOR = 2.0         # Hedge once the first token is this many times later than the model's smoothed TTFT
+HEDGE_MIN_DELAY = 0.25     # Never hedge sooner than this
+HEDGE_MAX_DELAY = 5.0      # Nor later than this
+HEDGE_DEFAULT_DELAY = 2.0  # Until a model has latency samples
+EWMA_ALPHA = 0.2           # Weight of each new latency sample
+
+# ⚙️ Gradio queue: concurrent events per kind of work
+QUEUE_MAX_SIZE = int(os.environ.get("QUEUE_MAX_SIZE", "100"))
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "32"))      # Async text turns (mostly waiting on OpenRouter)
+AUDIO_CONCURRENCY = int(os.environ.get("AUDIO_CONCURRENCY", "4"))   # Uploaded audio transcription
+
+# 🗃️ Reply and speech caches (set RESPONSE_CACHE=0 to always ask OpenRouter)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 * 1024
+AUDIO_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# 🧾 Context window: token budget per request and rolling summary of trimmed turns
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SUMMARY = os.environ.get("CONTEXT_SUMMARY", "1") != "0"
+SUMMARY_MAX_CHARS = 800
+
+# 💾 Conversations are appended to a SQLite journal (or Redis); only the last SESSION_WINDOW turns stay in memory
+SESSION_DB = os.environ.get("SESSION_DB", "")                     # Path, redis:// URL, or empty for memory only
+SESSION_WINDOW = int(os.environ.get("SESSION_WINDOW", "50"))      # Turns held (and shown) per conversation
+SHARED_CACHE = os.environ.get("SHARED_CACHE", "0") == "1"         # Reply/speech caches also go to SESSION_DB
+SHARED_CACHE_TTL = float(os.environ.get("SHARED_CACHE_TTL", "86400"))
+
+# 📡 Stream replies token by token into the chat (set STREAM_RESPONSES=0 to disable)
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "1") != "0"
+
+# 📈 Turn tracing: per-stage latency histograms, served on METRICS_PORT and/or dumped to METRICS_FILE
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.environ.get("METRICS_PORT") else None
+METRICS_FILE = os.environ.get("METRICS_FILE")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TRACE_HISTORY = 50         # Recent turns kept for inspection
+
+class Histogram:
+    """Latency histogram with fixed Prometheus-style buckets (seconds)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (the max for the +Inf bucket)"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum, "avg": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99),
+                "max": self.max, "buckets": dict(zip(self.buckets, itertools.accumulate(self.counts)))}
+
+class TurnTrace:
+    """Spans of one conversation turn; each span also lands in the tracer's histograms"""
+
+    def __init__(self, tracer, kind):
+        self.tracer = tracer
+        self.kind = kind
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = {}
+
+    def observe(self, span, seconds):
+        self.spans[span] = self.spans.get(span, 0.0) + seconds
+        self.tracer.observe(span, seconds)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def finish(self):
+        """Close the turn; speech spans that finish later are still added to it"""
+        self.observe("turn", time.perf_counter() - self.started)
+        self.tracer.finished(self)
+
+    def to_dict(self):
+        return {"kind": self.kind, "started_at": self.started_at, "spans": dict(self.spans)}
+
+class Tracer:
+    """Collects spans (capture, stt, prompt_build, llm_ttft, llm_total, tts_synthesis, tts_playback, ...)"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.recent = deque(maxlen=TRACE_HISTORY)
+        self.lock = threading.Lock()
+
+    def start_turn(self, kind):
+        return TurnTrace(self, kind)
+
+    def observe(self, span, seconds):
+        with self.lock:
+            if span not in self.histograms:
+                self.histograms[span] = Histogram()
+            self.histograms[span].observe(seconds)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def finished(self, trace):
+        self.recent.append(trace)
+        if METRICS_FILE:
+            write_metrics_file(METRICS_FILE)
+
+    def snapshot(self):
+        """Per-span histogram summaries plus the most recent turns"""
+        with self.lock:
+            spans = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+        return {"spans": spans, "recent_turns": [trace.to_dict() for trace in list(self.recent)]}
+
+tracer = Tracer()
+
+def validate_api_key():
+    """Validate the OpenRouter API key"""
+    if not API_KEY or API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
+        return False, "API key not configured"
+    
+    # Check if the key looks valid (basic format check)
+    if not API_KEY.startswith("sk-or-v1-"):
+        return False, "Invalid API key format"
+    
+    return True, "API key format looks valid"
+
+def get_api_status():
+    """Get current API status and suggestions"""
+    is_valid, message = validate_api_key()
+    
+    if not is_valid:
+        return {
+            "status": "invalid",
+            "message": message,
+            "suggestion": "Please check your OpenRouter API key configuration"
+        }
+    
+    return {
+        "status": "configured", 
+        "message": "API key configured",
+        "suggestion": "If you're getting 401 errors, your API key may be expired or have insufficient credits"
+    }
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling OpenRouter while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Skip a failing upstream for a cool-down period instead of waiting on every request"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, name="OpenRouter"):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """Whether a request may go upstream (one trial request once the cool-down is over)"""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    print(f"⚠️ {self.name} looks down - skipping it for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give up a half-open trial with no verdict (e.g. cancelled), so the next request can try instead"""
+        with self.lock:
+            self.trial_running = False
+
+def retry_delay(attempt, response=None):
+    """Seconds to wait before the next attempt, honoring Retry-After when given"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    # Exponential backoff with jitter
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class OpenRouterClient:
+    """Shared OpenRouter client: pooled keep-alive sessions, timeouts, retries and a circuit breaker"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE, breaker=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, headers, data, stream=False, breaker=None, max_retries=None):
+        """POST a chat completion, retrying 429/5xx and connection errors with backoff"""
+        breaker = breaker or self.breaker
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit open")
+        try:
+            return self._post(headers, json.dumps(data), stream, breaker, max_retries)
+        except BaseException:
+            # Whatever ended the request, a half-open trial must not stay taken forever
+            breaker.release_trial()
+            raise
+
+    def _post(self, headers, body, stream, breaker, max_retries):
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                response = self.session.post(API_URL, headers=headers, data=body,
+                                             stream=stream, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    # Upstream answered - client errors such as 401 are not outages
+                    breaker.record_success()
+                    response.raise_for_status()
+                    return response
+                response.raise_for_status()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                if response is not None and response.status_code not in RETRY_STATUSES:
+                    raise
+                error = e
+            if response is not None:
+                response.close()
+            delay = retry_delay(attempt, response)
+            if attempt == max_retries or delay > RETRY_AFTER_MAX:
+                break
+            time.sleep(delay)
+        breaker.record_failure()
+        raise error
+
+openrouter_client = OpenRouterClient()
+
+class AsyncOpenRouterClient:
+    """asyncio counterpart of OpenRouterClient on httpx, sharing its circuit breaker"""
+
+    def __init__(self, breaker, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE):
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                                        limits=httpx.Limits(max_keepalive_connections=pool_size))
+
+    async def stream(self, headers, data, breaker=None, max_retries=None):
+        """Open a streamed chat completion, retrying 429/5xx and connection errors with backoff"""
+        breaker = breaker or self.breaker
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit open")
+        try:
+            return await self._stream(headers, json.dumps(data), breaker, max_retries)
+        except BaseException:
+            # Cancelled (client gone, hedge lost) or failed: a half-open trial must not stay taken forever
+            breaker.release_trial()
+            raise
+
+    async def _stream(self, headers, body, breaker, max_retries):
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                request = self.client.build_request("POST", API_URL, headers=headers, content=body)
+                response = await self.client.send(request, stream=True)
+                if response.status_code not in RETRY_STATUSES:
+                    # Upstream answered - client errors such as 401 are not outages
+                    breaker.record_success()
+                    if response.is_error:
+                        await response.aclose()
+                        response.raise_for_status()
+                    return response
+                await response.aclose()
+                error = httpx.HTTPStatusError(f"{response.status_code} Server Error for url {API_URL}",
+                                              request=request, response=response)
+            except httpx.TransportError as e:
+                error = e
+            delay = retry_delay(attempt, response)
+            if attempt == max_retries or delay > RETRY_AFTER_MAX:
+                break
+            await asyncio.sleep(delay)
+        breaker.record_failure()
+        raise error
+
+# One async client per event loop (httpx clients cannot be shared across loops)
+async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client():
+    """Get the async OpenRouter client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = async_clients.get(loop)
+    if client is None:
+        client = async_clients[loop] = AsyncOpenRouterClient(openrouter_client.breaker)
+    return client
+
+class Ewma:
+    """Exponentially weighted moving average of a latency"""
+
+    def __init__(self, alpha=EWMA_ALPHA):
+        self.alpha = alpha
+        self.value = None
+        self.samples = 0
+
+    def update(self, sample):
+        self.samples += 1
+        self.value = sample if self.value is None else self.value + self.alpha * (sample - self.value)
+
+class ModelPool:
+    """Ordered OpenRouter models, each with its own circuit breaker, latency averages and counters"""
+
+    def __init__(self, models=MODELS, hedge=HEDGE_REQUESTS):
+        self.models = list(models)
+        self.hedge = hedge
+        self.breakers = {model: CircuitBreaker(name=model) for model in self.models}
+        self.ttft = {model: Ewma() for model in self.models}      # Streamed: seconds to first token
+        self.latency = {model: Ewma() for model in self.models}   # Blocking: seconds to the whole reply
+        self.counts = {model: {"requests": 0, "failures": 0, "wins": 0, "hedges": 0, "cancelled": 0}
+                       for model in self.models}
+        self.lock = threading.Lock()
+
+    def candidates(self):
+        """Models to try in preference order, skipping those whose breaker is open"""
+        models = [model for model in self.models if self.breakers[model].state != "open"]
+        if not models:
+            raise CircuitOpenError("OpenRouter circuit open for every model")
+        return models
+
+    def hedge_delay(self, model):
+        """How long to wait for a first token before racing the next model"""
+        with self.lock:
+            ttft = self.ttft[model]
+            if ttft.value is None:
+                return HEDGE_DEFAULT_DELAY
+            return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, HEDGE_FACTOR * ttft.value))
+
+    def count(self, model, counter):
+        with self.lock:
+            self.counts[model][counter] += 1
+
+    def observe(self, model, seconds, stat="ttft"):
+        with self.lock:
+            getattr(self, stat)[model].update(seconds)
+
+    def get_stats(self):
+        snapshot = {}
+        for model in self.models:
+            with self.lock:
+                stats = dict(self.counts[model], ttft_ewma=self.ttft[model].value,
+                             latency_ewma=self.latency[model].value)
+            stats["hedge_delay"] = self.hedge_delay(model)
+            stats["breaker"] = self.breakers[model].state
+            snapshot[model] = stats
+        return snapshot
+
+model_pool = ModelPool()
+
+def get_model_stats():
+    """Per-model counters, smoothed latencies and breaker state"""
+    return model_pool.get_stats()
+
+class ModelRace:
+    """Which models one streamed reply tries: fallbacks in order, and a hedge when the leader is slow"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.pending = deque(pool.candidates())
+        self.running = []
+        self.winner = None
+
+    def next_model(self):
+        """Next model and its retries: only the last resort backs off and retries, the others fall through"""
+        model = self.pending.popleft()
+        return model, (None if not self.pending else 0)
+
+    def started(self, attempt):
+        self.running.append(attempt)
+        self.pool.count(attempt.model, "requests")
+        if len(self.running) > 1:
+            self.pool.count(attempt.model, "hedges")
+
+    def hedge_timeout(self):
+        """Seconds until the next model should be raced against the leader, None if it never should"""
+        if not self.pool.hedge or self.winner is not None or len(self.running) != 1 or not self.pending:
+            return None
+        leader = self.running[0]
+        return max(0.0, leader.started + self.pool.hedge_delay(leader.model) - time.perf_counter())
+
+    def failed(self, attempt, error):
+        """An attempt failed before its first token: whether to start the next model (raises when none is left)"""
+        self.running.remove(attempt)
+        self.pool.count(attempt.model, "failures")
+        if self.running:
+            return False  # The hedge (or the leader) is still going
+        if not self.pending:
+            raise error
+        return True
+
+    def launch(self, attempt_class, headers, data, events):
+        """Start the next model as an `attempt_class` (ModelAttempt or AsyncModelAttempt) reporting to `events`"""
+        model, max_retries = self.next_model()
+        self.started(attempt_class(model, headers, data, events, max_retries, self.pool.breakers[model]))
+
+    def receive(self, attempt, item, answered=None):
+        """Route one event: "launch" the next model, "skip" it, "yield" the winner's delta or "done"
+
+        Raises the winner's error, or the last failure once no model is left. `answered`, if given,
+        receives the "model" that won.
+        """
+        if self.winner is None:
+            if isinstance(item, Exception):
+                return "launch" if self.failed(attempt, item) else "skip"
+            for loser in self.won(attempt):
+                loser.cancel()
+            if answered is not None:
+                answered["model"] = attempt.model
+        if attempt is not self.winner:
+            return "skip"
+        if isinstance(item, Exception):
+            raise item
+        return "done" if item is None else "yield"
+
+    def cancel(self):
+        """Stop every attempt still running"""
+        for attempt in self.running:
+            attempt.cancel()
+
+    def won(self, attempt):
+        """First token arrived: record latencies and return the attempts to cancel"""
+        now = time.perf_counter()
+        self.winner = attempt
+        self.pool.observe(attempt.model, now - attempt.started)
+        self.pool.count(attempt.model, "wins")
+        losers = [other for other in self.running if other is not attempt]
+        for loser in losers:
+            # No first token yet, so it is at least this slow
+            self.pool.observe(loser.model, now - loser.started)
+            self.pool.count(loser.model, "cancelled")
+        self.running = [attempt]
+        return losers
+
+class ModelAttempt:
+    """One model's streamed reply, read on its own thread so that a hedge can race it"""
+
+    def __init__(self, model, headers, data, events, max_retries=None, breaker=None):
+        self.model = model
+        self.breaker = breaker or model_pool.breakers[model]
+        self.started = time.perf_counter()
+        self.events = events
+        self.response = None
+        self.cancelled = False
+        threading.Thread(target=self._run, args=(headers, dict(data, model=model), max_retries), daemon=True).start()
+
+    def _run(self, headers, data, max_retries):
+        try:
+            with openrouter_client.post(headers, data, stream=True, breaker=self.breaker,
+                                        max_retries=max_retries) as response:
+                self.response = response
+                for delta in iter_sse_content(response):
+                    if self.cancelled:
+                        return  # Leaving the with block drops the connection, which stops generation upstream
+                    self.events.put((self, delta))
+        except Exception as e:
+            if not self.cancelled:
+                self.events.put((self, e))
+            return
+        self.events.put((self, None))
+
+    def cancel(self):
+        """Stop reading; takes effect at the next chunk (OpenRouter sends keep-alives while it waits)"""
+        self.cancelled = True
+
+class AsyncModelAttempt:
+    """asyncio counterpart of ModelAttempt, cancelled right away by cancelling its task"""
+
+    def __init__(self, model, headers, data, events, max_retries=None, breaker=None):
+        self.model = model
+        self.breaker = breaker or model_pool.breakers[model]
+        self.started = time.perf_counter()
+        self.events = events
+        self.task = asyncio.ensure_future(self._run(headers, dict(data, model=model), max_retries))
+
+    async def _run(self, headers, data, max_retries):
+        try:
+            response = await get_async_client().stream(headers, data, breaker=self.breaker,
+                                                        max_retries=max_retries)
+            try:
+                async for line in response.aiter_lines():
+                    done, delta = parse_sse_line(line)
+                    if done:
+                        break
+                    if delta:
+                        self.events.put_nowait((self, delta))
+            finally:
+                await response.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.events.put_nowait((self, e))
+            return
+        self.events.put_nowait((self, None))
+
+    def cancel(self):
+        self.task.cancel()
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional TTL, a memory cap and hit/miss/eviction stats"""
+
+    def __init__(self, max_bytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, size, expires_at)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            snapshot = dict(self.stats, entries=len(self.entries), bytes=self.bytes, max_bytes=self.max_bytes)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else None
+        return snapshot
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+class SharedCache:
+    """LRUCache in front of the session store's cache (SHARED_CACHE=1), so workers reuse each other's entries"""
+
+    def __init__(self, local, namespace, ttl=None):
+        self.local = local
+        self.namespace = namespace
+        self.ttl = ttl or SHARED_CACHE_TTL
+        self.stats = {"shared_hits": 0, "shared_misses": 0, "shared_errors": 0}
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and SHARED_CACHE:
+            return self._shared_get(key)
+        return value
+
+    async def get_async(self, key):
+        """get() for coroutines: a local hit returns at once, the shared lookup runs in a thread"""
+        value = self.local.get(key)
+        if value is None and SHARED_CACHE:
+            return await asyncio.to_thread(self._shared_get, key)
+        return value
+
+    def put(self, key, value):
+        self.local.put(key, value)
+        if SHARED_CACHE:
+            self._shared_put(key, value)
+
+    async def put_async(self, key, value):
+        """put() for coroutines, with the shared write in a thread"""
+        self.local.put(key, value)
+        if SHARED_CACHE:
+            await asyncio.to_thread(self._shared_put, key, value)
+
+    def clear(self):
+        self.local.clear()
+
+    def get_stats(self):
+        return dict(self.local.get_stats(), **self.stats)
+
+    def _shared_get(self, key):
+        store = get_session_store()
+        if store is None:
+            return None
+        try:
+            value = store.cache_get(self._key(key))
+        except Exception as e:
+            self._failed(e)
+            return None
+        if value is None:
+            self.stats["shared_misses"] += 1
+            return None
+        self.stats["shared_hits"] += 1
+        self.local.put(key, value)
+        return value
+
+    def _shared_put(self, key, value):
+        store = get_session_store()
+        if store is not None:
+            try:
+                store.cache_put(self._key(key), value, self.ttl)
+            except Exception as e:
+                self._failed(e)
+
+    def _key(self, key):
+        # Keys are tuples of str/int/float, whose repr is the same in every process
+        return f"{self.namespace}:{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()}"
+
+    def _failed(self, error):
+        # A cache that is down only costs its hits
+        if not self.stats["shared_errors"]:
+            print(f"⚠️ Shared {self.namespace} cache unavailable ({error}) - using the local cache only")
+        self.stats["shared_errors"] += 1
+
+response_cache = SharedCache(LRUCache(RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL), "responses",
+                             ttl=RESPONSE_CACHE_TTL)
+audio_cache = SharedCache(LRUCache(AUDIO_CACHE_MAX_BYTES), "audio")
+
+def response_cache_key(messages, temperature, max_tokens, model=None):
+    """Cache key from the model, every message sent (system prompt, summary, history) and the sampling settings
+
+    Only the same prompt in the same context gets a cached reply: a follow-up like "why?" depends on the
+    conversation before it. Keys name the preferred model by default.
+    """
+    normalized = [(m["role"], " ".join(m["content"].lower().split())) for m in messages]
+    digest = hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return (model or model_pool.models[0], digest, round(float(temperature), 2), int(max_tokens))
+
+def cacheable_reply(cache_key, answered):
+    """Whether a reply belongs under the key it was looked up with: a fallback model's reply does not"""
+    # Caching it would serve the fallback's answer in place of the preferred model's until it expired
+    return RESPONSE_CACHE_ENABLED and answered.get("model") == cache_key[0]
+
+def get_cache_stats():
+    """Hit/miss/eviction stats for the reply and speech caches"""
+    return {"responses": response_cache.get_stats(), "audio": audio_cache.get_stats()}
+
+def build_payload(messages, temperature=0.7, max_tokens=1024, stream=False, model=None):
+    """Build the headers and JSON body for an OpenRouter chat completion (preferred model by default)"""
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "model": model or model_pool.models[0],
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+    return headers, data
+
+def fallback_reply(messages, error):
+    """Pick the offline reply for a failed OpenRouter request"""
+    user_input = messages[-1]["content"] if messages else ""
+    if isinstance(error, CircuitOpenError):
+        return f"🔄 API temporarily unavailable. Demo response: {demo_response(user_input)}"
+    if isinstance(error, (requests.exceptions.RequestException, httpx.HTTPError)):
+        # Check if it's an API key issue (401 Unauthorized)
+        if "401" in str(error) or "Unauthorized" in str(error):
+            print("⚠️ API Key issue detected - switching to demo mode")
+            return f"🔄 API temporarily unavailable. Demo response: {demo_response(user_input)}"
+        return f"⚠️ API connection error: {str(error)}. Switching to offline mode."
+    print(f"⚠️ Unexpected API error: {str(error)} - using demo mode")
+    return demo_response(user_input)
+
+def query_models(headers, data, pool=None, answered=None):
+    """Blocking chat completion from the first model in the pool that answers, falling back in order
+
+    `answered`, if given, is a dict that receives the "model" that answered.
+    """
+    pool = pool or model_pool
+    models = pool.candidates()
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        started = time.perf_counter()
+        pool.count(model, "requests")
+        try:
+            response = openrouter_client.post(headers, dict(data, model=model), breaker=pool.breakers[model],
+                                              max_retries=None if last else 0)
+            reply = response.json()["choices"][0]["message"]["content"]
+        except Exception:
+            pool.count(model, "failures")
+            if last:
+                raise
+            continue
+        pool.observe(model, time.perf_counter() - started, stat="latency")
+        pool.count(model, "wins")
+        if answered is not None:
+            answered["model"] = model
+        return reply
+
+def stream_models(headers, data, pool=None, answered=None):
+    """Stream deltas from the model pool: the first model to produce a token wins, the others are cancelled"""
+    race = ModelRace(pool or model_pool)
+    events = queue.Queue()
+    race.launch(ModelAttempt, headers, data, events)
+    try:
+        while True:
+            try:
+                attempt, item = events.get(timeout=race.hedge_timeout())
+            except queue.Empty:
+                race.launch(ModelAttempt, headers, data, events)  # The leader is slow: race the next model
+                continue
+            action = race.receive(attempt, item, answered)
+            if action == "launch":
+                race.launch(ModelAttempt, headers, data, events)
+            elif action == "yield":
+                yield item
+            elif action == "done":
+                return
+    finally:
+        race.cancel()
+
+async def stream_models_async(headers, data, pool=None, answered=None):
+    """asyncio counterpart of stream_models"""
+    race = ModelRace(pool or model_pool)
+    events = asyncio.Queue()
+    race.launch(AsyncModelAttempt, headers, data, events)
+    try:
+        while True:
+            try:
+                attempt, item = await asyncio.wait_for(events.get(), race.hedge_timeout())
+            except asyncio.TimeoutError:
+                race.launch(AsyncModelAttempt, headers, data, events)  # The leader is slow: race the next model
+                continue
+            action = race.receive(attempt, item, answered)
+            if action == "launch":
+                race.launch(AsyncModelAttempt, headers, data, events)
+            elif action == "yield":
+                yield item
+            elif action == "done":
+                return
+    finally:
+        race.cancel()
+
+def query_openrouter(messages, temperature=0.7, max_tokens=1024, trace=None):
+    """Query the OpenRouter API with the given messages, fallback to demo mode if API fails"""
+    cache_key = response_cache_key(messages, temperature, max_tokens)
+    if RESPONSE_CACHE_ENABLED:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    headers, data = build_payload(messages, temperature, max_tokens)
+    answered = {}
+    try:
+        with (trace or tracer).span("llm_total"):
+            reply = query_models(headers, data, answered=answered)
+    except Exception as e:
+        return fallback_reply(messages, e)
+    if cacheable_reply(cache_key, answered):
+        response_cache.put(cache_key, reply)
+    return reply
+
+# Streaming metrics (time-to-first-token per streamed reply)
+stream_metrics = {"requests": 0, "last_ttft": None, "total_ttft": 0.0, "last_total": None}
+
+def record_stream_timing(ttft=None, total=None, trace=None):
+    """Record time-to-first-token and total time of a streamed reply"""
+    if ttft is not None:
+        stream_metrics["requests"] += 1
+        stream_metrics["last_ttft"] = ttft
+        stream_metrics["total_ttft"] += ttft
+        (trace or tracer).observe("llm_ttft", ttft)
+    if total is not None:
+        stream_metrics["last_total"] = total
+        (trace or tracer).observe("llm_total", total)
+
+def get_stream_metrics():
+    """Get a snapshot of the streaming metrics, including the average TTFT"""
+    snapshot = dict(stream_metrics)
+    count = snapshot["requests"]
+    snapshot["avg_ttft"] = snapshot["total_ttft"] / count if count else None
+    return snapshot
+
+def parse_sse_line(line):
+    """Parse one server-sent events line into (done, content delta or None)"""
+    # Skip blank separators and keep-alive comments like ": OPENROUTER PROCESSING"
+    if not line.startswith("data:"):
+        return False, None
+    payload = line[5:].strip()
+    if payload == "[DONE]":
+        return True, None
+    try:
+        chunk = json.loads(payload)
+    except ValueError:
+        return False, None
+    if "error" in chunk:
+        raise RuntimeError(chunk["error"].get("message", "stream error"))
+    choices = chunk.get("choices") or []
+    if not choices:
+        return False, None
+    return False, (choices[0].get("delta") or {}).get("content") or None
+
+def iter_sse_content(response):
+    """Yield content deltas from an OpenRouter server-sent events response"""
+    # chunk_size=None hands over each chunk as soon as it arrives
+    for raw_line in response.iter_lines(chunk_size=None):
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+        done, content = parse_sse_line(line)
+        if done:
+            break
+        if content:
+            yield content
+
+class StreamedReply:
+    """Bookkeeping of one streamed reply, shared by stream_openrouter and stream_openrouter_async
+
+    Holds the cache key, records time to first token and total time, keeps the parts for the cache
+    and picks the fallback when the stream fails.
+    """
+
+    def __init__(self, messages, temperature, max_tokens, trace=None):
+        self.messages = messages
+        self.cache_key = response_cache_key(messages, temperature, max_tokens)
+        self.trace = trace
+        self.started = time.perf_counter()
+        self.parts = []
+        self.answered = {}
+
+    def received(self, delta):
+        if not self.parts:
+            record_stream_timing(ttft=time.perf_counter() - self.started, trace=self.trace)
+        self.parts.append(delta)
+
+    def failed(self, error):
+        """The reply to send instead, or None to keep what already streamed"""
+        if self.parts:
+            # Keep the partial reply instead of replacing it with a fallback
+            print(f"⚠️ Stream interrupted: {str(error)}")
+            return None
+        return fallback_reply(self.messages, error)
+
+    def finished(self):
+        record_stream_timing(total=time.perf_counter() - self.started, trace=self.trace)
+
+    @property
+    def cacheable(self):
+        return bool(self.parts) and cacheable_reply(self.cache_key, self.answered)
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+def stream_openrouter(messages, temperature=0.7, max_tokens=1024, trace=None):
+    """Stream the OpenRouter reply as text deltas, fallback to demo mode if API fails"""
+    reply = StreamedReply(messages, temperature, max_tokens, trace)
+    cached = response_cache.get(reply.cache_key) if RESPONSE_CACHE_ENABLED else None
+    if cached is not None:
+        yield cached
+        return
+
+    headers, data = build_payload(messages, temperature, max_tokens, stream=True)
+    deltas = None
+    try:
+        deltas = stream_models(headers, data, answered=reply.answered)
+        for delta in deltas:
+            reply.received(delta)
+            yield delta
+    except Exception as e:
+        fallback = reply.failed(e)
+        if fallback is not None:
+            yield fallback
+        return
+    finally:
+        if deltas is not None:
+            deltas.close()  # Cancels the model attempts when the caller stops early
+        reply.finished()
+    if reply.cacheable:
+        response_cache.put(reply.cache_key, reply.text)
+
+async def stream_openrouter_async(messages, temperature=0.7, max_tokens=1024, trace=None):
+    """Async stream of OpenRouter text deltas, fallback to demo mode if API fails"""
+    reply = StreamedReply(messages, temperature, max_tokens, trace)
+    cached = await response_cache.get_async(reply.cache_key) if RESPONSE_CACHE_ENABLED else None
+    if cached is not None:
+        yield cached
+        return
+
+    headers, data = build_payload(messages, temperature, max_tokens, stream=True)
+    deltas = stream_models_async(headers, data, answered=reply.answered)
+    try:
+        async for delta in deltas:
+            reply.received(delta)
+            yield delta
+    except Exception as e:
+        fallback = reply.failed(e)
+        if fallback is not None:
+            yield fallback
+        return
+    finally:
+        await deltas.aclose()
+        reply.finished()
+    if reply.cacheable:
+        await response_cache.put_async(reply.cache_key, reply.text)
+
+# 💡 Offline intents for demo mode and local answers (INTENTS_FILE loads phrases from JSON)
+INTENTS_FILE = os.environ.get("INTENTS_FILE")
+DEFAULT_INTENTS = {
+    "2+2": "2 + 2 = 4. That's basic math! 😊",
+    "2 + 2": "2 + 2 = 4. That's basic math! 😊",
+    "hello": "Hello! I'm your Alpha Voice Bot. How can I help you today?",
+    "hi": "Hi there! Nice to meet you. What would you like to talk about?",
+    "how are you": "I'm doing great! Thanks for asking. How are you doing?",
+    "what is your name": "I'm Alpha Voice Bot, your AI assistant. What's your name?",
+    "goodbye": "Goodbye! Have a wonderful day!",
+    "bye": "See you later! Take care!",
+    "help": "I can help you with conversations, questions, math problems, and more! Try asking me anything.",
+    "test": "Test successful! Voice recognition and chat are working perfectly!",
+    "thank you": "You're very welcome! Happy to help.",
+    "thanks": "No problem! Glad I could assist.",
+    "who are you": "I'm Alpha Voice Bot, an AI assistant that can chat with you via text or voice.",
+    "what can you do": "I can have conversations, answer questions, solve problems, tell jokes, and help with various tasks!",
+    "joke": "Why don't scientists trust atoms? Because they make up everything! 😄",
+    "tell me a joke": "What do you call a bear with no teeth? A gummy bear! 🐻",
+    "weather": "I don't have access to current weather data, but I hope it's nice where you are!",
+    "time": "I don't have access to the current time, but I hope you're having a good day!",
+    "how old are you": "I'm a digital AI, so I don't age like humans do. But I'm here to help!",
+    "where are you from": "I exist in the digital realm, but I'm happy to chat with you from anywhere!",
+    "who is the prime minister": "I'd need access to current political information to tell you who the current Prime Minister is. This depends on which country you're asking about!",
+}
+
+QUESTION_REPLIES = [
+    "That's an interesting question about '{0}'. While I can give basic responses, I'd love to provide more detailed answers with a proper AI connection!",
+    "You asked: '{0}' - I can try to help with simple responses, but for detailed assistance, I'd need a full AI connection.",
+    "Great question! I can provide basic responses to '{0}', but for comprehensive answers, an AI API would be helpful.",
+]
+
+FRIENDLY_REPLIES = [
+    "You said: '{0}'. I heard you clearly! I can provide basic responses and conversation.",
+    "I understand you mentioned: '{0}'. I'm working in basic mode but can still chat with you!",
+    "Thanks for saying: '{0}'. I can respond to simple conversations and questions!",
+    "You shared: '{0}'. I'm here to chat, even in basic mode!",
+    "I got your message: '{0}'. While I can give simple responses, I'm still happy to talk with you!",
+]
+
+# Intent text is split on ASCII whitespace and punctuation; bytes.translate keeps this to a few C calls
+INTENT_PUNCTUATION = string.punctuation.replace("+", "")  # "2+2" is a phrase, not "2 2"
+INTENT_SEPARATORS = bytes.maketrans(INTENT_PUNCTUATION.encode(), b" " * len(INTENT_PUNCTUATION))
+INTENT_SPANS = str.maketrans(INTENT_PUNCTUATION, " " * len(INTENT_PUNCTUATION))
+INTENT_TOKEN = re.compile(r"[^ \t\n\r\x0b\x0c]+")  # The whitespace bytes.split() splits on
+
+def intent_words(text):
+    """Lowercased words of an utterance or phrase, as UTF-8 bytes"""
+    return text.lower().encode("utf-8").translate(INTENT_SEPARATORS).split()
+
+class IntentMatch:
+    """A matched intent phrase and where it was found in the utterance"""
+
+    def __init__(self, phrase, response, text, word_index, word_count):
+        self.phrase = phrase
+        self.response = response
+        self.text = text
+        self.word_index = word_index
+        self.word_count = word_count
+
+    @functools.cached_property
+    def span(self):
+        """Character offsets of the phrase, found only when asked for"""
+        # Case never moves word boundaries, so word i is the i-th token of the original text
+        tokens = INTENT_TOKEN.finditer(self.text.translate(INTENT_SPANS))
+        words = list(itertools.islice(tokens, self.word_index, self.word_index + self.word_count))
+        return words[0].start(), words[-1].end()
+
+    @property
+    def start(self):
+        return self.span[0]
+
+    @property
+    def end(self):
+        return self.span[1]
+
+class IntentMatcher:
+    """Match utterances against intent phrases with a dict lookup per word"""
+
+    def __init__(self, intents):
+        self.responses = {}
+        self.by_first_word = {}
+        for phrase, response in intents.items():
+            words = intent_words(phrase)
+            if not words:
+                continue  # A blank phrase would match everywhere
+            phrase = " ".join(phrase.lower().split())
+            self.responses[phrase] = response
+            self.by_first_word.setdefault(words[0], []).append((words, phrase))
+        for candidates in self.by_first_word.values():
+            # Longer phrases are tried first, so "tell me a joke" wins over "joke"
+            candidates.sort(key=lambda candidate: len(candidate[0]), reverse=True)
+        self.first_words = frozenset(self.by_first_word)
+
+    def match(self, text):
+        """Leftmost (then longest) intent phrase in the text, or None"""
+        words = text.lower().encode("utf-8").translate(INTENT_SEPARATORS).split()  # intent_words, inlined
+        if self.first_words.isdisjoint(words):
+            return None
+        by_first_word = self.by_first_word
+        for i, word in enumerate(words):
+            if word in by_first_word:
+                for phrase_words, phrase in by_first_word[word]:
+                    if words[i:i + len(phrase_words)] == phrase_words:
+                        return IntentMatch(phrase, self.respond(phrase), text, i, len(phrase_words))
+        return None
+
+    def respond(self, phrase):
+        response = self.responses[phrase]
+        return random.choice(response) if isinstance(response, list) else response
+
+def load_intents(path=None):
+    """Intent phrases and responses, from a JSON file of {"phrase": "response" or [responses]} when given"""
+    if not path:
+        return DEFAULT_INTENTS
+    try:
+        with open(path, encoding="utf-8") as f:
+            intents = json.load(f)
+        if not isinstance(intents, dict):
+            raise ValueError("expected a JSON object of phrase: response")
+        for phrase, response in intents.items():
+            if not intent_words(phrase):
+                raise ValueError(f"blank intent phrase {phrase!r}")
+            responses = response if isinstance(response, list) else [response]
+            if not responses or not all(isinstance(r, str) for r in responses):
+                raise ValueError(f"intent {phrase!r} needs a response string or a list of them")
+        print(f"💡 Loaded {len(intents)} intents from {path}")
+        return intents
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not load intents from {path}: {e} - using built-in intents")
+        return DEFAULT_INTENTS
+
+intent_matcher = IntentMatcher(load_intents(INTENTS_FILE))
+
+def demo_response(user_input):
+    """Provide demo responses when API key is not configured"""
+    match = intent_matcher.match(user_input)
+    if match is not None:
+        return match.response
+    
+    # Handle questions
+    if "?" in user_input:
+        return random.choice(QUESTION_REPLIES).format(user_input)
+    
+    # Default responses
+    return random.choice(FRIENDLY_REPLIES).format(user_input)
+
+# 🧭 Local-first routing: trivial turns are answered offline, the rest go to OpenRouter
+LOCAL_ROUTING = os.environ.get("LOCAL_ROUTING", "1") != "0"
+ROUTER_THRESHOLD = float(os.environ.get("ROUTER_THRESHOLD", "0.8"))
+ROUTER_MAX_WORDS = 8       # Longer utterances always go to the LLM
+ROUTER_WORD = re.compile(r"[\w'+]+")
+FILLER_WORDS = {"a", "lot", "so", "much", "very", "please", "there", "again", "bot", "alpha",
+                "oh", "ok", "okay", "well", "hey", "then", "for", "now"}
+
+# Per-route turn counts and latency
+router_metrics = {"local": {"turns": 0, "time": 0.0}, "llm": {"turns": 0, "time": 0.0}}
+
+def score_turn(user_input, chat_history):
+    """Confidence (0-1) that a known intent fully answers this turn, with the matched intent"""
+    match = intent_matcher.match(user_input)
+    if match is None:
+        return 0.0, None
+    words = ROUTER_WORD.findall(user_input.lower())
+    if not words or len(words) > ROUTER_MAX_WORDS:
+        return 0.0, match
+    # Share of the utterance the intent covers, ignoring polite filler
+    rest = user_input[:match.start] + " " + user_input[match.end:]
+    extra = [word for word in ROUTER_WORD.findall(rest.lower()) if word not in FILLER_WORDS]
+    score = 1.0 - len(extra) / len(words)
+    # A reply to a question the bot just asked needs the conversation context
+    if chat_history and chat_history[-1][1].rstrip().endswith("?"):
+        score -= 0.25
+    return score, match
+
+def record_route(route, elapsed):
+    router_metrics[route]["turns"] += 1
+    router_metrics[route]["time"] += elapsed
+
+def route_turn(user_input, chat_history):
+    """Answer high-confidence trivial turns locally; returns the reply, or None to escalate to the LLM"""
+    if not LOCAL_ROUTING:
+        return None
+    started = time.perf_counter()
+    score, match = score_turn(user_input, chat_history)
+    if match is None or score < ROUTER_THRESHOLD:
+        return None
+    record_route("local", time.perf_counter() - started)
+    return match.response
+
+def get_router_metrics():
+    """Turn counts, average latency and local hit rate per route"""
+    snapshot = {}
+    for route, counters in router_metrics.items():
+        turns = counters["turns"]
+        snapshot[route] = dict(counters, avg_time=counters["time"] / turns if turns else None)
+    total = snapshot["local"]["turns"] + snapshot["llm"]["turns"]
+    snapshot["local_hit_rate"] = snapshot["local"]["turns"] / total if total else None
+    return snapshot
+
+# 🔊 Incremental speech: replies are spoken sentence by sentence as they arrive
+SPEECH_QUEUE_SIZE = 4      # Synthesized sentences allowed to wait for playback
+SPEECH_MAX_CHARS = 160     # Split long sentences at clause boundaries beyond this
+SENTENCE_BOUNDARY = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+CLAUSE_BOUNDARY = re.compile(r'[,;:]\s+')
+
+class SentenceSplitter:
+    """Split streamed text into speakable sentences as soon as each one is complete"""
+
+    def __init__(self, max_chars=SPEECH_MAX_CHARS):
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Add text and return the sentences it completed"""
+        self.buffer += text
+        sentences = []
+        while True:
+            match = SENTENCE_BOUNDARY.search(self.buffer)
+            if match:
+                cut = match.end()
+            elif len(self.buffer) > self.max_chars:
+                # No sentence end yet - fall back to the last clause break or space
+                clauses = list(CLAUSE_BOUNDARY.finditer(self.buffer, 0, self.max_chars))
+                cut = clauses[-1].end() if clauses else self.buffer.rfind(" ", 0, self.max_chars) + 1
+                if cut <= 0:
+                    cut = self.max_chars
+            else:
+                break
+            sentence = self.buffer[:cut].strip()
+            self.buffer = self.buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the text is complete"""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+def split_sentences(text):
+    """Split a complete text into speakable sentences"""
+    splitter = SentenceSplitter()
+    return splitter.feed(text) + splitter.flush()
+
+def play_wav(data, stop=None):
+    """Play WAV bytes on the server's default output device until done or stop is set"""
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        audio = pyaudio.PyAudio()
+        try:
+            stream = audio.open(format=audio.get_format_from_width(wav.getsampwidth()),
+                                channels=wav.getnchannels(),
+                                rate=wav.getframerate(),
+                                output=True)
+            chunk = wav.readframes(1024)
+            while chunk and not (stop is not None and stop.is_set()):
+                stream.write(chunk)
+                chunk = wav.readframes(1024)
+            stream.stop_stream()
+            stream.close()
+        finally:
+            audio.terminate()
+
+def synthesize_wav(engine, text):
+    """Render text to WAV bytes with a pyttsx3-style engine"""
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        engine.save_to_file(text, path)
+        engine.runAndWait()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+# New replies interrupt the one being spoken (set SPEECH_PREEMPT=0 to queue them instead)
+SPEECH_PREEMPT = os.environ.get("SPEECH_PREEMPT", "1") != "0"
+
+# 🔊 Where replies are heard: the server's sound device, or chunks streamed to the browser's audio player
+SPEECH_OUTPUT = os.environ.get("SPEECH_OUTPUT", "server")            # server or browser
+SPEECH_CODEC = os.environ.get("SPEECH_CODEC", "wav")                 # wav (PCM), opus or mp3 (need ffmpeg)
+SPEECH_CHUNK_MS = int(os.environ.get("SPEECH_CHUNK_MS", "500"))      # Audio per streamed chunk
+SPEECH_BITRATE = os.environ.get("SPEECH_BITRATE", "24k")             # opus/mp3 bitrate
+SPEECH_STREAM_IDLE = 30.0  # Stop waiting for more speech after this long without any
+SPEECH_CODECS = {"wav": None, "opus": ("ogg", "libopus"), "mp3": ("mp3", "libmp3lame")}
+
+class SpeechWorker:
+    """Long-lived speech worker: one TTS engine and one player, fed sentences in reply order"""
+
+    def __init__(self, engine_factory=None, player=None, maxsize=SPEECH_QUEUE_SIZE, cache=None):
+        self.engine_factory = engine_factory or pyttsx3.init
+        self.player = player or play_wav
+        self.cache = cache if cache is not None else audio_cache
+        self.requests = queue.PriorityQueue()
+        # Bounded so synthesis never runs too far ahead of playback
+        self.clips = queue.Queue(maxsize=maxsize)
+        self.stop_playback = threading.Event()
+        self.lock = threading.Lock()
+        self.reply_ids = itertools.count()
+        self.active = set()
+        self.stats = {"sentences": 0, "synthesized": 0, "played": 0, "streamed": 0, "cancelled": 0,
+                      "interrupts": 0, "errors": 0, "synthesis_time": 0.0}
+        threading.Thread(target=self._synthesize_loop, daemon=True).start()
+        threading.Thread(target=self._playback_loop, daemon=True).start()
+
+    def register(self, reply, preempt=False):
+        """Give a reply its place in the queue, interrupting current speech if asked to"""
+        if preempt and reply.stream is None:
+            self.interrupt()
+        with self.lock:
+            self.active.add(reply)
+        return next(self.reply_ids)
+
+    def submit(self, reply, index, text):
+        """Queue one sentence of a reply (text=None marks the end of the reply)"""
+        if reply.cancelled:
+            return
+        if text is not None:
+            self.stats["sentences"] += 1
+        self.requests.put((reply.seq, index, text, reply))
+
+    def interrupt(self):
+        """Barge-in: cancel the replies queued for the server's speakers and stop the sentence being played"""
+        # Streamed replies belong to their browser session and end with its event
+        with self.lock:
+            replies = [reply for reply in self.active if reply.stream is None]
+            self.active.difference_update(replies)
+        for reply in replies:
+            reply.cancel()
+        if replies:
+            self.stats["interrupts"] += 1
+        self.stop_playback.set()
+
+    def queue_depth(self):
+        """Sentences waiting for synthesis or playback"""
+        return self.requests.qsize() + self.clips.qsize()
+
+    def get_stats(self):
+        """Snapshot of the worker counters"""
+        snapshot = dict(self.stats)
+        snapshot["queue_depth"] = self.queue_depth()
+        done = snapshot["synthesized"]
+        snapshot["avg_synthesis_time"] = snapshot["synthesis_time"] / done if done else None
+        return snapshot
+
+    def _finish(self, reply):
+        with self.lock:
+            self.active.discard(reply)
+        reply.done.set()
+
+    def _synthesize_loop(self):
+        engine = None
+        while True:
+            _, _, text, reply = self.requests.get()
+            if reply.cancelled:
+                self.stats["cancelled"] += text is not None
+                continue
+            if text is None:
+                self.clips.put((None, reply))
+                continue
+            rate = int(200 * reply.speed)
+            clip = self.cache.get((text, rate))
+            if clip is not None:
+                # Replay cached speech instead of synthesizing it again
+                self.clips.put((clip, reply))
+                continue
+            try:
+                # One engine for the worker's lifetime, rate applied per utterance
+                if engine is None:
+                    engine = self.engine_factory()
+                engine.setProperty('rate', rate)
+                started = time.perf_counter()
+                clip = synthesize_wav(engine, text)
+                elapsed = time.perf_counter() - started
+                self.stats["synthesis_time"] += elapsed
+                (reply.trace or tracer).observe("tts_synthesis", elapsed)
+                self.stats["synthesized"] += 1
+                self.cache.put((text, rate), clip)
+                self.clips.put((clip, reply))
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Speech synthesis error: {e}")
+
+    def _playback_loop(self):
+        while True:
+            clip, reply = self.clips.get()
+            self.stop_playback.clear()
+            if reply.cancelled:
+                self.stats["cancelled"] += clip is not None
+                continue
+            if clip is None:
+                self._finish(reply)
+                continue
+            if reply.first_audio_at is None:
+                reply.first_audio_at = time.perf_counter()
+                (reply.trace or tracer).observe("tts_first_audio", reply.time_to_first_audio)
+            if reply.stream is not None:
+                reply.stream.put(clip)  # Encoded and sent by the browser event, not played here
+                self.stats["streamed"] += 1
+                continue
+            try:
+                started = time.perf_counter()
+                self.player(clip, self.stop_playback)
+                (reply.trace or tracer).observe("tts_playback", time.perf_counter() - started)
+                self.stats["played"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Speech playback error: {e}")
+
+# Shared speech worker, started on first use
+speech_worker = None
+speech_worker_lock = threading.Lock()
+
+def get_speech_worker():
+    """Get the shared speech worker, starting it on first use"""
+    global speech_worker
+    with speech_worker_lock:
+        if speech_worker is None:
+            speech_worker = SpeechWorker()
+        return speech_worker
+
+def interrupt_speech():
+    """Stop the bot talking, e.g. when the user starts speaking"""
+    if speech_worker is not None:
+        speech_worker.interrupt()
+
+# Streamed replies (browser and API) are synthesized on their own engines, not the server's speech worker
+STREAM_SPEECH_ENGINES = int(os.environ.get("STREAM_SPEECH_ENGINES", "4"))
+
+def new_tts_engine():
+    """A TTS engine of its own (pyttsx3.init hands every caller the same one)"""
+    return pyttsx3.Engine()
+
+# The one engine of a stream-speech process
+process_tts_engine = None
+
+def start_tts_process(engine_factory):
+    """Create the engine of a stream-speech process"""
+    global process_tts_engine
+    process_tts_engine = engine_factory()
+
+def synthesize_in_process(text, rate):
+    """Render one sentence on this process's engine"""
+    process_tts_engine.setProperty('rate', rate)
+    return synthesize_wav(process_tts_engine, text)
+
+class StreamSpeechPool:
+    """Synthesis for streamed replies: a bounded set of engines, each in its own process
+
+    Streamed speech is sent to a client, never played here, so it doesn't need to wait for the server's
+    single speech worker. Engines can't share a process: espeak, pyttsx3's Linux driver, keeps its
+    callback and voice settings in globals, so each engine gets a single-worker process of its own,
+    fed by a thread here. Each reply sticks to one engine, which keeps its sentences in order.
+    `engine_factory` must pickle (a module-level function or class, or a functools.partial of one).
+    """
+
+    def __init__(self, engines=STREAM_SPEECH_ENGINES, engine_factory=None, cache=None):
+        self.engine_factory = engine_factory or new_tts_engine
+        self.cache = cache if cache is not None else audio_cache
+        self.requests = [queue.PriorityQueue() for _ in range(max(1, engines))]
+        self.reply_ids = itertools.count()
+        self.stats = {"sentences": 0, "synthesized": 0, "streamed": 0, "cancelled": 0, "errors": 0,
+                      "synthesis_time": 0.0}
+        for requests in self.requests:
+            threading.Thread(target=self._synthesize_loop, args=(requests,), daemon=True).start()
+
+    def register(self, reply, preempt=False):
+        """Number a streamed reply; barge-in never applies, its stream ends with its own event"""
+        return next(self.reply_ids)
+
+    def submit(self, reply, index, text):
+        """Queue one sentence of a reply on its engine (text=None marks the end of the reply)"""
+        if reply.cancelled:
+            return
+        if text is not None:
+            self.stats["sentences"] += 1
+        self.requests[reply.seq % len(self.requests)].put((reply.seq, index, text, reply))
+
+    def queue_depth(self):
+        """Sentences waiting for an engine"""
+        return sum(requests.qsize() for requests in self.requests)
+
+    def get_stats(self):
+        """Snapshot of the pool counters"""
+        snapshot = dict(self.stats, engines=len(self.requests), queue_depth=self.queue_depth())
+        done = snapshot["synthesized"]
+        snapshot["avg_synthesis_time"] = snapshot["synthesis_time"] / done if done else None
+        return snapshot
+
+    def _synthesize_loop(self, requests):
+        process = None
+        while True:
+            _, _, text, reply = requests.get()
+            if reply.cancelled:
+                self.stats["cancelled"] += text is not None
+                continue
+            if text is None:
+                reply.done.set()
+                continue
+            rate = int(200 * reply.speed)
+            clip = self.cache.get((text, rate))
+            if clip is None:
+                try:
+                    if process is None:
+                        process = ProcessPoolExecutor(max_workers=1, initializer=start_tts_process,
+                                                      initargs=(self.engine_factory,))
+                    started = time.perf_counter()
+                    clip = process.submit(synthesize_in_process, text, rate).result()
+                    elapsed = time.perf_counter() - started
+                    self.stats["synthesis_time"] += elapsed
+                    (reply.trace or tracer).observe("tts_synthesis", elapsed)
+                    self.stats["synthesized"] += 1
+                    self.cache.put((text, rate), clip)
+                except BrokenProcessPool as e:
+                    # The engine's process died (a driver crash): start a fresh one for the next sentence
+                    process = None
+                    self.stats["errors"] += 1
+                    print(f"Speech synthesis error: {e}")
+                    continue
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Speech synthesis error: {e}")
+                    continue
+            if reply.first_audio_at is None:
+                reply.first_audio_at = time.perf_counter()
+                (reply.trace or tracer).observe("tts_first_audio", reply.time_to_first_audio)
+            reply.stream.put(clip)
+            self.stats["streamed"] += 1
+
+# Shared pool for streamed speech, started on first use
+stream_speech_pool = None
+
+def get_stream_speech_pool():
+    """Get the shared streamed-speech pool, starting it on first use"""
+    global stream_speech_pool
+    with speech_worker_lock:
+        if stream_speech_pool is None:
+            stream_speech_pool = StreamSpeechPool()
+        return stream_speech_pool
+
+class SpeechPipeline:
+    """One reply's speech: splits text into sentences and queues them on the speech worker in order"""
+
+    def __init__(self, speed=1.0, worker=None, preempt=SPEECH_PREEMPT, trace=None, stream=None):
+        self.speed = speed
+        self.trace = trace
+        # Speech goes to the browser event this reply was made in, if any
+        self.stream = stream if stream is not None else current_speech_stream.get()
+        if self.stream is not None:
+            self.stream.attach(self)
+        # Played on the server's speakers by the speech worker, or synthesized by the pool for the stream
+        self.worker = worker or (get_speech_worker() if self.stream is None else get_stream_speech_pool())
+        self.splitter = SentenceSplitter()
+        self.index = 0
+        self.cancelled = False
+        self.done = threading.Event()
+        self.started_at = time.perf_counter()
+        self.first_audio_at = None
+        self.seq = self.worker.register(self, preempt)
+
+    def feed(self, text):
+        """Queue every sentence completed by this piece of text"""
+        for sentence in self.splitter.feed(text):
+            self._submit(sentence)
+
+    def close(self):
+        """Mark the text as complete so the last sentence gets spoken"""
+        for sentence in self.splitter.flush():
+            self._submit(sentence)
+        self._submit(None)
+
+    def cancel(self):
+        """Drop whatever of this reply has not been spoken yet"""
+        self.cancelled = True
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Block until the reply has been played or cancelled"""
+        return self.done.wait(timeout)
+
+    @property
+    def time_to_first_audio(self):
+        """Seconds from pipeline start until the first sentence started playing"""
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.started_at
+
+    def _submit(self, text):
+        self.worker.submit(self, self.index, text)
+        self.index += 1
+
+def get_speech_stats():
+    """Get the speech worker counters (queue depth, synthesis time, interrupts)"""
+    return get_speech_worker().get_stats()
+
+def speak_text(text, speed=1.0, trace=None):
+    """Convert text to speech sentence by sentence with adjustable speed"""
+    # Queued on the shared speech worker to avoid blocking
+    pipeline = SpeechPipeline(speed, trace=trace)
+    pipeline.feed(text)
+    pipeline.close()
+    return pipeline
+
+class SpeechEncoder:
+    """Cut synthesized WAV into chunk_ms pieces, each a standalone file the browser can play"""
+
+    def __init__(self, codec=SPEECH_CODEC, chunk_ms=SPEECH_CHUNK_MS, bitrate=SPEECH_BITRATE):
+        if codec not in SPEECH_CODECS:
+            raise ValueError(f"Unknown speech codec '{codec}' - use one of: {', '.join(SPEECH_CODECS)}")
+        self.codec = codec
+        self.chunk_ms = chunk_ms
+        self.bitrate = bitrate
+
+    def encode(self, data):
+        """Split WAV bytes into encoded chunks; returns (chunks, seconds of audio)"""
+        chunks = []
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            params = wav.getparams()
+            step = max(1, params.framerate * self.chunk_ms // 1000)
+            frames = wav.readframes(step)
+            while frames:
+                chunks.append(self._encode_chunk(params, frames))
+                frames = wav.readframes(step)
+        return chunks, params.nframes / params.framerate
+
+    def _encode_chunk(self, params, frames):
+        buffer = io.BytesIO()
+        if self.codec != "wav":
+            try:
+                segment = pydub.AudioSegment(frames, sample_width=params.sampwidth,
+                                             frame_rate=params.framerate, channels=params.nchannels)
+                container, codec = SPEECH_CODECS[self.codec]
+                segment.export(buffer, format=container, codec=codec, bitrate=self.bitrate)
+                return buffer.getvalue()
+            except Exception as e:
+                print(f"⚠️ Cannot encode speech as {self.codec} ({e}) - streaming WAV instead")
+                self.codec = "wav"
+                buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as out:
+            out.setnchannels(params.nchannels)
+            out.setsampwidth(params.sampwidth)
+            out.setframerate(params.framerate)
+            out.writeframes(frames)
+        return buffer.getvalue()
+
+speech_encoder = SpeechEncoder()
+current_speech_stream = contextvars.ContextVar("speech_stream", default=None)
+
+# Streamed speech per reply: bytes sent per second of speech and time to the first chunk
+speech_stream_metrics = {"replies": 0, "chunks": 0, "bytes": 0, "audio_seconds": 0.0,
+                         "encode_time": 0.0, "first_chunk_total": 0.0, "first_chunks": 0}
+
+class SpeechStream:
+    """Speech of the replies made during one browser event, encoded into chunks for a streaming Audio output"""
+
+    def __init__(self, encoder=None):
+        self.encoder = encoder or speech_encoder
+        self.clips = queue.Queue()
+        self.replies = []
+        self.started_at = time.perf_counter()
+        self.last_activity = self.started_at
+        self.first_chunk_at = None
+        self.chunks = 0
+        self.bytes = 0
+        self.audio_seconds = 0.0
+        self.encode_time = 0.0
+
+    @contextmanager
+    def active(self):
+        """Send the speech of SpeechPipelines created in this block to the stream"""
+        token = current_speech_stream.set(self)
+        try:
+            yield self
+        finally:
+            current_speech_stream.reset(token)
+
+    def attach(self, reply):
+        self.replies.append(reply)
+
+    def put(self, clip):
+        """Called by the speech worker with each synthesized sentence"""
+        self.clips.put(clip)
+
+    @property
+    def finished(self):
+        return all(reply.done.is_set() for reply in self.replies) and self.clips.empty()
+
+    def ready(self):
+        """Encoded chunks of the sentences synthesized so far"""
+        chunks = []
+        while not self.clips.empty():
+            chunks += self._encode(self.clips.get())
+        return chunks
+
+    def wait(self, timeout=0.05):
+        """Block for the next sentence and return its chunks ([] if none yet, None once every reply is done)"""
+        try:
+            return self._encode(self.clips.get(timeout=timeout))
+        except queue.Empty:
+            if self.finished or time.perf_counter() - self.last_activity > SPEECH_STREAM_IDLE:
+                return None
+            return []
+
+    def close(self):
+        """Drop unsent speech (the browser left or the event was cancelled) and record the stream"""
+        for reply in self.replies:
+            if not reply.done.is_set():
+                reply.cancel()
+        if not self.chunks:
+            return
+        speech_stream_metrics["replies"] += 1
+        speech_stream_metrics["chunks"] += self.chunks
+        speech_stream_metrics["bytes"] += self.bytes
+        speech_stream_metrics["audio_seconds"] += self.audio_seconds
+        speech_stream_metrics["encode_time"] += self.encode_time
+        first_chunk = self.first_chunk_at - self.started_at
+        speech_stream_metrics["first_chunk_total"] += first_chunk
+        speech_stream_metrics["first_chunks"] += 1
+        rate = self.bytes / self.audio_seconds / 1024 if self.audio_seconds else 0.0
+        print(f"🔊 Streamed {self.audio_seconds:.1f}s of speech in {self.chunks} {self.encoder.codec} chunks, "
+              f"{self.bytes / 1024:.1f} KB ({rate:.1f} KB/s), first chunk after {first_chunk * 1000:.0f} ms")
+
+    def _encode(self, clip):
+        started = time.perf_counter()
+        chunks, seconds = self.encoder.encode(clip)
+        self.last_activity = time.perf_counter()
+        self.encode_time += self.last_activity - started
+        self.chunks += len(chunks)
+        self.bytes += sum(len(chunk) for chunk in chunks)
+        self.audio_seconds += seconds
+        if chunks and self.first_chunk_at is None:
+            self.first_chunk_at = self.last_activity
+            trace = next((reply.trace for reply in self.replies if reply.trace is not None), None)
+            (trace or tracer).observe("tts_first_chunk", self.first_chunk_at - self.started_at)
+        return chunks
+
+def get_speech_stream_metrics():
+    """Streamed speech counters with bytes per second of speech and average time to the first chunk"""
+    snapshot = dict(speech_stream_metrics)
+    seconds = snapshot["audio_seconds"]
+    snapshot["bytes_per_second"] = snapshot["bytes"] / seconds if seconds else None
+    count = snapshot["first_chunks"]
+    snapshot["avg_first_chunk"] = snapshot["first_chunk_total"] / count if count else None
+    return snapshot
+
+def speech_updates(update, chunks):
+    """The handler's update with the first audio chunk, then one no-op update per further chunk"""
+    yield (*update, chunks[0] if chunks else None)
+    for chunk in chunks[1:]:
+        yield (*[gr.update()] * len(update), chunk)
+
+def stream_speech(handler):
+    """Wrap an event handler so the speech of its replies streams to one more output, a streaming gr.Audio"""
+    if inspect.isasyncgenfunction(handler):
+        @functools.wraps(handler)
+        async def streaming_handler(*args, **kwargs):
+            stream = SpeechStream()
+            updates = handler(*args, **kwargs)
+            update = None
+            try:
+                while True:
+                    with stream.active():
+                        try:
+                            update = await updates.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    # Encoding may run ffmpeg, so keep it off the event loop
+                    chunks = await asyncio.to_thread(stream.ready) if not stream.clips.empty() else []
+                    for item in speech_updates(update, chunks):
+                        yield item
+                # The text is done; the rest of the speech follows as it is synthesized
+                while update is not None and (chunks := await asyncio.to_thread(stream.wait)) is not None:
+                    for item in speech_updates([gr.update()] * len(update), chunks):
+                        yield item
+            finally:
+                stream.close()
+        return streaming_handler
+
+    @functools.wraps(handler)
+    def streaming_handler(*args, **kwargs):
+        stream = SpeechStream()
+        try:
+            with stream.active():
+                result = handler(*args, **kwargs)
+            updates = result if inspect.isgenerator(result) else iter([result])
+            last = None
+            while True:
+                with stream.active():
+                    update = next(updates, None)
+                if update is None:
+                    break
+                last = update
+                yield from speech_updates(update, stream.ready())
+            while last is not None and (chunks := stream.wait()) is not None:
+                yield from speech_updates([gr.update()] * len(last), chunks)
+        finally:
+            stream.close()
+    return streaming_handler
+
+# 🗣️ Speech-to-text backend: google (online) or sphinx / vosk / whisper (offline)
+STT_BACKEND = os.environ.get("STT_BACKEND", "google")
+VOSK_MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "model")
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+STT_SAMPLE_RATE = 16000
+
+class RecognizerBackend:
+    """Speech-to-text engine; models are loaded once in load() and reused for every request"""
+    name = "base"
+    offline = False
+
+    def load(self):
+        """Load models up front so the first request does not pay for it"""
+
+    def transcribe(self, audio):
+        """Turn sr.AudioData into text, raising sr.UnknownValueError / sr.RequestError like SpeechRecognition"""
+        raise NotImplementedError
+
+    def start_stream(self, sample_rate=None):
+        """Start an incremental transcription of 16-bit mono frames"""
+        return StreamingTranscription(self, sample_rate or STT_SAMPLE_RATE)
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech API (network round-trip per utterance)"""
+    name = "google"
+
+    def load(self):
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio):
+        return self.recognizer.recognize_google(audio)
+
+class SphinxBackend(RecognizerBackend):
+    """CMU PocketSphinx, decoder kept in memory"""
+    name = "sphinx"
+    offline = True
+
+    def load(self):
+        try:
+            from pocketsphinx import Decoder
+        except ImportError:
+            raise sr.RequestError("missing PocketSphinx module: ensure that PocketSphinx is set up correctly.")
+        self.decoder = Decoder(samprate=STT_SAMPLE_RATE)
+        self.lock = threading.Lock()  # The decoder handles one utterance at a time
+
+    def transcribe(self, audio):
+        raw = audio.get_raw_data(convert_rate=STT_SAMPLE_RATE, convert_width=2)
+        with self.lock:
+            self.decoder.start_utt()
+            self.decoder.process_raw(raw, full_utt=True)
+            self.decoder.end_utt()
+            hypothesis = self.decoder.hyp()
+        if hypothesis is None or not hypothesis.hypstr:
+            raise sr.UnknownValueError()
+        return hypothesis.hypstr
+
+class VoskBackend(RecognizerBackend):
+    """Vosk (Kaldi), model shared by one lightweight recognizer per utterance"""
+    name = "vosk"
+    offline = True
+
+    def load(self):
+        try:
+            import vosk
+        except ImportError:
+            raise sr.RequestError("missing vosk module: ensure that vosk is set up correctly.")
+        if not os.path.exists(VOSK_MODEL_PATH):
+            raise sr.RequestError(f"Vosk model not found at '{VOSK_MODEL_PATH}' - set VOSK_MODEL_PATH")
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(VOSK_MODEL_PATH)
+
+    def transcribe(self, audio):
+        recognizer = self.vosk.KaldiRecognizer(self.model, STT_SAMPLE_RATE)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=STT_SAMPLE_RATE, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def start_stream(self, sample_rate=None):
+        return VoskStream(self, sample_rate or STT_SAMPLE_RATE)
+
+class WhisperBackend(RecognizerBackend):
+    """OpenAI Whisper on the CPU, model loaded once"""
+    name = "whisper"
+    offline = True
+
+    def load(self):
+        try:
+            import numpy
+            import whisper
+        except ImportError:
+            raise sr.RequestError("missing whisper module: ensure that whisper is set up correctly.")
+        self.numpy = numpy
+        self.model = whisper.load_model(WHISPER_MODEL, device="cpu")
+        self.lock = threading.Lock()
+
+    def transcribe(self, audio):
+        raw = audio.get_raw_data(convert_rate=STT_SAMPLE_RATE, convert_width=2)
+        samples = self.numpy.frombuffer(raw, dtype=self.numpy.int16).astype(self.numpy.float32) / 32768.0
+        with self.lock:
+            text = self.model.transcribe(samples, fp16=False)["text"].strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+STT_BACKENDS = {backend.name: backend for backend in (GoogleBackend, SphinxBackend, VoskBackend, WhisperBackend)}
+
+# Shared speech-to-text backend, loaded once
+stt_backend = None
+stt_backend_lock = threading.Lock()
+
+def load_stt_backend(name):
+    """Create and load a speech-to-text backend by name"""
+    if name not in STT_BACKENDS:
+        raise ValueError(f"Unknown STT backend '{name}' - choose from {', '.join(STT_BACKENDS)}")
+    backend = STT_BACKENDS[name]()
+    backend.load()
+    return backend
+
+def get_stt_backend():
+    """Get the configured speech-to-text backend, falling back to Google if it cannot load"""
+    global stt_backend
+    with stt_backend_lock:
+        if stt_backend is None:
+            try:
+                stt_backend = load_stt_backend(STT_BACKEND)
+            except (sr.RequestError, ValueError) as e:
+                print(f"⚠️ {e} - using Google speech recognition")
+                stt_backend = load_stt_backend("google")
+        return stt_backend
+
+# 🎚️ Microphone: one pre-opened stream and a cached noise calibration per input device
+MICROPHONE_INDEX = int(os.environ["MICROPHONE_INDEX"]) if os.environ.get("MICROPHONE_INDEX") else None
+CALIBRATION_SECONDS = 0.5      # Ambient noise measured once per device
+CALIBRATION_REFRESH = 30.0     # Seconds between background refreshes while the microphone is idle
+NOISE_ADAPT_RATE = 0.05        # Weight of each non-speech frame in the running threshold
+NOISE_MARGIN = 1.5             # Speech must be this much louder than the noise floor
+MIC_FRAME_SAMPLES = STT_SAMPLE_RATE * 30 // 1000
+
+def pcm_samples(frame):
+    """Read 16-bit little-endian PCM into an array of ints (audioop is gone in Python 3.13)"""
+    samples = array.array("h", frame[:len(frame) - len(frame) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+def pcm_bytes(samples):
+    """Write an array of 16-bit samples back out as little-endian PCM"""
+    if sys.byteorder == "big":
+        samples = array.array("h", samples)
+        samples.byteswap()
+    return samples.tobytes()
+
+def pcm_rms(frame):
+    """Root-mean-square energy of a 16-bit PCM frame, as audioop.rms reported it"""
+    samples = pcm_samples(frame)
+    if not samples:
+        return 0
+    return int(math.sqrt(sum(sample * sample for sample in samples) / len(samples)))
+
+# Latency saved by skipping per-capture calibration and microphone start-up
+microphone_metrics = {"captures": 0, "calibrations": 0, "saved_seconds": 0.0, "last_saved": None}
+
+class SharedMicrophone:
+    """A microphone stream opened once and lent to one capture at a time"""
+
+    def __init__(self, device_index=None):
+        self.device_index = device_index
+        self.microphone = sr.Microphone(device_index=device_index, sample_rate=STT_SAMPLE_RATE,
+                                        chunk_size=MIC_FRAME_SAMPLES)
+        self.source = None
+        self.open_time = 0.0
+        self.lock = threading.Lock()
+
+    def open(self):
+        """Open the stream on first use and drop audio buffered while it sat idle"""
+        if self.source is None:
+            started = time.perf_counter()
+            self.source = self.microphone.__enter__()
+            self.open_time = time.perf_counter() - started
+            threading.Thread(target=self._refresh_loop, daemon=True).start()
+        stream = self.source.stream.pyaudio_stream
+        available = stream.get_read_available()
+        if available:
+            stream.read(available, exception_on_overflow=False)
+        return self.source
+
+    def close(self):
+        if self.source is not None:
+            self.microphone.__exit__(None, None, None)
+            self.source = None
+
+    def _refresh_loop(self):
+        # Keep the noise floor current from quiet audio while nobody is recording
+        while self.source is not None:
+            time.sleep(CALIBRATION_REFRESH)
+            if not self.lock.acquire(blocking=False):
+                continue
+            try:
+                source = self.open()
+                for _ in range(int(0.3 * STT_SAMPLE_RATE / MIC_FRAME_SAMPLES)):
+                    noise_calibrator.observe(self.device_index, source.stream.read(MIC_FRAME_SAMPLES))
+            except Exception as e:
+                print(f"Microphone refresh error: {e}")
+            finally:
+                self.lock.release()
+
+class NoiseCalibrator:
+    """Energy threshold measured once per input device, then adapted from non-speech audio"""
+
+    def __init__(self):
+        self.thresholds = {}
+        self.lock = threading.Lock()
+
+    def threshold(self, source, device_index=MICROPHONE_INDEX):
+        """Cached energy threshold for a device, measured on first use"""
+        with self.lock:
+            value = self.thresholds.get(device_index)
+        if value is None:
+            recognizer = sr.Recognizer()
+            started = time.perf_counter()
+            recognizer.adjust_for_ambient_noise(source, duration=CALIBRATION_SECONDS)
+            value = recognizer.energy_threshold
+            with self.lock:
+                self.thresholds[device_index] = value
+            microphone_metrics["calibrations"] += 1
+            print(f"🎚️ Microphone calibrated: energy threshold {value:.0f} "
+                  f"({(time.perf_counter() - started) * 1000:.0f} ms, cached for later captures)")
+        return value
+
+    def apply(self, recognizer, source, skipped=CALIBRATION_SECONDS, device_index=MICROPHONE_INDEX):
+        """Set a recognizer's threshold from the cache instead of re-measuring the room"""
+        calibrations = microphone_metrics["calibrations"]
+        recognizer.energy_threshold = self.threshold(source, device_index)
+        if microphone_metrics["calibrations"] == calibrations:
+            saved = skipped + (shared_microphone.open_time if shared_microphone is not None else 0.0)
+            microphone_metrics["captures"] += 1
+            microphone_metrics["saved_seconds"] += saved
+            microphone_metrics["last_saved"] = saved
+            print(f"⚡ Microphone ready - skipped calibration and start-up ({saved * 1000:.0f} ms saved)")
+
+    def observe(self, device_index, frame):
+        """Nudge the threshold towards the energy of a non-speech frame"""
+        target = pcm_rms(frame) * NOISE_MARGIN
+        with self.lock:
+            current = self.thresholds.get(device_index)
+            if current is not None and target < current:
+                self.thresholds[device_index] = current + (target - current) * NOISE_ADAPT_RATE
+            elif current is not None:
+                # Louder than the threshold but not speech: rise more slowly
+                self.thresholds[device_index] = current + (target - current) * NOISE_ADAPT_RATE / 4
+
+    def update(self, recognizer, device_index=MICROPHONE_INDEX):
+        """Keep the threshold a recognizer adapted while listening"""
+        with self.lock:
+            self.thresholds[device_index] = recognizer.energy_threshold
+
+noise_calibrator = NoiseCalibrator()
+shared_microphone = None
+
+@contextmanager
+def microphone_source(device_index=MICROPHONE_INDEX):
+    """Yield a ready microphone: the shared pre-opened stream, or a dedicated one while it is busy"""
+    global shared_microphone
+    if shared_microphone is None:
+        shared_microphone = SharedMicrophone(device_index)
+    if shared_microphone.lock.acquire(blocking=False):
+        try:
+            try:
+                source = shared_microphone.open()
+            except Exception:
+                shared_microphone.close()
+                raise
+            yield source
+        finally:
+            shared_microphone.lock.release()
+    else:
+        with sr.Microphone(device_index=device_index, sample_rate=STT_SAMPLE_RATE,
+                           chunk_size=MIC_FRAME_SAMPLES) as source:
+            yield source
+
+def get_microphone_metrics():
+    """Snapshot of the calibration cache and the latency it saved"""
+    snapshot = dict(microphone_metrics)
+    snapshot["thresholds"] = dict(noise_calibrator.thresholds)
+    return snapshot
+
+# 🎙️ Start/Stop recording state, kept per browser session
+MAX_CAPTURE_WORKERS = int(os.environ.get("MAX_CAPTURE_WORKERS", "4"))
+STOP_WAIT_TIMEOUT = 5.0    # Longest wait for the capture to hand over its audio
+
+class RecordingSession:
+    """Recording state of one browser session"""
+
+    def __init__(self):
+        self.stop_requested = threading.Event()
+        self.audio_ready = threading.Event()
+        self.audio = None
+
+capture_pool = ThreadPoolExecutor(max_workers=MAX_CAPTURE_WORKERS, thread_name_prefix="capture")
+capture_slots = threading.BoundedSemaphore(MAX_CAPTURE_WORKERS)
+recording_sessions = {}
+recording_sessions_lock = threading.Lock()
+
+def session_key(request):
+    """Key of the browser session behind a Gradio request"""
+    return getattr(request, "session_hash", None)
+
+def record_audio_thread(session):
+    """Capture worker: record one phrase for a session until it is stopped"""
+    recognizer = sr.Recognizer()
+    try:
+        with microphone_source() as source:
+            print("🎤 Background recording started...")
+            noise_calibrator.apply(recognizer, source, skipped=0.5)
+            while not session.stop_requested.is_set():
+                try:
+                    session.audio = recognizer.listen(source, timeout=0.5, phrase_time_limit=None)
+                    noise_calibrator.update(recognizer)
+                    break
+                except sr.WaitTimeoutError:
+                    continue
+    except Exception as e:
+        print(f"Recording thread error: {e}")
+        session.audio = None
+    finally:
+        session.audio_ready.set()
+        capture_slots.release()
+
+def start_recording(request: gr.Request = None):
+    """Start recording audio in background"""
+    interrupt_speech()  # Barge-in: stop talking while the user speaks
+    if not capture_slots.acquire(blocking=False):
+        return "⚠️ All recorders are busy - please try again shortly", gr.update(visible=True), gr.update(visible=False)
+
+    session = RecordingSession()
+    with recording_sessions_lock:
+        previous = recording_sessions.get(session_key(request))
+        recording_sessions[session_key(request)] = session
+    if previous is not None:
+        previous.stop_requested.set()
+
+    # Record on the bounded pool of capture workers
+    capture_pool.submit(record_audio_thread, session)
+    
+    return "🎤 Recording... Speak now!", gr.update(visible=False), gr.update(visible=True)
+
+def stop_recording_and_process(chat_history, temperature, voice_speed, max_tokens, request: gr.Request = None):
+    """Stop recording and process the audio"""
+    with recording_sessions_lock:
+        session = recording_sessions.pop(session_key(request), None)
+    trace = tracer.start_turn("recording")
+    recorded_audio = None
+    if session is not None:
+        session.stop_requested.set()
+        # Continue as soon as the capture worker hands over its audio
+        with trace.span("capture"):
+            session.audio_ready.wait(STOP_WAIT_TIMEOUT)
+        recorded_audio = session.audio
+    
+    ready = ("🎤 Ready to record", gr.update(visible=True), gr.update(visible=False))
+    if recorded_audio is None:
+        chat_history.append(("🎤 Voice Recording", "⚠️ No audio recorded"))
+        update = chat_history, ""
+    else:
+        result = audio_pipeline.process(audio=recorded_audio, trace=trace)
+        if result.ok:
+            print(f"🔄 Recognized: {result.text}")
+            update = handle_input(result.text, chat_history, temperature, voice_speed, max_tokens, trace=trace)
+        else:
+            chat_history.append(("🎤 Voice Recording", f"⚠️ {result.error}"))
+            update = chat_history, ""
+    trace.finish()
+    return update + ready
+
+# 🎧 Live voice: chunked capture, voice-activity detection and partial transcripts
+VAD_FRAME_MS = 30          # Frame size (10/20/30 ms also suits WebRTC VAD)
+VAD_SILENCE_MS = int(os.environ.get("VAD_SILENCE_MS", "700"))   # Silence that ends an utterance
+VAD_PREROLL_MS = 300       # Audio kept from just before speech starts
+VAD_START_TIMEOUT = 5.0    # Seconds to wait for speech to start
+VAD_MAX_SPEECH = 15.0      # Longest utterance in seconds
+PARTIAL_INTERVAL = 0.5     # Seconds between partial decodes for offline backends
+PARTIAL_INTERVAL_ONLINE = 1.5
+
+# Speculative prefetch: ask the LLM from a stable partial transcript before the user stops talking
+SPECULATIVE_PREFETCH = os.environ.get("SPECULATIVE_PREFETCH", "0") == "1"
+SPECULATION_STABLE_MS = int(os.environ.get("SPECULATION_STABLE_MS", "400"))   # Partial unchanged this long
+SPECULATION_MIN_WORDS = 3          # Too short a partial is rarely the final question
+SPECULATION_MATCH = float(os.environ.get("SPECULATION_MATCH", "0.9"))          # Final/partial similarity to keep it
+
+class StreamingTranscription:
+    """Incremental transcription for backends without native streaming: partials re-decode the buffer"""
+
+    def __init__(self, backend, sample_rate):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.interval = PARTIAL_INTERVAL if backend.offline else PARTIAL_INTERVAL_ONLINE
+        self.frames = bytearray()
+        self.partial = ""
+        self.last_decode = time.perf_counter()
+        self.decoding = threading.Lock()
+
+    def accept(self, frame):
+        """Add a frame and return the latest partial hypothesis"""
+        self.frames += frame
+        now = time.perf_counter()
+        if now - self.last_decode >= self.interval and self.decoding.acquire(blocking=False):
+            # Decode a snapshot in the background so capture never waits on it
+            self.last_decode = now
+            snapshot = sr.AudioData(bytes(self.frames), self.sample_rate, 2)
+            threading.Thread(target=self._decode_partial, args=(snapshot,), daemon=True).start()
+        return self.partial
+
+    def finish(self):
+        """Final transcript of everything accepted"""
+        return self.backend.transcribe(sr.AudioData(bytes(self.frames), self.sample_rate, 2))
+
+    def _decode_partial(self, audio):
+        try:
+            self.partial = self.backend.transcribe(audio)
+        except Exception:
+            pass
+        finally:
+            self.decoding.release()
+
+class VoskStream:
+    """Native Vosk streaming: partial results straight from the Kaldi recognizer"""
+
+    def __init__(self, backend, sample_rate):
+        self.recognizer = backend.vosk.KaldiRecognizer(backend.model, sample_rate)
+        self.segments = []
+
+    def accept(self, frame):
+        if self.recognizer.AcceptWaveform(frame):
+            self.segments.append(json.loads(self.recognizer.Result()).get("text", ""))
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(part for part in self.segments + [partial] if part)
+
+    def finish(self):
+        self.segments.append(json.loads(self.recognizer.FinalResult()).get("text", ""))
+        text = " ".join(part for part in self.segments if part)
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+class VoiceActivityDetector:
+    """Energy-based speech detector, using WebRTC VAD instead when webrtcvad is installed"""
+
+    def __init__(self, sample_rate=STT_SAMPLE_RATE, energy_threshold=300, aggressiveness=2):
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        try:
+            import webrtcvad
+            self.webrtc = webrtcvad.Vad(aggressiveness)
+        except ImportError:
+            self.webrtc = None
+
+    def is_speech(self, frame):
+        if self.webrtc is not None:
+            return self.webrtc.is_speech(frame, self.sample_rate)
+        return pcm_rms(frame) > self.energy_threshold
+
+class Endpointer:
+    """Find where speech starts and ends in a stream of frames"""
+
+    def __init__(self, vad, frame_ms=VAD_FRAME_MS, silence_ms=VAD_SILENCE_MS, preroll_ms=VAD_PREROLL_MS):
+        self.vad = vad
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self.in_speech = False
+        self.ended = False
+        self.silent_run = 0
+        self.speech_end_at = None  # Time of the last speech frame
+
+    def process(self, frame):
+        """Return the frames to pass on to the recognizer for this frame"""
+        speech = self.vad.is_speech(frame)
+        if not self.in_speech:
+            self.preroll.append(frame)
+            if not speech:
+                return []
+            self.in_speech = True
+            self.speech_end_at = time.perf_counter()
+            frames = list(self.preroll)
+            self.preroll.clear()
+            return frames
+        if speech:
+            self.silent_run = 0
+            self.speech_end_at = time.perf_counter()
+        else:
+            self.silent_run += 1
+            self.ended = self.silent_run >= self.silence_frames
+        return [frame]
+
+def listen_streaming(timings=None, vad=None):
+    """Capture the microphone frame by frame until end of speech.
+
+    Yields ("partial", text) while the user speaks and ("final", text) at the end;
+    speech-end and end-point times are written into `timings`.
+    """
+    timings = timings if timings is not None else {}
+    backend = get_stt_backend()
+    frame_samples = STT_SAMPLE_RATE * VAD_FRAME_MS // 1000
+    transcription = backend.start_stream(STT_SAMPLE_RATE)
+    last_partial = ""
+    with microphone_source() as source:
+        if vad is None:
+            recognizer = sr.Recognizer()
+            noise_calibrator.apply(recognizer, source, skipped=0.0)
+            vad = VoiceActivityDetector(energy_threshold=recognizer.energy_threshold)
+        endpointer = Endpointer(vad)
+        started = timings["capture_start"] = time.perf_counter()
+        while not endpointer.ended:
+            frame = source.stream.read(frame_samples)
+            partial = last_partial
+            for speech_frame in endpointer.process(frame):
+                partial = transcription.accept(speech_frame)
+            if not endpointer.in_speech:
+                # Quiet frames before speech keep the noise floor current
+                noise_calibrator.observe(MICROPHONE_INDEX, frame)
+                vad.energy_threshold = noise_calibrator.thresholds.get(MICROPHONE_INDEX, vad.energy_threshold)
+            if partial and partial != last_partial:
+                last_partial = partial
+                yield "partial", partial
+            elapsed = time.perf_counter() - started
+            if not endpointer.in_speech and elapsed > VAD_START_TIMEOUT:
+                raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            if elapsed > VAD_START_TIMEOUT + VAD_MAX_SPEECH:
+                break
+    timings["speech_end"] = endpointer.speech_end_at
+    timings["endpoint"] = time.perf_counter()
+    yield "final", transcription.finish()
+
+# Live voice timing: end of speech until the LLM request goes out
+voice_turn_metrics = {"turns": 0, "last_speech_end_to_llm": None, "last_endpoint_to_llm": None,
+                      "total_endpoint_to_llm": 0.0}
+
+def record_voice_turn_timing(timings, trace=None):
+    """Record and report the end-of-speech to LLM-request gap of a live voice turn"""
+    speech_end_gap = timings["llm_request"] - timings["speech_end"]
+    endpoint_gap = timings["llm_request"] - timings["endpoint"]
+    trace = trace or tracer
+    trace.observe("capture", timings["endpoint"] - timings["capture_start"])
+    trace.observe("endpointing", timings["endpoint"] - timings["speech_end"])
+    trace.observe("stt", endpoint_gap)
+    voice_turn_metrics["turns"] += 1
+    voice_turn_metrics["last_speech_end_to_llm"] = speech_end_gap
+    voice_turn_metrics["last_endpoint_to_llm"] = endpoint_gap
+    voice_turn_metrics["total_endpoint_to_llm"] += endpoint_gap
+    print(f"⏱️ End of speech → LLM request: {speech_end_gap * 1000:.0f} ms "
+          f"(end-pointing {(timings['endpoint'] - timings['speech_end']) * 1000:.0f} ms, "
+          f"final transcript {endpoint_gap * 1000:.0f} ms)")
+
+def get_voice_turn_metrics():
+    """Snapshot of the live voice timing, including the average end-point to LLM gap"""
+    snapshot = dict(voice_turn_metrics)
+    turns = snapshot["turns"]
+    snapshot["avg_endpoint_to_llm"] = snapshot["total_endpoint_to_llm"] / turns if turns else None
+    return snapshot
+
+# Cost and benefit of speculation: hits reuse the prefetched reply, wasted requests were thrown away
+speculation_metrics = {"started": 0, "hits": 0, "misses": 0, "wasted": 0, "head_start": 0.0}
+
+def normalize_transcript(text):
+    """Lowercase words only, so punctuation and casing changes do not count as differences"""
+    return " ".join(re.findall(r"[\w']+", text.lower()))
+
+def transcripts_match(partial, final, threshold=SPECULATION_MATCH):
+    """Whether the final transcript is close enough to the partial that the prefetched reply still fits"""
+    return difflib.SequenceMatcher(None, normalize_transcript(partial), normalize_transcript(final)).ratio() >= threshold
+
+class Speculation:
+    """An LLM reply streamed in the background from a partial transcript, buffered until it is claimed"""
+
+    def __init__(self, text, messages, temperature, max_tokens):
+        self.text = text
+        self.started = time.perf_counter()
+        self.deltas = []
+        self.done = False
+        self.cancelled = False
+        self.condition = threading.Condition()
+        threading.Thread(target=self._run, args=(messages, temperature, max_tokens), daemon=True).start()
+
+    def _run(self, messages, temperature, max_tokens):
+        stream = stream_openrouter(messages, temperature, max_tokens)
+        try:
+            for delta in stream:
+                with self.condition:
+                    if self.cancelled:
+                        break
+                    self.deltas.append(delta)
+                    self.condition.notify_all()
+        finally:
+            stream.close()  # Closes the HTTP response when cancelled mid-stream
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def cancel(self):
+        with self.condition:
+            self.cancelled = True
+            self.condition.notify_all()
+
+    def stream(self):
+        """Yield the deltas received so far, then the rest as they arrive"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.deltas) and not self.done:
+                    self.condition.wait()
+                pending = self.deltas[index:]
+                index = len(self.deltas)
+                if not pending and self.done:
+                    return
+            yield from pending
+
+class Speculator:
+    """Starts a Speculation once the partial transcript has been stable for a while"""
+
+    def __init__(self, chat_history, temperature, max_tokens, stable_ms=SPECULATION_STABLE_MS):
+        self.chat_history = chat_history
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.stable = stable_ms / 1000
+        self.speculation = None
+        self.timer = None
+        self.finished = False
+        self.lock = threading.Lock()  # Speculative and final message builds never overlap
+
+    def update(self, partial):
+        """A new partial transcript arrived: restart the stability timer"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if self.speculation is not None and not transcripts_match(self.speculation.text, partial):
+                self._discard()
+            if len(partial.split()) >= SPECULATION_MIN_WORDS and self.speculation is None:
+                self.timer = threading.Timer(self.stable, self._launch, args=(partial,))
+                self.timer.daemon = True
+                self.timer.start()
+
+    def finish(self, final):
+        """Final transcript is in: return the speculation if it still fits, else discard it"""
+        with self.lock:
+            self.finished = True
+            if self.timer is not None:
+                self.timer.cancel()
+            speculation = self.speculation
+            if speculation is None:
+                return None
+            if transcripts_match(speculation.text, final):
+                speculation_metrics["hits"] += 1
+                speculation_metrics["head_start"] += time.perf_counter() - speculation.started
+                return speculation
+            speculation_metrics["misses"] += 1
+            self._discard()
+            return None
+
+    def _launch(self, partial):
+        with self.lock:
+            if self.finished or self.speculation is not None:
+                return
+            if LOCAL_ROUTING and score_turn(partial, self.chat_history)[0] >= ROUTER_THRESHOLD:
+                return  # Will be answered locally anyway
+            messages = build_messages(partial, self.chat_history)
+            self.speculation = Speculation(partial, messages, self.temperature, self.max_tokens)
+            speculation_metrics["started"] += 1
+
+    def _discard(self):
+        self.speculation.cancel()
+        self.speculation = None
+        speculation_metrics["wasted"] += 1
+
+def get_speculation_metrics():
+    """Snapshot of speculation counters with hit rate and average head start"""
+    snapshot = dict(speculation_metrics)
+    decided = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = snapshot["hits"] / decided if decided else None
+    snapshot["avg_head_start"] = snapshot["head_start"] / snapshot["hits"] if snapshot["hits"] else None
+    return snapshot
+
+def handle_live_voice(chat_history, temperature, voice_speed, max_tokens):
+    """Live voice input: show partial transcripts while the user speaks and reply at end of speech"""
+    interrupt_speech()  # Barge-in: stop talking while the user speaks
+    timings = {}
+    text = ""
+    error = None
+    speculator = Speculator(chat_history, temperature, max_tokens) if SPECULATIVE_PREFETCH else None
+    try:
+        for kind, text in listen_streaming(timings):
+            if kind == "partial":
+                if speculator is not None:
+                    speculator.update(text)
+                yield chat_history, f"🎙️ {text}…"
+    except sr.UnknownValueError:
+        text = ""
+    except sr.WaitTimeoutError:
+        error = "No speech detected"
+    except sr.RequestError as e:
+        error = f"Speech recognition error: {e}"
+    except Exception as e:
+        error = f"Recording error: {e}"
+    if error is None and not text.strip():
+        error = "Could not understand audio"
+
+    # Keep the prefetched reply if the final transcript still matches what it was asked from
+    prefetched = speculator.finish(text if error is None else "") if speculator is not None else None
+    if error is not None:
+        chat_history.append(("🎙️ Live voice", f"⚠️ {error}"))
+        yield chat_history, ""
+        return
+
+    trace = tracer.start_turn("live")
+    trace.started = timings["capture_start"]
+    timings["llm_request"] = time.perf_counter()
+    record_voice_turn_timing(timings, trace)
+    if prefetched is not None:
+        trace.observe("speculation_head_start", timings["llm_request"] - prefetched.started)
+    try:
+        if prefetched is not None:
+            updates = handle_input_stream(text, chat_history, temperature, voice_speed, max_tokens,
+                                          trace=trace, prefetched=prefetched)
+            if STREAM_RESPONSES:
+                yield from updates
+            else:
+                yield deque(updates, maxlen=1)[0]
+        elif STREAM_RESPONSES:
+            yield from handle_input_stream(text, chat_history, temperature, voice_speed, max_tokens, trace=trace)
+        else:
+            yield handle_input(text, chat_history, temperature, voice_speed, max_tokens, trace=trace)
+    finally:
+        trace.finish()
+
+def listen_microphone(timeout=1, phrase_time_limit=5):
+    """Capture one phrase from the microphone as sr.AudioData"""
+    recognizer = sr.Recognizer()  # Adapts its threshold while listening, so one per capture
+    with microphone_source() as source:
+        print("🎤 Listening... Speak now!")
+        noise_calibrator.apply(recognizer, source, skipped=0.5)
+        audio = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        noise_calibrator.update(recognizer)
+    print("🔄 Processing speech...")
+    return audio
+
+# 🎛️ Audio ingestion: decode → resample → VAD trim → transcribe, shared by every audio path
+TRIM_SILENCE = os.environ.get("TRIM_SILENCE", "1") != "0"
+TRIM_PADDING_MS = 150      # Audio kept either side of the detected speech
+NORMALIZE_GAIN = os.environ.get("NORMALIZE_GAIN", "1") != "0"
+NORMALIZE_HEADROOM_DB = 1.0    # Peak level after normalization, in dB below full scale
+
+# Per-stage timing of audio turns
+audio_pipeline_metrics = {"turns": 0, "errors": 0, "audio_seconds": 0.0, "trimmed_seconds": 0.0, "stages": {}}
+
+def audio_seconds(audio):
+    """Duration of sr.AudioData in seconds"""
+    return len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+
+class TranscriptionResult:
+    """Outcome of one audio turn: the transcript or a user-facing error, with per-stage timings"""
+
+    def __init__(self, text="", error=None, timings=None):
+        self.text = text
+        self.error = error
+        self.timings = timings if timings is not None else {}
+        self.duration = 0.0    # Seconds of audio received
+        self.trimmed = 0.0     # Seconds of silence cut before STT
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f"TranscriptionResult(text={self.text!r}, error={self.error!r})"
+
+class AudioPipeline:
+    """One path from an uploaded file, a recording or a microphone capture to a transcript"""
+
+    def __init__(self, backend=None, trim=TRIM_SILENCE, normalize=NORMALIZE_GAIN, padding_ms=TRIM_PADDING_MS,
+                 verbose=True):
+        self.backend = backend
+        self.trim_silence = trim
+        self.normalize_gain = normalize
+        self.padding_ms = padding_ms
+        self.verbose = verbose
+        self._recognizer = None
+
+    @property
+    def recognizer(self):
+        """Recognizer shared by every file read (created on first use)"""
+        if self._recognizer is None:
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+
+    def decode(self, file_path):
+        """Read an upload into mono sr.AudioData in memory (pydub also reads MP3/M4A/WebM via ffmpeg)"""
+        if pydub.available:
+            # API uploads are file objects with no extension to tell pydub they are WAV
+            wav = isinstance(file_path, io.BytesIO) and file_path.getvalue()[:4] == b"RIFF"
+            segment = pydub.AudioSegment.from_file(file_path, format="wav" if wav else None).set_channels(1)
+            return sr.AudioData(segment.raw_data, segment.frame_rate, segment.sample_width)
+        with sr.AudioFile(file_path) as source:
+            return self.recognizer.record(source)
+
+    def resample(self, audio):
+        """Convert to 16 kHz 16-bit, the format every backend decodes"""
+        if audio.sample_rate == STT_SAMPLE_RATE and audio.sample_width == 2:
+            return audio
+        return sr.AudioData(audio.get_raw_data(convert_rate=STT_SAMPLE_RATE, convert_width=2), STT_SAMPLE_RATE, 2)
+
+    def normalize(self, audio):
+        """Scale the gain so the loudest sample peaks NORMALIZE_HEADROOM_DB below full scale"""
+        audio = self.resample(audio)  # 16-bit from here on
+        samples = pcm_samples(audio.frame_data)
+        peak = max(max(samples, default=0), -min(samples, default=0))
+        if not peak:
+            return audio
+        factor = 32767 * 10 ** (-NORMALIZE_HEADROOM_DB / 20) / peak
+        # The headroom keeps every scaled sample in range, so no clipping pass is needed
+        scaled = array.array("h", [math.floor(sample * factor) for sample in samples])
+        return sr.AudioData(pcm_bytes(scaled), audio.sample_rate, 2)
+
+    def trim(self, audio, vad=None):
+        """Cut leading and trailing silence so STT receives (and uploads) less audio"""
+        vad = vad or VoiceActivityDetector(energy_threshold=self.recognizer.energy_threshold)
+        raw = audio.frame_data
+        frame_bytes = audio.sample_rate * VAD_FRAME_MS // 1000 * audio.sample_width
+        frames = range(0, len(raw) - frame_bytes + 1, frame_bytes)
+        first = next((i for i in frames if vad.is_speech(raw[i:i + frame_bytes])), None)
+        if first is None:
+            return audio  # Nothing clearly above the noise floor - let STT decide
+        last = next(i for i in reversed(frames) if vad.is_speech(raw[i:i + frame_bytes]))
+        padding = self.padding_ms // VAD_FRAME_MS * frame_bytes
+        return sr.AudioData(raw[max(0, first - padding):last + frame_bytes + padding],
+                            audio.sample_rate, audio.sample_width)
+
+    def transcribe(self, audio):
+        """Transcribe with this pipeline's backend, or the configured one"""
+        return (self.backend or get_stt_backend()).transcribe(audio)
+
+    def process(self, file_path=None, audio=None, capture=None, trace=None):
+        """Run every stage on a file, AudioData or capture() callable; errors come back in the result"""
+        result = TranscriptionResult()
+        try:
+            if capture is not None:
+                audio = self._timed(result, "capture", capture)
+            elif audio is None:
+                audio = self._timed(result, "decode", self.decode, file_path)
+            audio = self._timed(result, "resample", self.resample, audio)
+            result.duration = audio_seconds(audio)
+            if self.normalize_gain:
+                # Before trimming, so quiet speech still clears the VAD threshold
+                audio = self._timed(result, "normalize", self.normalize, audio)
+            if self.trim_silence:
+                audio = self._timed(result, "trim", self.trim, audio)
+                result.trimmed = result.duration - audio_seconds(audio)
+            result.text = self._timed(result, "stt", self.transcribe, audio).strip()
+            if not result.text:
+                result.error = "No speech detected"
+        except sr.UnknownValueError:
+            result.error = "Could not understand audio"
+        except sr.RequestError as e:
+            result.error = f"Speech recognition error: {e}"
+        except sr.WaitTimeoutError:
+            result.error = "No speech detected"
+        except Exception as e:
+            result.error = f"Audio processing error: {e}"
+        record_audio_turn(result, trace, verbose=self.verbose)
+        return result
+
+    @staticmethod
+    def _timed(result, stage, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            result.timings[stage] = time.perf_counter() - started
+
+def record_audio_turn(result, trace=None, verbose=True):
+    """Add one audio turn to the per-stage metrics and report where its time went"""
+    audio_pipeline_metrics["turns"] += 1
+    audio_pipeline_metrics["errors"] += not result.ok
+    audio_pipeline_metrics["audio_seconds"] += result.duration
+    audio_pipeline_metrics["trimmed_seconds"] += result.trimmed
+    for stage, elapsed in result.timings.items():
+        audio_pipeline_metrics["stages"][stage] = audio_pipeline_metrics["stages"].get(stage, 0.0) + elapsed
+        (trace or tracer).observe(stage, elapsed)
+    if verbose:
+        stages = ", ".join(f"{stage} {elapsed * 1000:.0f} ms" for stage, elapsed in result.timings.items())
+        print(f"⏱️ Audio turn: {stages} (trimmed {result.trimmed:.1f}s of {result.duration:.1f}s)")
+
+def get_audio_pipeline_metrics():
+    """Snapshot of the audio pipeline counters with the average time per stage"""
+    snapshot = dict(audio_pipeline_metrics)
+    turns = snapshot["turns"]
+    snapshot["avg_stage_time"] = {stage: total / turns for stage, total in snapshot["stages"].items()} if turns else {}
+    return snapshot
+
+audio_pipeline = AudioPipeline()
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) without a tokenizer"""
+    return len(text) // 4 + 1
+
+def first_sentence(text, limit=100):
+    """First sentence of a text, cut to a length limit"""
+    sentence = split_sentences(text)[:1]
+    sentence = sentence[0] if sentence else ""
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "…"
+
+class ConversationContext:
+    """Incremental token accounting for a chat history, trimmed to a budget with a rolling summary"""
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, summarize=CONTEXT_SUMMARY):
+        self.budget = budget
+        self.summarize = summarize
+        self.reset()
+
+    def reset(self):
+        self.counted = 0             # History turns already counted
+        self.start = 0               # First history turn still inside the window
+        self.turn_tokens = deque()   # Token estimate of each turn inside the window
+        self.window_tokens = 0
+        self.summary_lines = deque()
+        self.summary_chars = 0
+
+    @property
+    def summary(self):
+        return " ".join(self.summary_lines)
+
+    def sync(self, chat_history):
+        """Count only the turns added since the last call"""
+        if len(chat_history) < self.counted:
+            self.reset()  # History was cleared or replaced
+        for user_msg, assistant_msg in chat_history[self.counted:]:
+            tokens = estimate_tokens(user_msg) + estimate_tokens(assistant_msg) + 8
+            self.turn_tokens.append(tokens)
+            self.window_tokens += tokens
+        self.counted = len(chat_history)
+
+    def build_messages(self, user_input, chat_history):
+        """Build the message list, dropping (and summarizing) the oldest turns that exceed the budget"""
+        self.sync(chat_history)
+        budget = self.budget - estimate_tokens(SYSTEM_PROMPT) - estimate_tokens(user_input)
+        while self.turn_tokens and self.window_tokens + estimate_tokens(self.summary) > budget:
+            self.window_tokens -= self.turn_tokens.popleft()
+            if self.summarize:
+                self._fold(*chat_history[self.start])
+            self.start += 1
+
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if self.summary_lines:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        for user_msg, assistant_msg in chat_history[self.start:]:
+            messages.append({"role": "user", "content": user_msg})
+            messages.append({"role": "assistant", "content": assistant_msg})
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def forget(self, chat_history, count):
+        """The first `count` turns are leaving memory: summarize those still in the window, then shift the indices"""
+        self.sync(chat_history)
+        while self.start < count:
+            self.window_tokens -= self.turn_tokens.popleft()
+            if self.summarize:
+                self._fold(*chat_history[self.start])
+            self.start += 1
+        self.start -= count
+        self.counted -= count
+
+    def _fold(self, user_msg, assistant_msg):
+        # Keep one short line per trimmed turn, dropping the oldest lines past the cap
+        line = f"User: {first_sentence(user_msg)} Assistant: {first_sentence(assistant_msg)}"
+        self.summary_lines.append(line)
+        self.summary_chars += len(line) + 1
+        while self.summary_chars > SUMMARY_MAX_CHARS and len(self.summary_lines) > 1:
+            self.summary_chars -= len(self.summary_lines.popleft()) + 1
+
+class SessionStore:
+    """Append-only SQLite journal of conversation turns, resumed by reading just the last few"""
+
+    def __init__(self, path=SESSION_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL: appends don't block readers, and a crash loses at most the turn being written
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # Clustered on (session, seq), so a tail read touches only the pages of that tail
+        self.db.execute("CREATE TABLE IF NOT EXISTS turns (session TEXT NOT NULL, seq INTEGER NOT NULL, "
+                        "user TEXT NOT NULL, assistant TEXT NOT NULL, created REAL NOT NULL, "
+                        "PRIMARY KEY (session, seq)) WITHOUT ROWID")
+        # Untyped value column: replies come back as str, speech clips as bytes
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value, expires REAL NOT NULL) "
+                        "WITHOUT ROWID")
+        self.puts = 0
+
+    def append(self, session_id, first_seq, turns):
+        """Write turns numbered from first_seq (turns already written are left as they are)"""
+        now = time.time()
+        rows = [(session_id, first_seq + i, user, assistant, now) for i, (user, assistant) in enumerate(turns)]
+        started = time.perf_counter()
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO turns VALUES (?, ?, ?, ?, ?)", rows)
+        record_session_append(len(rows), started)
+
+    def tail(self, session_id, count):
+        """The last `count` turns of a session, oldest first, and how many turns it has in all"""
+        with self.lock:
+            rows = self.db.execute("SELECT seq, user, assistant FROM turns WHERE session = ? "
+                                   "ORDER BY seq DESC LIMIT ?", (session_id, count)).fetchall()
+        rows.reverse()
+        return [(user, assistant) for _, user, assistant in rows], rows[-1][0] + 1 if rows else 0
+
+    def cache_get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM cache WHERE key = ? AND expires > ?",
+                                  (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def cache_put(self, key, value, ttl):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+            self.puts += 1
+            if self.puts % 1000 == 0:
+                self.db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class RedisSessionStore:
+    """SessionStore on Redis (one list per session), for workers spread over several machines"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(f"SESSION_DB={url} needs the redis package (pip install redis)") from None
+        self.redis = redis
+        self.client = redis.Redis.from_url(url)
+
+    def append(self, session_id, first_seq, turns):
+        """Write turns numbered from first_seq (turns already written are left as they are)"""
+        key = f"alpha:session:{session_id}"
+        started = time.perf_counter()
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    new = turns[max(0, pipe.llen(key) - first_seq):]
+                    pipe.multi()
+                    if new:
+                        pipe.rpush(key, *(json.dumps(turn) for turn in new))
+                    pipe.execute()
+                    break
+                except self.redis.WatchError:
+                    continue  # Another worker appended in between; look again
+        record_session_append(len(turns), started)
+
+    def tail(self, session_id, count):
+        """The last `count` turns of a session, oldest first, and how many turns it has in all"""
+        key = f"alpha:session:{session_id}"
+        with self.client.pipeline() as pipe:
+            total, rows = pipe.llen(key).lrange(key, -count, -1).execute()
+        return [tuple(json.loads(row)) for row in rows], total
+
+    def cache_get(self, key):
+        value = self.client.get(f"alpha:cache:{key}")
+        if value is None:
+            return None
+        # One tag byte tells replies (str) from speech clips (bytes)
+        return value[1:].decode("utf-8") if value[:1] == b"s" else value[1:]
+
+    def cache_put(self, key, value, ttl):
+        data = b"s" + value.encode("utf-8") if isinstance(value, str) else b"b" + value
+        self.client.set(f"alpha:cache:{key}", data, ex=max(1, int(ttl)))
+
+    def close(self):
+        self.client.close()
+
+# Turns written and sessions resumed (with the time each took)
+session_metrics = {"appends": 0, "turns_saved": 0, "append_time": 0.0, "resumes": 0, "resumed_turns": 0,
+                   "resume_time": 0.0, "forgotten_turns": 0}
+
+def record_session_append(turns, started):
+    session_metrics["appends"] += 1
+    session_metrics["turns_saved"] += turns
+    session_metrics["append_time"] += time.perf_counter() - started
+
+def open_session_store(location):
+    """SessionStore for a SQLite path, or RedisSessionStore for a redis:// URL"""
+    if location.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(location)
+    return SessionStore(location)
+
+session_store = None
+session_store_lock = threading.Lock()
+
+def get_session_store():
+    """Shared session store, opened on first use (None when SESSION_DB is empty)"""
+    global session_store
+    with session_store_lock:
+        if session_store is None and SESSION_DB:
+            session_store = open_session_store(SESSION_DB)
+        return session_store
+
+def get_session_metrics():
+    """Session store counters with the average append and resume time"""
+    snapshot = dict(session_metrics)
+    snapshot["avg_append_time"] = snapshot["append_time"] / snapshot["appends"] if snapshot["appends"] else None
+    snapshot["avg_resume_time"] = snapshot["resume_time"] / snapshot["resumes"] if snapshot["resumes"] else None
+    return snapshot
+
+def new_session_id():
+    return uuid.uuid4().hex[:16]
+
+class ChatHistory(list):
+    """Chat history of (user, assistant) tuples that carries its own context accounting
+
+    With a session_id, finished turns are appended to the session store by save() and only the last
+    SESSION_WINDOW of them are kept; `offset` counts the turns of the session before the first one held.
+    Turns passed in are taken as already saved.
+    """
+
+    def __init__(self, *args, session_id=None, offset=0):
+        super().__init__(*args)
+        self.context = ConversationContext()
+        self.session_id = session_id
+        self.offset = offset
+        self.saved = len(self)
 
-def validate_api_key():
-    """Validate the OpenRouter API key"""
-    if not API_KEY or API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
-        return False, "API key not configured"
-    
-    # Check if the key looks valid (basic format check)
-    if not API_KEY.startswith("sk-or-v1-"):
-        return False, "Invalid API key format"
-    
-    return True, "API key format looks valid"
+    @classmethod
+    def resume(cls, session_id, window=SESSION_WINDOW, store=None):
+        """A session's last `window` turns, read from the store without loading the rest"""
+        store = store or get_session_store()
+        started = time.perf_counter()
+        turns, total = store.tail(session_id, window) if store else ([], 0)
+        session_metrics["resumes"] += 1
+        session_metrics["resumed_turns"] += len(turns)
+        session_metrics["resume_time"] += time.perf_counter() - started
+        return cls(turns, session_id=session_id, offset=total - len(turns))
 
-def get_api_status():
-    """Get current API status and suggestions"""
-    is_valid, message = validate_api_key()
-    
-    if not is_valid:
-        return {
-            "status": "invalid",
-            "message": message,
-            "suggestion": "Please check your OpenRouter API key configuration"
-        }
-    
-    return {
-        "status": "configured", 
-        "message": "API key configured",
-        "suggestion": "If you're getting 401 errors, your API key may be expired or have insufficient credits"
-    }
+    @property
+    def total_turns(self):
+        return self.offset + len(self)
 
-def query_openrouter(messages, temperature=0.7, max_tokens=1024):
-    """Query the OpenRouter API with the given messages, fallback to demo mode if API fails"""
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": MODEL,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-        "stream": False
-    }
-    try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions",
-                                headers=headers, data=json.dumps(data))
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
-        # Check if it's an API key issue (401 Unauthorized)
-        if "401" in str(e) or "Unauthorized" in str(e):
-            print("⚠️ API Key issue detected - switching to demo mode")
-            # Extract user input from the last message
-            user_input = messages[-1]["content"] if messages else ""
-            return f"🔄 API temporarily unavailable. Demo response: {demo_response(user_input)}"
-        return f"⚠️ API connection error: {str(e)}. Switching to offline mode."
-    except Exception as e:
-        print(f"⚠️ Unexpected API error: {str(e)} - using demo mode")
-        user_input = messages[-1]["content"] if messages else ""
-        return demo_response(user_input)
+    def save(self, window=SESSION_WINDOW, store=None):
+        """Append the turns finished since the last save to the store, then drop those beyond the window"""
+        store = store or get_session_store()
+        if self.session_id is None or store is None:
+            return
+        if self.saved < len(self):
+            store.append(self.session_id, self.offset + self.saved, self[self.saved:])
+            self.saved = len(self)
+        extra = len(self) - window
+        if extra > 0:
+            self.context.forget(self, extra)
+            del self[:extra]
+            self.offset += extra
+            self.saved -= extra
+            session_metrics["forgotten_turns"] += extra
 
-def demo_response(user_input):
-    """Provide demo responses when API key is not configured"""
-    import random
-    
-    user_lower = user_input.lower().strip()
-    
-    # Math operations
-    if "2+2" in user_lower or "2 + 2" in user_lower:
-        return "2 + 2 = 4. That's basic math! 😊"
-    
-    # Simple questions and responses
-    responses = {
-        "hello": "Hello! I'm your Alpha Voice Bot. How can I help you today?",
-        "hi": "Hi there! Nice to meet you. What would you like to talk about?",
-        "how are you": "I'm doing great! Thanks for asking. How are you doing?",
-        "what is your name": "I'm Alpha Voice Bot, your AI assistant. What's your name?",
-        "goodbye": "Goodbye! Have a wonderful day!",
-        "bye": "See you later! Take care!",
-        "help": "I can help you with conversations, questions, math problems, and more! Try asking me anything.",
-        "test": "Test successful! Voice recognition and chat are working perfectly!",
-        "thank you": "You're very welcome! Happy to help.",
-        "thanks": "No problem! Glad I could assist.",
-        "who are you": "I'm Alpha Voice Bot, an AI assistant that can chat with you via text or voice.",
-        "what can you do": "I can have conversations, answer questions, solve problems, tell jokes, and help with various tasks!",
-        "joke": "Why don't scientists trust atoms? Because they make up everything! 😄",
-        "tell me a joke": "What do you call a bear with no teeth? A gummy bear! 🐻",
-        "weather": "I don't have access to current weather data, but I hope it's nice where you are!",
-        "time": "I don't have access to the current time, but I hope you're having a good day!",
-        "how old are you": "I'm a digital AI, so I don't age like humans do. But I'm here to help!",
-        "where are you from": "I exist in the digital realm, but I'm happy to chat with you from anywhere!",
-        "who is the prime minister": "I'd need access to current political information to tell you who the current Prime Minister is. This depends on which country you're asking about!",
-    }
-    
-    # Check for keyword matches
-    for key, response in responses.items():
-        if key in user_lower:
-            return response
-    
-    # Handle questions
-    if "?" in user_input:
-        question_responses = [
-            f"That's an interesting question about '{user_input}'. While I can give basic responses, I'd love to provide more detailed answers with a proper AI connection!",
-            f"You asked: '{user_input}' - I can try to help with simple responses, but for detailed assistance, I'd need a full AI connection.",
-            f"Great question! I can provide basic responses to '{user_input}', but for comprehensive answers, an AI API would be helpful.",
-        ]
-        return random.choice(question_responses)
-    
-    # Default responses
-    friendly_replies = [
-        f"You said: '{user_input}'. I heard you clearly! I can provide basic responses and conversation.",
-        f"I understand you mentioned: '{user_input}'. I'm working in basic mode but can still chat with you!",
-        f"Thanks for saying: '{user_input}'. I can respond to simple conversations and questions!",
-        f"You shared: '{user_input}'. I'm here to chat, even in basic mode!",
-        f"I got your message: '{user_input}'. While I can give simple responses, I'm still happy to talk with you!",
-    ]
-    
-    return random.choice(friendly_replies)
+def saving_turns(handler):
+    """Wrap an event handler so the conversations it updated are saved once it finishes"""
+    def save(args):
+        for arg in args:
+            if isinstance(arg, ChatHistory):
+                arg.save()
 
-def speak_text(text, speed=1.0):
-    """Convert text to speech using pyttsx3 with adjustable speed"""
-    def tts_thread():
+    if inspect.isasyncgenfunction(handler):
+        @functools.wraps(handler)
+        async def saving_handler(*args, **kwargs):
+            try:
+                async for update in handler(*args, **kwargs):
+                    yield update
+            finally:
+                # A save is a database write: keep it off the event loop
+                await asyncio.to_thread(save, args)
+        return saving_handler
+
+    @functools.wraps(handler)
+    def saving_handler(*args, **kwargs):
         try:
-            engine = pyttsx3.init()
-            engine.setProperty('rate', int(200 * speed))  # Adjust speech rate
-            engine.say(text)
-            engine.runAndWait()
-        except Exception as e:
-            print(f"Speech synthesis error: {e}")
-    
-    # Run TTS in background thread to avoid blocking
-    threading.Thread(target=tts_thread, daemon=True).start()
+            result = handler(*args, **kwargs)
+            if inspect.isgenerator(result):
+                yield from result
+            else:
+                yield result
+        finally:
+            save(args)
+    return saving_handler
 
-def transcribe_audio(file_path):
-    """Transcribe audio file to text using Google Speech Recognition"""
-    recognizer = sr.Recognizer()
-    try:
-        with sr.AudioFile(file_path) as source:
-            audio = recognizer.record(source)
-        return recognizer.recognize_google(audio)
-    except sr.UnknownValueError:
-        return "Could not understand audio"
-    except sr.RequestError as e:
-        return f"Speech recognition error: {e}"
+def build_messages(user_input, chat_history):
+    """Build the OpenRouter message list from the chat history"""
+    context = getattr(chat_history, "context", None) or ConversationContext()
+    return context.build_messages(user_input, chat_history)
 
-def handle_audio_input(audio_file, chat_history, temperature, voice_speed, max_tokens):
-    """Handle audio input from Gradio's audio component"""
-    if audio_file is None:
-        return chat_history, ""
-    
-    try:
-        # Transcribe the audio file
-        text = transcribe_audio(audio_file)
-        
-        if text and not text.startswith("Could not") and not text.startswith("Speech recognition error"):
-            # Process the transcribed text
-            result = handle_input(text, chat_history, temperature, voice_speed, max_tokens)
-            return result[0], result[1]
-        else:
-            # Add error message to chat
-            chat_history.append(("🎤 Voice Input", f"⚠️ {text}"))
-            return chat_history, ""
-    except Exception as e:
-        chat_history.append(("🎤 Voice Input", f"⚠️ Audio processing error: {str(e)}"))
-        return chat_history, ""
+class TextTurn:
+    """The steps every text turn shares, whichever handler drives it (blocking, threaded stream or asyncio)
 
-def record_microphone():
-    """Record audio from microphone with stop control"""
-    recognizer = sr.Recognizer()
-    try:
-        with sr.Microphone() as source:
-            print("🎤 Recording... Speak now!")
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            # Record with a reasonable timeout
-            audio = recognizer.listen(source, timeout=2, phrase_time_limit=10)
-        print("🔄 Processing speech...")
-        return recognizer.recognize_google(audio)
-    except sr.UnknownValueError:
-        return "Could not understand audio"
-    except sr.RequestError as e:
-        return f"Speech recognition error: {e}"
-    except sr.WaitTimeoutError:
-        return "No speech detected - please try again"
+    Routes the input (a local answer, or the trimmed conversation for the AI), adds the turn to the history,
+    speaks the reply sentence by sentence as it grows, and closes the trace. Handlers only fetch the reply.
+    Conversations are saved by saving_turns around the UI handlers and by the API after each turn.
+    """
 
-def quick_record():
-    """Quick voice recording with shorter timeout"""
-    recognizer = sr.Recognizer()
-    try:
-        with sr.Microphone() as source:
-            print("⚡ Quick recording... Speak now!")
-            recognizer.adjust_for_ambient_noise(source, duration=0.2)
-            audio = recognizer.listen(source, timeout=1, phrase_time_limit=5)
-        print("🔄 Processing speech...")
-        return recognizer.recognize_google(audio)
-    except sr.UnknownValueError:
-        return "Could not understand audio"
-    except sr.RequestError as e:
-        return f"Speech recognition error: {e}"
-    except sr.WaitTimeoutError:
-        return "No speech detected"
-    except Exception as e:
-        return f"Recording error: {e}"
+    def __init__(self, user_input, chat_history, voice_speed, trace=None, speak=True, route=True):
+        self.user_input = user_input
+        self.chat_history = chat_history
+        self.trace = trace or tracer.start_turn("text")
+        self.owns_trace = trace is None
+        self.started = time.perf_counter()
+        # Answer trivial turns locally, otherwise ask the AI with the conversation history
+        self.local = route_turn(user_input, chat_history) if route else None
+        self.messages = None
+        if self.local is None and route:
+            with self.trace.span("prompt_build"):
+                self.messages = build_messages(user_input, chat_history)
+        # Show the user turn right away; the reply grows into it
+        chat_history.append((user_input, ""))
+        # API clients that only want text get no speech at all
+        self.speech = SpeechPipeline(voice_speed, trace=self.trace) if speak else None
+        self.reply = ""
 
-# Global variables for recording
-recording_active = False
-recorded_audio = None
-recording_thread = None
+    def add(self, delta):
+        """Grow the reply, speaking each sentence as soon as it is complete"""
+        self.reply += delta
+        if self.speech:
+            self.speech.feed(delta)
+        self.chat_history[-1] = (self.user_input, self.reply)
 
-def record_audio_thread():
-    """Background thread for recording audio"""
-    global recorded_audio, recording_active
-    recognizer = sr.Recognizer()
-    try:
-        with sr.Microphone() as source:
-            print("🎤 Background recording started...")
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            while recording_active:
-                try:
-                    audio = recognizer.listen(source, timeout=0.5, phrase_time_limit=None)
-                    recorded_audio = audio
-                    break
-                except sr.WaitTimeoutError:
-                    continue
-    except Exception as e:
-        print(f"Recording thread error: {e}")
-        recorded_audio = None
+    def close(self):
+        """Speak the last sentence and close the trace, however the turn ended"""
+        if self.speech:
+            self.speech.close()
+        if self.owns_trace:
+            self.trace.finish()
 
-def start_recording():
-    """Start recording audio in background"""
-    global recording_active, recorded_audio, recording_thread
-    recording_active = True
-    recorded_audio = None
-    
-    # Start recording in background thread
-    recording_thread = threading.Thread(target=record_audio_thread, daemon=True)
-    recording_thread.start()
-    
-    return "🎤 Recording... Speak now!", gr.update(visible=False), gr.update(visible=True)
+    def finish(self):
+        """Count a completed AI turn's latency"""
+        if self.local is None:
+            record_route("llm", time.perf_counter() - self.started)
 
-def stop_recording_and_process(chat_history, temperature, voice_speed, max_tokens):
-    """Stop recording and process the audio"""
-    global recording_active, recorded_audio
-    recording_active = False
-    
-    # Wait a moment for recording to stop
-    time.sleep(0.5)
-    
+def handle_input(user_input, chat_history, temperature, voice_speed, max_tokens, trace=None):
+    """Handle text input and generate response"""
+    if not user_input:
+        return chat_history, ""
+
+    turn = TextTurn(user_input, chat_history, voice_speed, trace)
     try:
-        if recorded_audio is not None:
-            recognizer = sr.Recognizer()
-            text = recognizer.recognize_google(recorded_audio)
-            print(f"🔄 Recognized: {text}")
-            
-            if text and text.strip():
-                result = handle_input(text, chat_history, temperature, voice_speed, max_tokens)
-                return result[0], result[1], "🎤 Ready to record", gr.update(visible=True), gr.update(visible=False)
-            else:
-                chat_history.append(("🎤 Voice Recording", "⚠️ No speech detected"))
-                return chat_history, "", "🎤 Ready to record", gr.update(visible=True), gr.update(visible=False)
+        if turn.local is not None:
+            turn.add(turn.local)
         else:
-            chat_history.append(("🎤 Voice Recording", "⚠️ No audio recorded"))
-            return chat_history, "", "🎤 Ready to record", gr.update(visible=True), gr.update(visible=False)
-    except sr.UnknownValueError:
-        chat_history.append(("🎤 Voice Recording", "⚠️ Could not understand audio"))
-        return chat_history, "", "🎤 Ready to record", gr.update(visible=True), gr.update(visible=False)
-    except sr.RequestError as e:
-        chat_history.append(("🎤 Voice Recording", f"⚠️ Speech recognition error: {e}"))
-        return chat_history, "", "🎤 Ready to record", gr.update(visible=True), gr.update(visible=False)
-    except Exception as e:
-        chat_history.append(("🎤 Voice Recording", f"⚠️ Error: {str(e)}"))
-        return chat_history, "", "🎤 Ready to record", gr.update(visible=True), gr.update(visible=False)
+            turn.add(query_openrouter(turn.messages, temperature, max_tokens, trace=turn.trace))
+    finally:
+        turn.close()
+    turn.finish()
+    return chat_history, ""
 
-def record_microphone_simple():
-    """Simple microphone recording that starts immediately"""
-    recognizer = sr.Recognizer()
-    try:
-        with sr.Microphone() as source:
-            print("🎤 Listening... Speak now!")
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            audio = recognizer.listen(source, timeout=1, phrase_time_limit=5)
-        print("🔄 Processing speech...")
-        return recognizer.recognize_google(audio)
-    except sr.UnknownValueError:
-        return "Could not understand audio"
-    except sr.RequestError as e:
-        return f"Speech recognition error: {e}"
-    except sr.WaitTimeoutError:
-        return "No speech detected"
-    except Exception as e:
-        return f"Recording error: {e}"
+def handle_input_stream(user_input, chat_history, temperature, voice_speed, max_tokens, trace=None, prefetched=None):
+    """Handle text input and stream the response into the chat as it arrives"""
+    if not user_input:
+        yield chat_history, ""
+        return
 
-def handle_audio_input(audio_file, chat_history, temperature, voice_speed, max_tokens):
-    """Handle audio file input by transcribing and processing"""
-    if audio_file is None:
-        return chat_history, ""
-    
-    # Transcribe the audio file
-    transcription = transcribe_audio(audio_file)
-    
-    if transcription and "error" not in transcription.lower():
-        # Process the transcribed text
-        return handle_input(transcription, chat_history, temperature, voice_speed, max_tokens)
+    # A reply speculatively prefetched was already routed to the AI
+    turn = TextTurn(user_input, chat_history, voice_speed, trace, route=prefetched is None)
+    if turn.local is not None:
+        deltas = [turn.local]
+    elif prefetched is not None:
+        deltas = prefetched.stream()
     else:
-        # Handle transcription error
-        chat_history.append(("🎤 Audio Input", f"⚠️ {transcription}"))
-        return chat_history, ""
+        deltas = stream_openrouter(turn.messages, temperature, max_tokens, trace=turn.trace)
+    try:
+        for delta in deltas:
+            turn.add(delta)
+            yield chat_history, ""
+    finally:
+        turn.close()
+    turn.finish()
+    yield chat_history, ""
 
-def handle_input(user_input, chat_history, temperature, voice_speed, max_tokens):
-    """Handle text input and generate response"""
+async def handle_input_async(user_input, chat_history, temperature, voice_speed, max_tokens, trace=None, speak=True):
+    """Async text turn: streams the reply without holding a worker thread while waiting on OpenRouter"""
     if not user_input:
-        return chat_history, ""
+        yield chat_history, ""
+        return
 
-    # Build conversation history  
-    messages = [{"role": "system", "content": "You are Alpha Voice Assistant, a helpful and intelligent AI assistant."}]
-    for user_msg, assistant_msg in chat_history:
-        messages.append({"role": "user", "content": user_msg})
-        messages.append({"role": "assistant", "content": assistant_msg})
-    messages.append({"role": "user", "content": user_input})
+    turn = TextTurn(user_input, chat_history, voice_speed, trace, speak=speak)
+    try:
+        if turn.local is not None:
+            turn.add(turn.local)
+        else:
+            async for delta in stream_openrouter_async(turn.messages, temperature, max_tokens, trace=turn.trace):
+                turn.add(delta)
+                if STREAM_RESPONSES:
+                    yield chat_history, ""
+    finally:
+        turn.close()
+    turn.finish()
+    yield chat_history, ""
 
-    # Get AI response
-    reply = query_openrouter(messages, temperature, max_tokens)
-    
-    # Add to chat history
-    chat_history.append((user_input, reply))
-    
-    # Speak the response in background thread
-    speak_text(reply, voice_speed)
-    
-    return chat_history, ""
+async def handle_audio_async(audio_file, chat_history, temperature, voice_speed, max_tokens):
+    """Async audio turn: transcription runs on a worker thread, the reply streams without one"""
+    if audio_file is None:
+        yield chat_history, ""
+        return
+
+    trace = tracer.start_turn("audio")
+    try:
+        result = await asyncio.to_thread(audio_pipeline.process, audio_file, trace=trace)
+        if result.ok:
+            async for update in handle_input_async(result.text, chat_history, temperature, voice_speed,
+                                                   max_tokens, trace=trace):
+                yield update
+        else:
+            chat_history.append(("🎙️ Audio Input", f"⚠️ {result.error}"))
+            yield chat_history, ""
+    finally:
+        trace.finish()
 
 def handle_audio(audio_file, chat_history, temperature, voice_speed, max_tokens):
     """Handle audio input and generate response"""
     if audio_file is None:
         return chat_history, ""
     
-    try:
-        transcribed = transcribe_audio(audio_file)
-        if transcribed and not transcribed.startswith("Could not") and not transcribed.startswith("Speech recognition error"):
-            return handle_input(transcribed, chat_history, temperature, voice_speed, max_tokens)
-        else:
-            chat_history.append(("🎙️ Audio Input", f"⚠️ {transcribed}"))
-            return chat_history, ""
-    except Exception as e:
-        chat_history.append(("🎙️ Audio Input", f"⚠️ Transcription error: {str(e)}"))
-        return chat_history, ""
+    trace = tracer.start_turn("audio")
+    result = audio_pipeline.process(audio_file, trace=trace)
+    if result.ok:
+        update = handle_input(result.text, chat_history, temperature, voice_speed, max_tokens, trace=trace)
+    else:
+        chat_history.append(("🎙️ Audio Input", f"⚠️ {result.error}"))
+        update = chat_history, ""
+    trace.finish()
+    return update
 
 def handle_microphone(chat_history, temperature, voice_speed, max_tokens):
     """Handle live microphone input"""
-    try:
-        text = record_microphone_simple()
-        if text and text not in ["Could not understand audio", "No speech detected"]:
-            return handle_input(text, chat_history, temperature, voice_speed, max_tokens)
-        else:
-            chat_history.append(("🎙️ Microphone input", f"⚠️ {text}"))
-            return chat_history, ""
-    except Exception as e:
-        chat_history.append(("🎙️ Microphone failed", f"⚠️ Error: {e}"))
-        return chat_history, ""
+    interrupt_speech()  # Barge-in: stop talking while the user speaks
+    trace = tracer.start_turn("microphone")
+    result = audio_pipeline.process(capture=listen_microphone, trace=trace)
+    if result.ok:
+        update = handle_input(result.text, chat_history, temperature, voice_speed, max_tokens, trace=trace)
+    else:
+        chat_history.append(("🎙️ Microphone input", f"⚠️ {result.error}"))
+        update = chat_history, ""
+    trace.finish()
+    return update
 
-def quick_response(message, chat_history, temperature, voice_speed, max_tokens):
+async def quick_response(message, chat_history, temperature, voice_speed, max_tokens):
     """Handle quick action buttons"""
-    return handle_input(message, chat_history, temperature, voice_speed, max_tokens)
+    async for update in handle_input_async(message, chat_history, temperature, voice_speed, max_tokens):
+        yield update
 
 def clear_chat():
-    """Clear the chat history"""
-    return []
+    """Clear the chat: a new session starts and the old one stays in the store"""
+    history = ChatHistory(session_id=new_session_id())
+    return history, history, history.session_id, ""
+
+def start_session(request: gr.Request = None):
+    """A browser's conversation: the one named by ?session= in the page URL, or a new one"""
+    session_id = request.query_params.get("session") if request is not None else None
+    if session_id:
+        return resume_session(session_id, None)
+    return clear_chat()
+
+def resume_session(session_id, chat_history):
+    """Pick a saved conversation up where it stopped, loading only its last SESSION_WINDOW turns"""
+    session_id = (session_id or "").strip()
+    store = get_session_store()
+    history = ChatHistory.resume(session_id) if session_id and store else None
+    if not history or not history.total_turns:
+        if chat_history is None:
+            return clear_chat()
+        if store is None:
+            return chat_history, chat_history, chat_history.session_id, "⚠️ Conversations aren't saved - set SESSION_DB"
+        return chat_history, chat_history, chat_history.session_id, f"⚠️ No saved conversation {session_id!r}"
+    shown = f"the last {len(history)}" if history.offset else f"all {len(history)}"
+    return history, history, session_id, f"↩️ Resumed {history.total_turns} turns ({shown} shown)"
+
+# 📈 Metrics export: Prometheus text on METRICS_PORT, JSON in METRICS_FILE, a panel in the UI
+def collect_counters():
+    """Flatten the counters kept by each component into {name: number}"""
+    sources = {
+        "stream": get_stream_metrics(),
+        "cache": get_cache_stats(),
+        "router": get_router_metrics(),
+        "speech": speech_worker.get_stats() if speech_worker is not None else {},
+        "stream_synthesis": stream_speech_pool.get_stats() if stream_speech_pool is not None else {},
+        "speech_stream": get_speech_stream_metrics(),
+        "microphone": get_microphone_metrics(),
+        "audio": get_audio_pipeline_metrics(),
+        "voice": get_voice_turn_metrics(),
+        "speculation": get_speculation_metrics(),
+        "models": get_model_stats(),
+        "sessions": get_session_metrics(),
+        "api": get_api_metrics(),
+        "startup": get_startup_report(),
+    }
+    counters = {}
+
+    def flatten(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                flatten(f"{prefix}_{re.sub(r'[^0-9a-zA-Z]+', '_', str(key)).strip('_')}", item)
+        elif isinstance(value, (int, float)):
+            counters[prefix] = float(value)
+
+    for name, snapshot in sources.items():
+        flatten(name, snapshot)
+    return counters
+
+def get_metrics():
+    """Span histograms, recent turns and component counters as one JSON-ready dict"""
+    snapshot = tracer.snapshot()
+    snapshot["counters"] = collect_counters()
+    return snapshot
+
+def metrics_prometheus():
+    """Prometheus text exposition of the span histograms and component counters"""
+    lines = ["# HELP alpha_voice_bot_span_seconds Latency of each turn stage",
+             "# TYPE alpha_voice_bot_span_seconds histogram"]
+    for span, stats in sorted(tracer.snapshot()["spans"].items()):
+        for bound, count in stats["buckets"].items():
+            lines.append(f'alpha_voice_bot_span_seconds_bucket{{span="{span}",le="{bound}"}} {count}')
+        lines.append(f'alpha_voice_bot_span_seconds_bucket{{span="{span}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'alpha_voice_bot_span_seconds_sum{{span="{span}"}} {stats["sum"]}')
+        lines.append(f'alpha_voice_bot_span_seconds_count{{span="{span}"}} {stats["count"]}')
+    for name, value in sorted(collect_counters().items()):
+        lines.append(f"# TYPE alpha_voice_bot_{name} gauge")
+        lines.append(f"alpha_voice_bot_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def write_metrics_file(path):
+    """Write the JSON metrics atomically so readers never see a partial file"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(get_metrics(), f, indent=2, default=str)
+    os.replace(temp_path, path)
+
+def metrics_table():
+    """Markdown table of span latencies for the metrics panel"""
+    spans = tracer.snapshot()["spans"]
+    if not spans:
+        return "No turns recorded yet."
+    ms = lambda value: f"{value * 1000:.0f}" if value is not None else "-"
+    rows = ["| Stage | Count | Avg ms | p50 ms | p95 ms | p99 ms |", "|---|---:|---:|---:|---:|---:|"]
+    for span, stats in sorted(spans.items()):
+        rows.append(f"| {span} | {stats['count']} | {ms(stats['avg'])} | {ms(stats['p50'])} | "
+                    f"{ms(stats['p95'])} | {ms(stats['p99'])} |")
+    return "\n".join(rows)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text) and /metrics.json"""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = metrics_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(get_metrics(), default=str).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the console
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve the metrics endpoint from a daemon thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# 🩺 Startup report and background health checks
+startup_timings = {}
+health_status = {}
+
+def get_startup_report():
+    """Import time per module plus UI build and first-page times (seconds)"""
+    return {"imports": dict(import_times), **startup_timings}
+
+def wait_for_first_page(url, timeout=30.0):
+    """Poll the UI until it serves its page; returns seconds since the process started"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(url, timeout=2).ok:
+                return time.perf_counter() - PROCESS_STARTED
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+def print_startup_report():
+    """Print where cold start time went"""
+    report = get_startup_report()
+    imports = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in report["imports"].items())
+    print(f"⏱️ Startup: imports {imports}")
+    print(f"   UI built in {report.get('ui_build', 0) * 1000:.0f} ms", end="")
+    if report.get("first_page") is not None:
+        print(f", first page served {report['first_page']:.2f}s after start")
+    else:
+        print(", first page not served yet")
+
+def openrouter_key_url():
+    """OpenRouter's key-info endpoint beside the chat completions URL"""
+    return API_URL.rsplit("/chat/completions", 1)[0] + "/key"
+
+def check_openrouter():
+    """Reachability and key validity, via the key-info endpoint so no completion is billed"""
+    if not API_KEY or API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
+        return "⚠️ API key not configured - using demo mode"
+    try:
+        response = requests.get(openrouter_key_url(), headers={"Authorization": f"Bearer {API_KEY}"},
+                                timeout=(CONNECT_TIMEOUT, 10))
+    except requests.exceptions.RequestException as e:
+        return f"⚠️ OpenRouter unreachable ({e.__class__.__name__}) - will use demo mode"
+    if response.status_code == 401:
+        return "⚠️ API key rejected - will use demo mode"
+    if not response.ok:
+        return f"⚠️ Key check returned HTTP {response.status_code}"
+    return "✅ OpenRouter reachable, API key valid"
+
+def check_speech_recognition():
+    """Load the STT backend now instead of on the first voice turn"""
+    backend = get_stt_backend()
+    return f"✅ Ready ({backend.name}{', offline' if backend.offline else ''})"
+
+def check_text_to_speech():
+    """Import pyttsx3 and start the speech worker ahead of the first reply"""
+    pyttsx3.init  # Loads the module
+    get_speech_worker()
+    return "✅ Ready"
+
+HEALTH_CHECKS = {
+    "OpenRouter": check_openrouter,
+    "Speech recognition": check_speech_recognition,
+    "Text-to-speech": check_text_to_speech,
+}
+
+def run_health_checks():
+    """Run every health check concurrently, printing each result as it comes in"""
+    with ThreadPoolExecutor(max_workers=len(HEALTH_CHECKS), thread_name_prefix="health") as pool:
+        futures = {pool.submit(check): name for name, check in HEALTH_CHECKS.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                health_status[name] = future.result()
+            except Exception as e:
+                health_status[name] = f"⚠️ {e}"
+            print(f"   🩺 {name}: {health_status[name]}")
+
+# 📦 Batch mode: transcribe (and optionally answer) a directory or manifest of recordings without the UI
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 2)))        # Transcription processes
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))             # OpenRouter requests at once
+BATCH_OUTPUT = "batch_results.jsonl"
+BATCH_AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm"}
+
+def batch_files(source):
+    """Audio files of a directory (recursive, sorted) or a manifest (one path per line, or JSON lines with "path")"""
+    if os.path.isdir(source):
+        files = []
+        for root, _, names in os.walk(source):
+            files += [os.path.join(root, name) for name in names
+                      if os.path.splitext(name)[1].lower() in BATCH_AUDIO_EXTENSIONS]
+        return sorted(files)
+    # Manifest paths are relative to the manifest
+    base = os.path.dirname(os.path.abspath(source))
+    files = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            files.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return files
+
+def load_batch_done(output):
+    """Files a previous run's JSONL output already has a good result for (a line torn by a crash is ignored)"""
+    done = set()
+    if os.path.exists(output):
+        with open(output, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["error"] is None:
+                        done.add(record["file"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+    return done
+
+batch_pipeline = None  # One per worker process
+
+def transcribe_batch_file(path):
+    """Process-pool worker: run one file through the audio pipeline"""
+    global batch_pipeline
+    if batch_pipeline is None:
+        batch_pipeline = AudioPipeline(verbose=False)
+    result = batch_pipeline.process(path)
+    return {"file": path, "text": result.text, "error": result.error, "duration": result.duration,
+            "trimmed": result.trimmed, "timings": dict(result.timings)}
+
+def answer_batch_record(record, temperature=0.7, max_tokens=1024):
+    """Ask the AI about one transcript (a fresh conversation per file)
+
+    Unlike query_openrouter there is no demo fallback: a failed request is recorded as the file's
+    error, so the next run asks again instead of keeping an offline reply.
+    """
+    started = time.perf_counter()
+    headers, data = build_payload(build_messages(record["text"], ChatHistory()), temperature, max_tokens)
+    try:
+        record["reply"] = query_models(headers, data)
+    except Exception as e:
+        record["reply"] = None
+        record["error"] = f"AI request failed: {e}"
+    record["timings"]["llm"] = time.perf_counter() - started
+    return record
+
+def batch_report(records, elapsed, skipped=0):
+    """Throughput and per-stage timings of a batch run"""
+    stages = {}
+    for record in records:
+        for stage, seconds in record["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    for stage, samples in stages.items():
+        samples.sort()
+        stages[stage] = {"avg": sum(samples) / len(samples), "p50": samples[len(samples) // 2],
+                         "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))]}
+    errors = sum(record["error"] is not None for record in records)
+    audio = sum(record["duration"] for record in records)
+    return {"files": len(records), "ok": len(records) - errors, "errors": errors, "skipped": skipped,
+            "elapsed": elapsed, "files_per_second": len(records) / elapsed if elapsed else None,
+            "audio_seconds": audio, "stages": stages}
+
+def print_batch_report(report):
+    """Print the summary of a batch run"""
+    print(f"📦 Batch done: {report['files']} files in {report['elapsed']:.1f}s "
+          f"({report['files_per_second'] or 0:.2f} files/s, {report['audio_seconds']:.0f}s of audio), "
+          f"{report['ok']} ok, {report['errors']} errors, {report['skipped']} already done")
+    for stage, stats in report["stages"].items():
+        print(f"   {stage:<10} avg {stats['avg'] * 1000:8.0f} ms   p50 {stats['p50'] * 1000:8.0f} ms   "
+              f"p95 {stats['p95'] * 1000:8.0f} ms")
+
+def run_batch(source, output=BATCH_OUTPUT, llm=False, workers=BATCH_WORKERS, llm_concurrency=BATCH_LLM_CONCURRENCY,
+              temperature=0.7, max_tokens=1024):
+    """Transcribe every file of a directory or manifest in parallel, appending one JSON line per file
+
+    Files with a good result in `output` are skipped, so an interrupted run picks up where it stopped;
+    failed files are tried again and their new line supersedes the old one.
+    """
+    files = batch_files(source)
+    done = load_batch_done(output)
+    pending = [path for path in files if path not in done]
+    print(f"📦 Batch: {len(files)} files, {len(files) - len(pending)} already in {output}, "
+          f"{len(pending)} to process on {workers} workers" + (f", {llm_concurrency} AI requests at once" if llm else ""))
+    records = []
+    started = time.perf_counter()
+    with open(output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers) as transcribers, \
+            ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix="batch-llm") as answerers:
+        jobs = {transcribers.submit(transcribe_batch_file, path): path for path in pending}
+        running = set(jobs)
+        while running:
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {"file": jobs[future], "text": "", "error": f"Batch worker error: {e}",
+                              "duration": 0.0, "trimmed": 0.0, "timings": {}}
+                if llm and record["error"] is None and "reply" not in record:
+                    answer = answerers.submit(answer_batch_record, record, temperature, max_tokens)
+                    jobs[answer] = record["file"]
+                    running.add(answer)
+                    continue
+                # Written as soon as each file is done, so a crash loses at most the files in flight
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                records.append(record)
+                outcome = "✅" if record["error"] is None else "⚠️"
+                print(f"{outcome} [{len(records)}/{len(pending)}] {record['file']}"
+                      + (f" - {record['error']}" if record["error"] else ""))
+    report = batch_report(records, time.perf_counter() - started, skipped=len(files) - len(pending))
+    print_batch_report(report)
+    return report
+
+# 🌐 API server: the same turns without the Gradio UI, so many instances can sit behind a load balancer
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+API_MAX_AUDIO_BYTES = int(os.environ.get("API_MAX_AUDIO_BYTES", str(10 * 1024 * 1024)))   # Largest recording accepted
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))      # Server processes sharing SESSION_DB
+API_DEFAULTS = {"temperature": 0.7, "max_tokens": 1024, "voice_speed": 1.0, "speech": True}
+# Session turns without a store are refused rather than quietly started afresh every time
+API_SESSIONS_DISABLED = "Sessions are disabled - set SESSION_DB"
+
+# Turns per endpoint, WebSocket streams open right now and audio bytes in/out
+api_metrics = {"text_turns": 0, "audio_turns": 0, "stream_turns": 0, "errors": 0, "open_streams": 0,
+               "audio_bytes_in": 0, "speech_bytes_out": 0}
+
+def get_api_metrics():
+    """API turn counters"""
+    return dict(api_metrics)
+
+def api_bool(value):
+    """A yes/no option: JSON true/false, or 1/0, true/false, yes/no, on/off from a query string"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"):
+        return True
+    if text in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"expected true or false, got {value!r}")
+
+def api_settings(message, settings=None):
+    """Turn options of a request (JSON body, query string or stream message) over the defaults or current settings"""
+    settings = dict(settings or API_DEFAULTS)
+    for name, default in API_DEFAULTS.items():
+        if message.get(name) is not None:
+            # bool("false") is True, so yes/no options are parsed rather than cast
+            convert = api_bool if isinstance(default, bool) else type(default)
+            settings[name] = convert(message[name])
+    return settings
+
+def api_history(pairs):
+    """ChatHistory from a client's [[user, assistant], ...] list"""
+    return ChatHistory((str(user), str(assistant)) for user, assistant in pairs or [])
+
+async def api_reply(text, chat_history, settings, trace=None, speak=False):
+    """Run one turn through handle_input_async, yielding each new piece of the reply"""
+    reply = ""
+    async for chat, _ in handle_input_async(text, chat_history, settings["temperature"], settings["voice_speed"],
+                                            settings["max_tokens"], trace=trace, speak=speak):
+        delta = chat[-1][1][len(reply):]
+        reply = chat[-1][1]
+        if delta:
+            yield delta
+
+def create_api():
+    """FastAPI app with text, audio and streaming (WebSocket) turns on the same pipeline as the UI"""
+    from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    app = FastAPI(title="Alpha Voice Bot API")
+    llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+    audio_slots = asyncio.Semaphore(AUDIO_CONCURRENCY)
+
+    def error(status, message):
+        api_metrics["errors"] += 1
+        return JSONResponse({"error": message}, status_code=status)
+
+    async def send_error(websocket, message):
+        api_metrics["errors"] += 1
+        await websocket.send_json({"type": "error", "error": message})
+
+    async def transcribe(data, trace):
+        api_metrics["audio_bytes_in"] += len(data)
+        async with audio_slots:
+            return await asyncio.to_thread(audio_pipeline.process, io.BytesIO(data), trace=trace)
+
+    async def answer(text, chat_history, settings, trace=None):
+        async with llm_slots:
+            return "".join([delta async for delta in api_reply(text, chat_history, settings, trace)])
+
+    async def send_speech(websocket, chunks):
+        for chunk in chunks:
+            api_metrics["speech_bytes_out"] += len(chunk)
+            await websocket.send_bytes(chunk)
+
+    async def stream_turn(websocket, text, chat_history, settings, trace=None):
+        """Send the reply piece by piece as it streams, and its speech as each sentence is synthesized"""
+        api_metrics["stream_turns"] += 1
+        started = time.perf_counter()
+        stream = SpeechStream() if settings["speech"] else None
+        reply = ""
+        try:
+            with stream.active() if stream else nullcontext():
+                async with llm_slots:
+                    async for delta in api_reply(text, chat_history, settings, trace, speak=stream is not None):
+                        reply += delta
+                        await websocket.send_json({"type": "delta", "text": delta})
+                        if stream and not stream.clips.empty():
+                            # Encoding may run ffmpeg, so keep it off the event loop
+                            await send_speech(websocket, await asyncio.to_thread(stream.ready))
+                # The text is done; the rest of the speech follows as it is synthesized
+                while stream and (chunks := await asyncio.to_thread(stream.wait)) is not None:
+                    await send_speech(websocket, chunks)
+        finally:
+            if stream:
+                stream.close()
+            await asyncio.to_thread(chat_history.save)
+        await websocket.send_json({"type": "done", "reply": reply, "elapsed": time.perf_counter() - started})
+
+    @app.get("/healthz")
+    async def healthz():
+        """Liveness for load balancers"""
+        return {"status": "ok", "worker": os.getpid(), "open_streams": api_metrics["open_streams"]}
+
+    @app.get("/metrics")
+    async def metrics():
+        """Prometheus text, as served on METRICS_PORT"""
+        return PlainTextResponse(metrics_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/v1/turn")
+    async def text_turn(request: Request):
+        """Text turn: {"text", "history" or "session"?, "temperature"?, "max_tokens"?} -> {"reply", "history", "elapsed"}
+
+        With "session" the conversation is read from and saved to the session store instead of sent along.
+        """
+        try:
+            body = await request.json()
+            text = str(body.get("text") or "").strip()
+            settings = api_settings(body)
+            session_id = body.get("session")
+            if session_id and get_session_store() is None:
+                return error(409, API_SESSIONS_DISABLED)
+            if session_id:
+                chat_history = await asyncio.to_thread(ChatHistory.resume, str(session_id))
+            else:
+                chat_history = api_history(body.get("history"))
+        except (ValueError, TypeError, AttributeError) as e:
+            return error(400, f"Bad request: {e}")
+        if not text:
+            return error(400, "No text given")
+        api_metrics["text_turns"] += 1
+        started = time.perf_counter()
+        reply = await answer(text, chat_history, settings)
+        if session_id:
+            await asyncio.to_thread(chat_history.save)
+            return {"reply": reply, "session": chat_history.session_id, "turns": chat_history.total_turns,
+                    "elapsed": time.perf_counter() - started}
+        return {"reply": reply, "history": chat_history, "elapsed": time.perf_counter() - started}
+
+    @app.post("/v1/audio")
+    async def audio_turn(request: Request):
+        """Audio turn: the body is the recording (WAV, or anything ffmpeg reads); ?reply=0 (or false) only transcribes"""
+        try:
+            declared = int(request.headers.get("content-length") or 0)
+            settings = api_settings(request.query_params)
+            reply = api_bool(request.query_params.get("reply", "1"))
+        except ValueError as e:
+            return error(400, f"Bad request: {e}")
+        if declared > API_MAX_AUDIO_BYTES:
+            return error(413, f"Audio over {API_MAX_AUDIO_BYTES} bytes")
+        # Content-Length is only the client's word (and absent when chunked): count what actually arrives
+        data = bytearray()
+        async for chunk in request.stream():
+            data += chunk
+            if len(data) > API_MAX_AUDIO_BYTES:
+                return error(413, f"Audio over {API_MAX_AUDIO_BYTES} bytes")
+        data = bytes(data)
+        if not data:
+            return error(400, "No audio given")
+        api_metrics["audio_turns"] += 1
+        started = time.perf_counter()
+        trace = tracer.start_turn("audio")
+        try:
+            result = await transcribe(data, trace)
+            if not result.ok:
+                return error(422, result.error)
+            response = {"transcript": result.text, "timings": dict(result.timings)}
+            if reply:
+                response["reply"] = await answer(result.text, ChatHistory(), settings, trace)
+        finally:
+            trace.finish()
+        response["elapsed"] = time.perf_counter() - started
+        return response
+
+    @app.websocket("/v1/stream")
+    async def stream(websocket: WebSocket):
+        """A conversation: JSON messages both ways, recordings in and speech out as binary frames
+
+        In:  {"type": "text", "text"}, binary frames of a recording then {"type": "audio_end"}, {"type": "reset"},
+             {"type": "resume", "session"}; any message may also set temperature, max_tokens, voice_speed or
+             speech (true/false), and {"type": "config"} only does that.
+        Out: {"type": "ready", "codec", "session"} on connect and reset, {"type": "resumed", "session", "turns",
+             "history"},
+             then per turn {"type": "transcript"} for recordings,
+             {"type": "delta"} per piece of the reply, binary speech chunks (each a standalone file in the
+             "ready" codec) and {"type": "done", "reply", "elapsed"}, or {"type": "error"}.
+        """
+        await websocket.accept()
+        api_metrics["open_streams"] += 1
+        settings, audio = dict(API_DEFAULTS), bytearray()
+        chat_history = ChatHistory(session_id=new_session_id())
+        try:
+            await websocket.send_json({"type": "ready", "codec": speech_encoder.codec,
+                                       "session": chat_history.session_id})
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    audio += message["bytes"]
+                    if len(audio) > API_MAX_AUDIO_BYTES:
+                        audio.clear()
+                        await send_error(websocket, f"Audio over {API_MAX_AUDIO_BYTES} bytes")
+                    continue
+                try:
+                    request = json.loads(message.get("text") or "{}")
+                    settings = api_settings(request, settings)
+                except (ValueError, TypeError, AttributeError) as e:
+                    await send_error(websocket, f"Bad message: {e}")
+                    continue
+
+                kind = request.get("type")
+                if kind == "text":
+                    text = str(request.get("text") or "").strip()
+                    if text:
+                        await stream_turn(websocket, text, chat_history, settings)
+                    else:
+                        await send_error(websocket, "No text given")
+                elif kind == "audio_end":
+                    data = bytes(audio)
+                    audio.clear()
+                    if not data:
+                        await send_error(websocket, "No audio given")
+                        continue
+                    trace = tracer.start_turn("audio")
+                    try:
+                        result = await transcribe(data, trace)
+                        if result.ok:
+                            await websocket.send_json({"type": "transcript", "text": result.text})
+                            await stream_turn(websocket, result.text, chat_history, settings, trace)
+                        else:
+                            await send_error(websocket, result.error)
+                    finally:
+                        trace.finish()
+                elif kind == "reset":
+                    chat_history, audio = ChatHistory(session_id=new_session_id()), bytearray()
+                    await websocket.send_json({"type": "ready", "codec": speech_encoder.codec,
+                                               "session": chat_history.session_id})
+                elif kind == "resume" and get_session_store() is None:
+                    await send_error(websocket, API_SESSIONS_DISABLED)
+                elif kind == "resume":
+                    chat_history = await asyncio.to_thread(ChatHistory.resume, str(request.get("session") or ""))
+                    await websocket.send_json({"type": "resumed", "session": chat_history.session_id,
+                                               "turns": chat_history.total_turns, "history": chat_history})
+                elif kind != "config":
+                    await send_error(websocket, f"Unknown message type {kind!r}")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            api_metrics["open_streams"] -= 1
+
+    return app
+
+def run_api(host=API_HOST, port=API_PORT, workers=API_WORKERS):
+    """Serve the API with uvicorn (blocks), in `workers` processes that share sessions and caches"""
+    import uvicorn
+    print(f"🌐 API at http://{host}:{port} (POST /v1/turn, POST /v1/audio, WebSocket /v1/stream, GET /healthz)")
+    if workers <= 1:
+        uvicorn.run(create_api(), host=host, port=port, log_level="warning")
+        return
+    # Every request may land on any worker, so conversations must live in SESSION_DB
+    if not SESSION_DB:
+        print("⚠️ SESSION_DB is empty: each worker keeps its own conversations, clients must send their history")
+    elif not SHARED_CACHE:
+        print("💡 Each worker keeps its own reply and speech caches (SHARED_CACHE=1 shares them through SESSION_DB)")
+    print(f"👷 {workers} workers sharing {SESSION_DB or 'nothing'}")
+    uvicorn.run("voice_bot:create_api", factory=True, host=host, port=port, workers=workers, log_level="warning")
 
 # 🎨 Enhanced Web App UI
 def create_interface():
@@ -493,7 +3954,7 @@ def create_interface():
                         avatar_images=("🧑‍💻", "🤖")
                     )
                 
-                chat_state = gr.State([])
+                chat_state = gr.State(ChatHistory())
                 
                 # Larger text input area
                 text_input = gr.Textbox(
@@ -531,7 +3992,9 @@ def create_interface():
                             stop_rec_btn = gr.Button("⏹️ Stop Recording", scale=1, variant="stop", size="sm", visible=False)
                         
                         # Legacy mic button (for quick recording)
-                        mic_btn = gr.Button("⚡ Quick Voice", scale=1, variant="secondary", size="sm")
+                        with gr.Row():
+                            mic_btn = gr.Button("⚡ Quick Voice", scale=1, variant="secondary", size="sm")
+                            live_btn = gr.Button("🎙️ Live Voice", scale=1, variant="secondary", size="sm")
             
             with gr.Column(scale=1):
                 gr.Markdown("### ⚙️ Control Panel")
@@ -572,26 +4035,59 @@ def create_interface():
                     help_btn = gr.Button("❓ Get Help", size="sm")
                     info_btn = gr.Button("ℹ️ Bot Info", size="sm")
                 
+                # Replies are spoken here when SPEECH_OUTPUT=browser
+                speech_output = gr.Audio(
+                    label="🔊 Reply Speech",
+                    streaming=True,
+                    autoplay=True,
+                    interactive=False,
+                    visible=SPEECH_OUTPUT == "browser"
+                )
+                
+                with gr.Accordion("💾 Session", open=False):
+                    session_box = gr.Textbox(
+                        label="Session ID",
+                        info="Keep it to pick this conversation up later, also after a restart (or open the page with ?session=ID)"
+                    )
+                    resume_btn = gr.Button("↩️ Resume", size="sm")
+                    session_status = gr.Markdown("")
+                
+                with gr.Accordion("📈 Latency Metrics", open=False):
+                    metrics_view = gr.Markdown(metrics_table())
+                    refresh_metrics_btn = gr.Button("🔄 Refresh", size="sm")
 
 
         # Event handlers
+        # Text turns are async and share the LLM concurrency limit; microphone
+        # captures and audio uploads get limits of their own
+        llm_limits = dict(concurrency_limit=LLM_CONCURRENCY, concurrency_id="llm")
+        mic_limits = dict(concurrency_limit=MAX_CAPTURE_WORKERS, concurrency_id="mic")
+
+        def speaking(fn, outputs):
+            """Handler and outputs of a turn: saves its turns, and streams its speech when SPEECH_OUTPUT=browser"""
+            fn = saving_turns(fn)
+            if SPEECH_OUTPUT != "browser":
+                return dict(fn=fn, outputs=outputs)
+            return dict(fn=stream_speech(fn), outputs=outputs + [speech_output])
+
         text_input.submit(
-            fn=handle_input,
+            **speaking(handle_input_async, [chatbot, text_input]),
             inputs=[text_input, chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **llm_limits
         )
         
         send_btn.click(
-            fn=handle_input,
+            **speaking(handle_input_async, [chatbot, text_input]),
             inputs=[text_input, chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **llm_limits
         )
         
         # Audio processing
         audio_input.change(
-            fn=handle_audio,
+            **speaking(handle_audio_async, [chatbot, text_input]),
             inputs=[audio_input, chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            concurrency_limit=AUDIO_CONCURRENCY,
+            concurrency_id="audio"
         )
         
         # Microphone and recording functionality
@@ -602,82 +4098,100 @@ def create_interface():
         )
         
         stop_rec_btn.click(
-            fn=stop_recording_and_process,
+            **speaking(stop_recording_and_process, [chatbot, text_input, recording_status, start_rec_btn, stop_rec_btn]),
             inputs=[chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input, recording_status, start_rec_btn, stop_rec_btn]
+            **mic_limits
         )
         
         # Quick voice button (original functionality)
         mic_btn.click(
-            fn=handle_microphone,
+            **speaking(handle_microphone, [chatbot, text_input]),
+            inputs=[chat_state, temperature, voice_speed, max_tokens],
+            **mic_limits
+        )
+        
+        # Live voice with partial transcripts in the text box
+        live_btn.click(
+            **speaking(handle_live_voice, [chatbot, text_input]),
             inputs=[chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **mic_limits
         )
         
         # Quick action buttons
         hello_btn.click(
-            fn=quick_response,
+            **speaking(quick_response, [chatbot, text_input]),
             inputs=[gr.State("Hello! How are you today?"), chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **llm_limits
         )
         
         joke_btn.click(
-            fn=quick_response,
+            **speaking(quick_response, [chatbot, text_input]),
             inputs=[gr.State("Tell me a funny joke please!"), chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **llm_limits
         )
         
         help_btn.click(
-            fn=quick_response,
+            **speaking(quick_response, [chatbot, text_input]),
             inputs=[gr.State("What can you help me with? Show me your capabilities."), chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **llm_limits
         )
         
         info_btn.click(
-            fn=quick_response,
+            **speaking(quick_response, [chatbot, text_input]),
             inputs=[gr.State("Tell me about yourself and your features."), chat_state, temperature, voice_speed, max_tokens],
-            outputs=[chatbot, text_input]
+            **llm_limits
+        )
+        
+        refresh_metrics_btn.click(
+            fn=metrics_table,
+            outputs=[metrics_view]
         )
         
+        session_outputs = [chatbot, chat_state, session_box, session_status]
         clear_btn.click(
             fn=clear_chat,
-            outputs=[chatbot]
-        ).then(
-            fn=lambda: [],
-            outputs=[chat_state]
+            outputs=session_outputs
+        )
+        
+        resume_btn.click(
+            fn=resume_session,
+            inputs=[session_box, chat_state],
+            outputs=session_outputs
+        )
+        
+        # Each browser gets its own session id (or resumes the one in the URL)
+        demo.load(
+            fn=start_session,
+            outputs=session_outputs
         )
 
+    demo.queue(max_size=QUEUE_MAX_SIZE)
     return demo
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alpha Voice Assistant")
+    parser.add_argument("--batch", metavar="PATH", help="transcribe a directory or manifest of audio files, no UI")
+    parser.add_argument("--output", default=BATCH_OUTPUT, help="JSONL results file (appended to, and resumed from)")
+    parser.add_argument("--llm", action="store_true", help="also ask the AI about each transcript")
+    parser.add_argument("--workers", type=int, help=f"batch transcription processes (default {BATCH_WORKERS}) "
+                                                    f"or API server processes (default {API_WORKERS})")
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY, help="AI requests at once")
+    parser.add_argument("--api", action="store_true", help="serve the HTTP/WebSocket API instead of the UI")
+    parser.add_argument("--host", default=API_HOST, help="API address")
+    parser.add_argument("--port", type=int, default=API_PORT, help="API port")
+    args = parser.parse_args()
+    if args.batch:
+        run_batch(args.batch, args.output, llm=args.llm, workers=args.workers or BATCH_WORKERS,
+                  llm_concurrency=args.llm_concurrency)
+        raise SystemExit(0)
+    if args.api:
+        run_api(args.host, args.port, workers=args.workers or API_WORKERS)
+        raise SystemExit(0)
+
     print("🚀 Starting Alpha Voice Bot...")
-    print("🔧 System Check:")
-    print("   1. ✅ Python packages loaded")
-    print("   2. ✅ Speech recognition ready")
-    print("   3. ✅ Text-to-speech ready")
-    
-    # Test internet connection
-    try:
-        response = requests.get("https://httpbin.org/status/200", timeout=5)
-        print("   4. ✅ Internet connection working")
-    except:
-        print("   4. ⚠️ Internet connection issues detected")
-    
-    # Test OpenRouter API key
-    if API_KEY and API_KEY != "YOUR_OPENROUTER_API_KEY_HERE":
-        print("   5. 🔍 Testing API key...")
-        try:
-            # Test API with a simple request
-            test_messages = [{"role": "user", "content": "test"}]
-            test_response = query_openrouter(test_messages, temperature=0.7, max_tokens=50)
-            if "API" not in test_response and "error" not in test_response.lower():
-                print("   5. ✅ API key working correctly")
-            else:
-                print("   5. ⚠️ API key test failed - will use demo mode")
-        except Exception as e:
-            print(f"   5. ⚠️ API key validation error: {e} - will use demo mode")
-    else:
-        print("   5. ⚠️ API key not configured - using demo mode")
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        print(f"📈 Metrics at http://127.0.0.1:{METRICS_PORT}/metrics (and /metrics.json)")
     
     print("\n📋 Instructions:")
     print("   • Allow microphone access when prompted")
@@ -685,7 +4199,9 @@ if __name__ == "__main__":
     print("   • Use Quick Voice for short voice input")
     print("   • Bot will fallback to offline mode if connection fails")
     
+    started = time.perf_counter()
     demo = create_interface()
+    startup_timings["ui_build"] = time.perf_counter() - started
     demo.launch(
         share=False,  # Disable share to avoid HuggingFace warnings
         inbrowser=True,  # Open browser automatically
@@ -693,5 +4209,13 @@ if __name__ == "__main__":
         server_name="127.0.0.1",  # Local access only
         server_port=7861,  # Use different port to avoid conflicts
         quiet=False,  # Show URL and output
-        favicon_path=None  # Disable favicon to reduce 404 errors
+        favicon_path=None,  # Disable favicon to reduce 404 errors
+        prevent_thread_lock=True  # Return once listening so startup can be measured
     )
+    startup_timings["first_page"] = wait_for_first_page(demo.local_url)
+    print_startup_report()
+    
+    # Checks run while the UI is already usable
+    print("🔧 System Check (in background):")
+    threading.Thread(target=run_health_checks, daemon=True).start()
+    demo.block_thread()